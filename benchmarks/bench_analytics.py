@@ -0,0 +1,90 @@
+"""Per-user analytics: the old report() loops against the analytics service.
+
+For each size, seeds one user with that many expenses (plus a second user
+so the queries have something to filter out) and times:
+
+  python loops   - the old report(): load every Expense, loop over them
+  grouped SQL    - expense_groups(): one GROUP BY, no ORM objects
+  summary table  - analytics.for_user(): the maintained summary rows + LIMIT 5
+
+    python -m benchmarks.bench_analytics --sizes 10000 100000 1000000
+"""
+import argparse
+import os
+import tempfile
+from datetime import datetime
+
+from sqlalchemy import func
+
+from project import db
+from project import analytics
+from project.models import Expense
+from project.summary import rebuild
+
+from benchmarks.common import make_app, seed, timed
+
+
+def python_loops(user_id):
+    # report() before the analytics service, kept here for comparison
+    expenses = Expense.query.filter_by(user_id=user_id).all()
+    total_spent = sum(exp.amount for exp in expenses)
+    monthly_count = len([exp for exp in expenses if exp.date.month == datetime.now().month])
+    category_count = len(set(exp.category for exp in expenses if exp.category))
+    monthly_data = {}
+    for exp in expenses:
+        month = exp.date.strftime('%Y-%m')
+        monthly_data[month] = monthly_data.get(month, 0) + exp.amount
+    category_data = {}
+    for exp in expenses:
+        if exp.category:
+            category_data[exp.category] = category_data.get(exp.category, 0) + exp.amount
+    top = sorted([(exp.name, exp.amount) for exp in expenses], key=lambda x: x[1], reverse=True)[:5]
+    return total_spent, len(expenses), monthly_count, category_count, monthly_data, category_data, top
+
+
+def expense_groups(user_id):
+    # The summary rows computed straight from the expense table in one GROUP BY
+    year = func.extract('year', Expense.date)
+    month = func.extract('month', Expense.date)
+    category = func.coalesce(Expense.category, '')
+    rows = (db.session.query(year, month, category, func.sum(Expense.amount), func.count(Expense.id))
+            .filter(Expense.user_id == user_id).group_by(year, month, category))
+    return [analytics.Group(int(y), int(m), cat, total, count) for y, m, cat, total, count in rows]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--skip-loops-above', type=int, default=1_000_000,
+                        help="Don't time the old loops above this many rows (they get slow).")
+    args = parser.parse_args()
+
+    print(f"{'expenses':>10} {'python loops':>14} {'grouped SQL':>13} {'summary table':>15}")
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = os.path.join(tmp, 'bench.db')
+            app = make_app(db_path)
+            seed(db_path, 2, size)
+            with app.app_context():
+                rebuild()
+                db.session.remove()
+
+                loops = '-'
+                if size <= args.skip_loops_above:
+                    ms, _ = timed(lambda: python_loops(1), args.repeat)
+                    loops = f"{ms:.1f} ms"
+                    db.session.remove()
+
+                grouped_ms, grouped = timed(
+                    lambda: analytics.build(expense_groups(1), analytics.top_expenses(1)),
+                    args.repeat)
+                summary_ms, result = timed(lambda: analytics.for_user(1), args.repeat)
+                assert (grouped.expense_count, round(grouped.total_spent, 2)) == \
+                    (result.expense_count, round(result.total_spent, 2)), "summary table disagrees"
+                print(f"{size:>10} {loops:>14} {grouped_ms:>10.1f} ms {summary_ms:>12.2f} ms")
+                db.session.remove()
+
+
+if __name__ == '__main__':
+    main()
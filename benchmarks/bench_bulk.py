@@ -0,0 +1,114 @@
+"""Bulk import/export throughput and memory, against one add_expense per row.
+
+Writes a CSV of N expenses, imports it with bulk.import_expenses (batched
+inserts) and exports it back with bulk.export_expenses, reporting rows/sec
+and the tracemalloc peak for each. For comparison a small sample goes in
+the old way: one ORM add + summary update + commit per row.
+
+    python -m benchmarks.bench_bulk --rows 10000 100000 --per-row-sample 2000
+"""
+import argparse
+import csv
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from datetime import date, timedelta
+
+from project import db, summary
+from project.bulk import import_expenses, export_expenses, export_query
+from project.models import User, Expense
+
+from benchmarks.common import make_app, CATEGORIES, MERCHANTS
+
+
+def write_csv(path, rows, seed_value=42):
+    rng = random.Random(seed_value)
+    start = date.today() - timedelta(days=3 * 365)
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(('date', 'name', 'amount', 'category', 'text'))
+        for _ in range(rows):
+            writer.writerow(((start + timedelta(days=rng.randrange(3 * 365))).isoformat(),
+                             rng.choice(MERCHANTS), round(rng.lognormvariate(3.5, 1.0), 2),
+                             rng.choice(CATEGORIES) or '', ''))
+
+
+def measure(func, trace):
+    if trace:
+        tracemalloc.start()
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    peak = 0
+    if trace:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return elapsed, peak, result
+
+
+def per_row(user_id, path, limit):
+    # What add_expense does for each row
+    with open(path, newline='') as f:
+        for i, record in enumerate(csv.DictReader(f)):
+            if i == limit:
+                break
+            expense = Expense(name=record['name'], amount=float(record['amount']),
+                              category=record['category'] or None, user_id=user_id,
+                              date=date.fromisoformat(record['date']))
+            db.session.add(expense)
+            summary.expense_added(expense)
+            db.session.commit()
+
+
+def drain(chunks):
+    size = 0
+    for chunk in chunks:
+        size += len(chunk)
+    return size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[10_000, 100_000])
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--per-row-sample', type=int, default=2000)
+    parser.add_argument('--memory', action='store_true',
+                        help='Also report the tracemalloc peak (slows everything down).')
+    args = parser.parse_args()
+
+    for rows in args.rows:
+        with tempfile.TemporaryDirectory() as tmp:
+            csv_path = os.path.join(tmp, 'expenses.csv')
+            write_csv(csv_path, rows)
+            app = make_app(os.path.join(tmp, 'bench.db'))
+            with app.app_context():
+                for uid in (1, 2):
+                    db.session.add(User(id=uid, first_name='Bench', email=f'u{uid}@bench.test', password='x'))
+                db.session.commit()
+
+                with open(csv_path, 'rb') as stream:
+                    seconds, peak, result = measure(
+                        lambda: import_expenses(1, stream, 'csv', args.batch_size), args.memory)
+                assert result['imported'] == rows, result
+                line = f"{rows:>8} rows  import {rows / seconds:>9,.0f} rows/s"
+                if args.memory:
+                    line += f" (peak {peak / 2**20:.1f} MB)"
+
+                seconds, peak, size = measure(lambda: drain(export_expenses(export_query(1), 'csv')), args.memory)
+                line += f"  export {rows / seconds:>9,.0f} rows/s"
+                if args.memory:
+                    line += f" (peak {peak / 2**20:.1f} MB)"
+                print(line)
+                db.session.remove()
+
+                if args.per_row_sample:
+                    sample = min(rows, args.per_row_sample)
+                    seconds, _, _ = measure(lambda: per_row(2, csv_path, sample), False)
+                    print(f"{'':>8}       one commit per row {sample / seconds:>9,.0f} rows/s ({sample} rows)")
+                db.session.remove()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+"""Concurrent writers against SQLite: default settings vs database.py tuning.
+
+Starts several processes (like several server workers), each running a
+few threads that drive the real routes through the Flask test client:
+add an expense, edit one (read then write) and load the dashboard. Counts
+commits/sec and how many requests failed, and how many of those failures
+were "database is locked".
+
+    python -m benchmarks.bench_db_writers --processes 4 --threads 4 --seconds 10
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import tempfile
+import threading
+import time
+
+from project import database
+
+from benchmarks.common import make_app
+
+SCENARIOS = ('default', 'tuned')
+
+
+def worker(db_path, threads, seconds, ready, results):
+    app = make_app(db_path)
+
+    counts = dict(writes=0, reads=0, errors=0, locked=0)
+    lock = threading.Lock()
+    clients = []
+    for _ in range(threads):
+        client = app.test_client()
+        client.post('/login', data=dict(username='bench@bench.test', password='bench'))
+        clients.append(client)
+    # Everyone starts (and stops) at the same time once logged in
+    ready.wait()
+    deadline = time.monotonic() + seconds
+
+    def run(client):
+        rng = random.Random()
+        while time.monotonic() < deadline:
+            roll = rng.random()
+            if roll < 0.5:
+                response = client.post('/add_expense', data=dict(
+                    name='Load test', amount=f'{rng.uniform(1, 500):.2f}', category='Other'))
+                kind = 'writes'
+            elif roll < 0.8:
+                response = client.post(f'/edit_expense/{rng.randint(1, 50)}', data=dict(
+                    name='Edited', amount=f'{rng.uniform(1, 500):.2f}', category='Bills'))
+                kind = 'writes'
+            else:
+                response = client.get('/get_dashboard_stats')
+                kind = 'reads'
+            with lock:
+                if response.status_code < 400:
+                    counts[kind] += 1
+                else:
+                    # add_expense reports the database error; edit only says it failed
+                    counts['errors'] += 1
+                    counts['locked'] += b'locked' in response.data
+
+    pool = [threading.Thread(target=run, args=(client,)) for client in clients]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    results.put(counts)
+
+
+def run_scenario(scenario, args):
+    tune_sqlite = database.tune_sqlite
+    if scenario == 'default':
+        # What the app did before database.py: the sqlite3 module's own
+        # transactions, rollback journal, synchronous=FULL, its 5s timeout.
+        # The forked workers inherit this.
+        database.tune_sqlite = lambda *args, **kwargs: None
+    try:
+        measure(scenario, args)
+    finally:
+        database.tune_sqlite = tune_sqlite
+
+
+def measure(scenario, args):
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        app = make_app(db_path)
+        client = app.test_client()
+        client.post('/register', data=dict(firstName='Bench', lastName='', email='bench@bench.test',
+                                           password='bench'))
+        client.post('/login', data=dict(username='bench@bench.test', password='bench'))
+        for i in range(50):
+            client.post('/add_expense', data=dict(name=f'Seed {i}', amount='10', category='Other'))
+
+        ctx = multiprocessing.get_context('fork')
+        results = ctx.Queue()
+        ready = ctx.Barrier(args.processes + 1)
+        procs = [ctx.Process(target=worker, args=(db_path, args.threads, args.seconds, ready, results))
+                 for _ in range(args.processes)]
+        for proc in procs:
+            proc.start()
+        ready.wait()
+        totals = dict(writes=0, reads=0, errors=0, locked=0)
+        for _ in procs:
+            for key, value in results.get().items():
+                totals[key] += value
+        for proc in procs:
+            proc.join()
+        elapsed = args.seconds
+
+    attempts = totals['writes'] + totals['reads'] + totals['errors']
+    print(f"{scenario:<8} {totals['writes'] / elapsed:>9.0f} commits/s {totals['reads'] / elapsed:>8.0f} reads/s "
+          f"  errors {totals['errors']:>5} ({totals['errors'] / max(attempts, 1):.1%})"
+          f"  of which 'database is locked' {totals['locked']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--scenario', choices=SCENARIOS, nargs='+', default=list(SCENARIOS))
+    args = parser.parse_args()
+
+    print(f"{args.processes} processes x {args.threads} threads, {args.seconds:.0f}s each")
+    for scenario in args.scenario:
+        run_scenario(scenario, args)
+
+
+if __name__ == '__main__':
+    main()
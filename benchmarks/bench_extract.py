@@ -0,0 +1,72 @@
+"""Receipts/sec of the field extractor against the old regex-scan guesser.
+
+Runs both over the OCR text fixtures in benchmarks/fixtures/ocr_text,
+repeated to make a corpus of --corpus receipts, after listing the total
+each finds in every fixture.
+
+    python -m benchmarks.bench_extract --corpus 20000
+"""
+import argparse
+import glob
+import os
+import re
+import time
+
+from project.extract import extract_fields
+
+FIXTURES = os.path.join(os.path.dirname(__file__), 'fixtures', 'ocr_text')
+
+# The guesser upload_receipt used before extract.py
+MONEY_REGEX = r'[\$₹€]?\s*(\d+([.,]\d{2})?)'
+
+
+def legacy_guess(text_data):
+    lines = text_data.splitlines()
+    expense_name = "Scanned Receipt"
+    for line in lines:
+        if line.strip():
+            expense_name = line.strip()
+            break
+    amount = 0.0
+    for line in reversed(lines):
+        line_lower = line.lower()
+        if 'total' in line_lower or 'amount' in line_lower:
+            matches = re.findall(MONEY_REGEX, line)
+            if matches:
+                amount = max(float(m[0].replace(',', '.')) for m in matches)
+                break
+    if amount == 0.0:
+        all_matches = re.findall(MONEY_REGEX, text_data)
+        if all_matches:
+            amount = max(float(m[0].replace(',', '.')) for m in all_matches)
+    return expense_name, amount
+
+
+def throughput(func, corpus):
+    start = time.perf_counter()
+    for text in corpus:
+        func(text)
+    return len(corpus) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--corpus', type=int, default=20000)
+    args = parser.parse_args()
+
+    texts = []
+    print(f"{'fixture':<20}{'legacy':>12}{'extract_fields':>16}")
+    for path in sorted(glob.glob(os.path.join(FIXTURES, '*.txt'))):
+        with open(path, encoding='utf-8') as f:
+            texts.append(f.read())
+        print(f"{os.path.basename(path)[:-4]:<20}{legacy_guess(texts[-1])[1]:>12.2f}"
+              f"{extract_fields(texts[-1])['total'] or 0.0:>16.2f}")
+    corpus = [texts[i % len(texts)] for i in range(args.corpus)]
+
+    print(f"{len(corpus)} receipts from {len(texts)} fixtures")
+    for name, func in (('legacy', legacy_guess), ('extract_fields', extract_fields)):
+        print(f"{name:<15} {throughput(func, corpus):>10.0f} receipts/sec")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""Bytes and render time of the images.py copies against the original.
+
+Makes a phone-sized photo (noise over a gradient, so it compresses like a
+real one), renders every size/format the app serves and reports the bytes
+a page would download for each, plus how long rendering took from the
+full-size photo and from one shrunk as profile uploads are.
+
+    python -m benchmarks.bench_images --width 4032 --height 3024
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+from project.images import render, shrink, FORMATS
+
+SIZES = [96, 256, 768]
+
+
+def photo(path, width, height, seed_value=42):
+    rng = np.random.default_rng(seed_value)
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    base = np.stack([x + 0 * y, y + 0 * x, (x + y) / 2], axis=-1)
+    noisy = np.clip(base + rng.normal(0, 12, base.shape), 0, 255).astype(np.uint8)
+    Image.fromarray(noisy).save(path, 'JPEG', quality=92)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--width', type=int, default=4032)
+    parser.add_argument('--height', type=int, default=3024)
+    parser.add_argument('--max-size', type=int, default=1024)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = os.path.join(tmp, 'photo.jpg')
+        photo(source, args.width, args.height)
+        original = os.path.getsize(source)
+        print(f"original {args.width}x{args.height}: {original / 1024:,.0f} KB")
+
+        # Copies straight from the full-size original (decoded with draft())
+        start = time.perf_counter()
+        render(source, os.path.join(tmp, 'copies'), SIZES)
+        print(f"render, original kept:  {(time.perf_counter() - start) * 1000:,.0f} ms")
+
+        shrunk = os.path.join(tmp, 'shrunk.jpg')
+        start = time.perf_counter()
+        with Image.open(source) as image, open(shrunk, 'wb') as out:
+            out.write(shrink(image, args.max_size))
+        render(shrunk, os.path.join(tmp, 'copies2'), SIZES)
+        print(f"shrink to {args.max_size}px + render: {(time.perf_counter() - start) * 1000:,.0f} ms, "
+              f"stored {os.path.getsize(shrunk) / 1024:,.0f} KB")
+
+        for size in SIZES:
+            line = f"{size:>5}px"
+            for ext in FORMATS:
+                nbytes = os.path.getsize(os.path.join(tmp, 'copies', f'{size}.{ext}'))
+                line += f"  {ext} {nbytes / 1024:>7,.1f} KB ({original / nbytes:>5,.0f}x smaller)"
+            print(line)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""Expense query plans and latencies without and with the composite indexes.
+
+Seeds a SQLite database (1M expenses by default), drops the (user_id, ...)
+indexes, times the app's per-user queries, then applies migration 2 and
+times them again.
+
+    python -m benchmarks.bench_indexes --users 100 --rows 1000000
+"""
+import argparse
+import os
+import tempfile
+from datetime import date
+
+from sqlalchemy import func, text
+
+from project import db
+from project.migrations import add_expense_indexes
+from project.models import Expense
+
+from benchmarks.common import make_app, seed, timed
+
+
+def queries(user_id, today):
+    user_expenses = Expense.query.filter_by(user_id=user_id)
+    return {
+        'total SUM': db.session.query(func.sum(Expense.amount)).filter_by(user_id=user_id),
+        'month SUM': db.session.query(func.sum(Expense.amount)).filter_by(user_id=user_id).filter(
+            func.extract('month', Expense.date) == today.month,
+            func.extract('year', Expense.date) == today.year),
+        'DISTINCT category': user_expenses.with_entities(Expense.category).distinct(),
+        'COUNT': user_expenses.with_entities(func.count(Expense.id)),
+        'top 5 by amount': user_expenses.order_by(Expense.amount.desc()).limit(5),
+        'latest 50': user_expenses.order_by(Expense.date.desc(), Expense.id.desc()).limit(50),
+    }
+
+
+def run(label, user_id, today, repeat):
+    print(f"\n== {label} ==")
+    for name, query in queries(user_id, today).items():
+        sql = str(query.statement.compile(db.engine, compile_kwargs={'literal_binds': True}))
+        plan = db.session.execute(text('EXPLAIN QUERY PLAN ' + sql)).fetchall()
+        ms, _ = timed(lambda: query.all(), repeat)
+        print(f"{name:<22} {ms:>9.2f} ms   " + ' | '.join(row[-1] for row in plan))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        app = make_app(db_path)
+        with app.app_context():
+            for index in Expense.__table__.indexes:
+                index.drop(db.engine)
+        seed(db_path, args.users, args.rows // args.users)
+        print(f"Seeded {args.rows} expenses for {args.users} users")
+
+        today = date.today()
+        with app.app_context():
+            db.session.execute(text('ANALYZE'))
+            run('without indexes', 1, today, args.repeat)
+
+            # End the session's read transaction so it sees the new schema
+            db.session.remove()
+            with db.engine.begin() as conn:
+                add_expense_indexes(conn)
+                conn.execute(text('ANALYZE'))
+            run('with (user_id, date/category/amount) indexes', 1, today, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""Page latency during a login burst: bcrypt inline vs the passwords.py pool.
+
+Some threads log in (and out) as fast as they can, each login a full
+bcrypt check, while others load the dashboard stats. With hashing on the
+request threads every login competes for the CPU at once; with the pool
+at most PASSWORD_HASH_WORKERS hash together and the rest wait (or get a
+503). Reports dashboard p50/p95 and login outcomes for each setup.
+
+    python -m benchmarks.bench_login_burst --logins 8 --readers 2 --seconds 10
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import threading
+import time
+from collections import Counter
+
+from benchmarks.common import make_app
+
+SCENARIOS = dict(inline=0, pool=None)  # PASSWORD_HASH_WORKERS; None = the default
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else float('nan')
+
+
+def measure(scenario, args):
+    overrides = dict(BCRYPT_LOG_ROUNDS=args.rounds, SLOW_REQUEST_MS=10 ** 9)
+    if SCENARIOS[scenario] is not None:
+        overrides['PASSWORD_HASH_WORKERS'] = SCENARIOS[scenario]
+    with tempfile.TemporaryDirectory() as tmp:
+        app = make_app(os.path.join(tmp, 'bench.db'), **overrides)
+        setup = app.test_client()
+        setup.post('/register', data=dict(firstName='Bench', lastName='', email='bench@bench.test',
+                                          password='bench'))
+        for i in range(20):
+            setup.post('/login', data=dict(username='bench@bench.test', password='bench'))
+            setup.post('/add_expense', data=dict(name=f'Seed {i}', amount='10', category='Other'))
+
+        # Everyone starts together; the barrier's action sets the deadline
+        deadline = []
+        ready = threading.Barrier(args.logins + args.readers,
+                                  action=lambda: deadline.append(time.monotonic() + args.seconds))
+        latencies, outcomes = [], Counter()
+        lock = threading.Lock()
+
+        def login_loop():
+            client = app.test_client()
+            ready.wait()
+            while time.monotonic() < deadline[0]:
+                status = client.post('/login', data=dict(username='bench@bench.test', password='bench')).status_code
+                client.get('/logout')
+                with lock:
+                    outcomes[status] += 1
+
+        def reader_loop():
+            client = app.test_client()
+            client.post('/login', data=dict(username='bench@bench.test', password='bench'))
+            ready.wait()
+            while time.monotonic() < deadline[0]:
+                start = time.perf_counter()
+                client.get('/get_dashboard_stats')
+                with lock:
+                    latencies.append((time.perf_counter() - start) * 1000)
+
+        threads = ([threading.Thread(target=reader_loop) for _ in range(args.readers)]
+                   + [threading.Thread(target=login_loop) for _ in range(args.logins)])
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        app.extensions['passwords'].shutdown()
+
+    logins = ', '.join(f'{status}: {count}' for status, count in sorted(outcomes.items()))
+    print(f"{scenario:<7} dashboard p50 {statistics.median(latencies) if latencies else float('nan'):>7.1f} ms"
+          f"  p95 {percentile(latencies, 0.95):>7.1f} ms  ({len(latencies)} requests)   logins {logins}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--logins', type=int, default=8, help='Threads logging in.')
+    parser.add_argument('--readers', type=int, default=2, help='Threads loading the dashboard.')
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--rounds', type=int, default=12, help='bcrypt cost.')
+    parser.add_argument('--scenario', choices=SCENARIOS, nargs='+', default=list(SCENARIOS))
+    args = parser.parse_args()
+
+    print(f"{args.logins} login threads, {args.readers} dashboard threads, {args.seconds:.0f}s, "
+          f"bcrypt cost {args.rounds}")
+    for scenario in args.scenario:
+        measure(scenario, args)
+
+
+if __name__ == '__main__':
+    main()
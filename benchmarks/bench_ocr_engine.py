@@ -0,0 +1,66 @@
+"""Per-receipt OCR time of each engine in ocr_engine.py, warm and cold.
+
+Every image in uploads/ is preprocessed once, then OCR'd --repeat times
+by each installed engine (the first call, which for tesserocr includes
+loading the language data, is reported separately). pytesseract starts a
+tesseract process per call; tesserocr reuses one loaded instance. With
+--words the word boxes and confidences are read as well. Needs tesseract
+on PATH, and the tesserocr package for its row.
+
+    python -m benchmarks.bench_ocr_engine --repeat 5 --words
+"""
+import argparse
+import glob
+import os
+import statistics
+import time
+
+from PIL import Image
+
+from project.ocr_engine import PytesseractEngine, TesserocrEngine, tesserocr
+from project.preprocess import preprocess
+
+UPLOADS = os.path.join(os.path.dirname(__file__), '..', 'uploads')
+SETTINGS = dict(preprocess=['exif', 'grayscale', 'crop', 'downscale'], target_dpi=300, receipt_width_in=3.15)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--words', action='store_true', help='Also read word boxes and confidences.')
+    parser.add_argument('--lang', default='eng')
+    args = parser.parse_args()
+
+    paths = sorted(p for p in glob.glob(os.path.join(UPLOADS, '*'))
+                   if p.lower().endswith(('.png', '.jpg', '.jpeg')))
+    images = []
+    for path in paths:
+        with Image.open(path) as img:
+            images.append(preprocess(img, SETTINGS))
+    print(f"{len(images)} receipts, {args.repeat} runs each{', with words' if args.words else ''}")
+
+    engines = [('pytesseract', lambda: PytesseractEngine(dict(lang=args.lang)))]
+    if tesserocr is not None:
+        engines.append(('tesserocr', lambda: TesserocrEngine(dict(lang=args.lang))))
+    else:
+        print("tesserocr not installed: skipping it")
+
+    for name, make in engines:
+        start = time.perf_counter()
+        engine = make()
+        engine.recognize(images[0], words=args.words)
+        first = (time.perf_counter() - start) * 1000
+
+        times = []
+        for _ in range(args.repeat):
+            for image in images:
+                start = time.perf_counter()
+                engine.recognize(image, words=args.words)
+                times.append((time.perf_counter() - start) * 1000)
+        engine.close()
+        print(f"{name:<12} first call {first:>7.1f} ms   per receipt: median {statistics.median(times):>7.1f} ms"
+              f"  p95 {sorted(times)[int(0.95 * (len(times) - 1))]:>7.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
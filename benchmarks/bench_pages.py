@@ -0,0 +1,70 @@
+"""Time to serve the dashboard pages: rebuilt, from the response cache, or as a 304.
+
+Seeds one user with --expenses expenses, then requests each page
+--repeat times three ways: with RESPONSE_CACHE_BACKEND=none (every
+request renders the page), with the in-memory cache (the first request
+renders, the rest are hits), and with the page's ETag in If-None-Match
+(304s, no body).
+
+    python -m benchmarks.bench_pages --expenses 2000 --repeat 200
+"""
+import argparse
+import io
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import date, timedelta
+
+from benchmarks.common import make_app
+
+PAGES = ['/home', '/get_dashboard_stats', '/analytics', '/report']
+
+
+def client_for(path, expenses, **overrides):
+    app = make_app(path, SLOW_REQUEST_MS=10 ** 9, **overrides)
+    client = app.test_client()
+    client.post('/register', data=dict(firstName='Bench', lastName='', email='bench@bench.test', password='bench'))
+    client.post('/login', data=dict(username='bench@bench.test', password='bench'))
+    client.get('/home')  # clears the login flash message
+    if expenses:
+        rng = random.Random(1)
+        rows = ['name,amount,category,date'] + [
+            f'Item {i},{rng.uniform(1, 200):.2f},{rng.choice(["Food", "Travel", "Rent", "Other"])},'
+            f'{date.today() - timedelta(days=rng.randrange(730))}' for i in range(expenses)]
+        response = client.post('/api/expenses/import',
+                               data={'file': (io.BytesIO('\n'.join(rows).encode()), 'seed.csv')})
+        assert response.status_code == 200, response.get_json()
+    return client
+
+
+def timings(client, url, repeat, headers=None):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = client.get(url, headers=headers or {})
+        times.append((time.perf_counter() - start) * 1000)
+        assert response.status_code in (200, 304), (url, response.status_code)
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--expenses', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        uncached = client_for(os.path.join(tmp, 'none.db'), args.expenses, RESPONSE_CACHE_BACKEND='none')
+        cached = client_for(os.path.join(tmp, 'memory.db'), args.expenses, RESPONSE_CACHE_BACKEND='memory')
+        print(f"{args.expenses} expenses, median of {args.repeat} requests (ms)")
+        print(f"{'page':<22}{'rendered':>10}{'cached':>10}{'304':>10}")
+        for url in PAGES:
+            etag = cached.get(url).headers['ETag']
+            print(f"{url:<22}{timings(uncached, url, args.repeat):>10.2f}{timings(cached, url, args.repeat):>10.2f}"
+                  f"{timings(cached, url, args.repeat, {'If-None-Match': etag}):>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
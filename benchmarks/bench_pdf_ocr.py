@@ -0,0 +1,83 @@
+"""Compare the old render-everything PDF loop with the streaming page path.
+
+Builds a multi-page PDF out of the sample receipts in uploads/, then OCRs it
+both ways in a fresh process each and reports wall time and peak RSS.
+Needs tesseract and poppler (pdftoppm) on PATH.
+
+    python -m benchmarks.bench_pdf_ocr --pages 20 --in-flight 4
+"""
+import argparse
+import glob
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+
+from PIL import Image
+import pytesseract
+from pdf2image import convert_from_path
+
+from project.ocr import read_pdf
+
+UPLOADS = os.path.join(os.path.dirname(__file__), '..', 'uploads')
+
+
+def build_pdf(path, pages):
+    sources = sorted(glob.glob(os.path.join(UPLOADS, '*.png')) +
+                     glob.glob(os.path.join(UPLOADS, '*.jpg')))
+    images = [Image.open(sources[i % len(sources)]).convert('RGB') for i in range(pages)]
+    images[0].save(path, save_all=True, append_images=images[1:], resolution=150)
+
+
+def legacy(path, dpi, _in_flight):
+    # The loop /upload_receipt used before the streaming path
+    text_data = ""
+    pages = convert_from_path(path, dpi)
+    for page in pages:
+        text_data += pytesseract.image_to_string(page)
+    return text_data
+
+
+def streaming(path, dpi, in_flight):
+    return read_pdf(path, dpi=dpi, pages_in_flight=in_flight).text
+
+
+def _measure(func, path, dpi, in_flight, queue):
+    start = time.perf_counter()
+    text = func(path, dpi, in_flight)
+    elapsed = time.perf_counter() - start
+    # ru_maxrss is KiB on Linux
+    self_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    child_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    queue.put((elapsed, self_rss, child_rss, len(text)))
+
+
+def run(func, path, dpi, in_flight):
+    queue = multiprocessing.Queue()
+    proc = multiprocessing.Process(target=_measure, args=(func, path, dpi, in_flight, queue))
+    proc.start()
+    result = queue.get()
+    proc.join()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--pages', type=int, default=20)
+    parser.add_argument('--dpi', type=int, default=300)
+    parser.add_argument('--in-flight', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf_path = os.path.join(tmp, 'receipts.pdf')
+        build_pdf(pdf_path, args.pages)
+        print(f"{args.pages} pages at {args.dpi} DPI, {args.in_flight} pages in flight")
+        print(f"{'variant':<10} {'wall s':>8} {'py RSS MiB':>11} {'child RSS MiB':>14} {'chars':>7}")
+        for name, func in (('legacy', legacy), ('streaming', streaming)):
+            elapsed, self_rss, child_rss, chars = run(func, pdf_path, args.dpi, args.in_flight)
+            print(f"{name:<10} {elapsed:>8.2f} {self_rss:>11.1f} {child_rss:>14.1f} {chars:>7}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""Time and accuracy of the OCR preprocessing steps on the sample receipts.
+
+Every image in uploads/ is OCR'd once per configuration. Accuracy is the
+character similarity to a reference text: the files in --truth (named
+<image>.txt) when given, otherwise the OCR of the untouched image. The
+amount column shows whether the guessed total matches the reference.
+Needs tesseract on PATH.
+
+    python -m benchmarks.bench_preprocess --target-dpi 300 200
+"""
+import argparse
+import difflib
+import glob
+import os
+import time
+
+from PIL import Image
+import pytesseract
+
+from project.ocr import guess_fields
+from project.preprocess import preprocess
+
+UPLOADS = os.path.join(os.path.dirname(__file__), '..', 'uploads')
+
+CONFIGS = {
+    'none': [],
+    'exif+gray': ['exif', 'grayscale'],
+    'downscale': ['exif', 'grayscale', 'downscale'],
+    'default': ['exif', 'grayscale', 'crop', 'downscale'],
+    '+deskew': ['exif', 'grayscale', 'crop', 'deskew', 'downscale'],
+    '+binarize': ['exif', 'grayscale', 'crop', 'downscale', 'binarize'],
+    'all': ['exif', 'grayscale', 'crop', 'deskew', 'downscale', 'binarize'],
+}
+
+
+def ocr(path, settings):
+    start = time.perf_counter()
+    with Image.open(path) as img:
+        prepared = preprocess(img, settings)
+        prep_time = time.perf_counter() - start
+        text = pytesseract.image_to_string(prepared)
+    return text, prep_time, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--target-dpi', type=int, nargs='+', default=[300])
+    parser.add_argument('--receipt-width-in', type=float, default=3.15)
+    parser.add_argument('--truth', help='directory of <image>.txt reference transcripts')
+    args = parser.parse_args()
+
+    images = sorted(p for p in glob.glob(os.path.join(UPLOADS, '*'))
+                    if p.lower().endswith(('.png', '.jpg', '.jpeg')))
+
+    references = {}
+    for path in images:
+        name = os.path.basename(path)
+        truth_path = os.path.join(args.truth, name + '.txt') if args.truth else None
+        if truth_path and os.path.exists(truth_path):
+            with open(truth_path, encoding='utf-8') as f:
+                references[name] = f.read()
+        else:
+            references[name] = ocr(path, {})[0]
+
+    print(f"{'config':<11} {'dpi':>4} {'prep ms':>8} {'total ms':>9} {'similarity':>10} {'amount ok':>10}")
+    for target_dpi in args.target_dpi:
+        for label, steps in CONFIGS.items():
+            settings = dict(preprocess=steps, target_dpi=target_dpi,
+                            receipt_width_in=args.receipt_width_in)
+            prep_total = ocr_total = similarity = 0.0
+            amounts_ok = 0
+            for path in images:
+                name = os.path.basename(path)
+                text, prep_time, total_time = ocr(path, settings)
+                prep_total += prep_time
+                ocr_total += total_time
+                similarity += difflib.SequenceMatcher(None, text, references[name]).ratio()
+                amounts_ok += guess_fields(text)['amount'] == guess_fields(references[name])['amount']
+            n = len(images)
+            print(f"{label:<11} {target_dpi:>4} {prep_total / n * 1000:>8.1f} "
+                  f"{ocr_total / n * 1000:>9.1f} {similarity / n:>10.3f} {amounts_ok:>6}/{n}")
+
+
+if __name__ == '__main__':
+    main()
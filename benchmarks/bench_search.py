@@ -0,0 +1,59 @@
+"""Expense search latency: LIKE '%term%' against the FTS5 index.
+
+Seeds expenses with OCR-style text (the FTS triggers index them as they
+are inserted) and times the ways /expenses could search, for one user's
+newest page of matches. Try both a common word (a merchant name, which
+LIKE finds quickly because it can stop after one page) and a selective
+one such as an invoice number, where LIKE has to scan every row.
+
+    python -m benchmarks.bench_search --users 10 --rows 500000 --term spice INV-004217
+"""
+import argparse
+import os
+import tempfile
+
+from project import db
+from project.models import Expense
+from project.search import search_filter, ranked_search, fts_available
+
+from benchmarks.common import make_app, seed, timed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--rows', type=int, default=500_000)
+    parser.add_argument('--term', nargs='+', default=['spice', 'INV-004217'])
+    parser.add_argument('--page-size', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        app = make_app(db_path)
+        seed(db_path, args.users, args.rows // args.users, with_text=True)
+        print(f"Seeded {args.rows} expenses for {args.users} users")
+
+        with app.app_context():
+            assert fts_available(), "this SQLite build has no FTS5"
+            user = Expense.query.filter_by(user_id=1)
+            newest = (Expense.date.desc(), Expense.id.desc())
+            for term in args.term:
+                print(f"\n== {term!r} ==")
+                pattern = f'%{term}%'
+                cases = {
+                    'LIKE name (old)': user.filter(Expense.name.like(pattern)),
+                    'LIKE name + text': user.filter(Expense.name.like(pattern) | Expense.text.like(pattern)),
+                    'FTS5 filter': user.filter(search_filter(term)),
+                }
+                for name, query in cases.items():
+                    ms, rows = timed(lambda: query.order_by(*newest).limit(args.page_size).all(), args.repeat)
+                    print(f"{name:<18} {ms:>9.2f} ms  {len(rows)} rows")
+
+                ms, rows = timed(lambda: ranked_search(1, term, args.page_size), args.repeat)
+                print(f"{'FTS5 ranked':<18} {ms:>9.2f} ms  {len(rows)} rows")
+            db.session.remove()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""Time for /upload_receipt to accept a receipt, kept in memory vs spooled to disk.
+
+Posts distinct phone-sized photos one at a time and times each request up
+to its 202 (OCR itself runs afterwards with the load test's stub
+tesseract, and isn't timed). 'memory' keeps uploads below
+UPLOAD_SPOOL_BYTES in memory and writes them to the store in the
+background; 'disk' sets the spool to 0, so every upload goes to a temp
+file while parsing and is renamed into the store.
+
+    python -m benchmarks.bench_upload --count 30 --width 3024 --height 4032
+"""
+import argparse
+import io
+import os
+import stat
+import statistics
+import tempfile
+import time
+
+from benchmarks.bench_images import photo
+from benchmarks.common import make_app
+from benchmarks.loadtest import STUB_TESSERACT
+
+SCENARIOS = dict(memory=None, disk=0)  # UPLOAD_SPOOL_BYTES; None = the default
+
+
+def measure(scenario, photos, tmp):
+    stub = os.path.join(tmp, 'tesseract')
+    with open(stub, 'w') as f:
+        f.write(STUB_TESSERACT)
+    os.chmod(stub, os.stat(stub).st_mode | stat.S_IEXEC)
+    overrides = dict(UPLOAD_FOLDER=os.path.join(tmp, scenario, 'uploads'), TESSERACT_CMD=stub,
+                     OCR_ENGINE='pytesseract', OCR_QUEUE_SIZE=len(photos) + 1, SLOW_REQUEST_MS=10 ** 9)
+    if SCENARIOS[scenario] is not None:
+        overrides['UPLOAD_SPOOL_BYTES'] = SCENARIOS[scenario]
+    app = make_app(os.path.join(tmp, f'{scenario}.db'), **overrides)
+    client = app.test_client()
+    client.post('/register', data=dict(firstName='Bench', lastName='', email='bench@bench.test', password='bench'))
+    client.post('/login', data=dict(username='bench@bench.test', password='bench'))
+
+    times = []
+    for data in photos:
+        start = time.perf_counter()
+        response = client.post('/upload_receipt', data={'receipt': (io.BytesIO(data), 'photo.jpg')})
+        times.append((time.perf_counter() - start) * 1000)
+        assert response.status_code == 202, response.get_json()
+    app.extensions['ocr_jobs'].shutdown()
+    app.extensions['uploads'].shutdown()
+    print(f"{scenario:<7} to 202: median {statistics.median(times):>6.1f} ms  "
+          f"p95 {sorted(times)[int(0.95 * (len(times) - 1))]:>6.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--count', type=int, default=30)
+    parser.add_argument('--width', type=int, default=3024)
+    parser.add_argument('--height', type=int, default=4032)
+    parser.add_argument('--scenario', choices=SCENARIOS, nargs='+', default=list(SCENARIOS))
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        photos = []
+        for i in range(args.count):
+            path = os.path.join(tmp, f'{i}.jpg')
+            photo(path, args.width, args.height, seed_value=i)
+            with open(path, 'rb') as f:
+                photos.append(f.read())
+        print(f"{args.count} photos of {statistics.mean(map(len, photos)) / 1024:,.0f} KB")
+        for scenario in args.scenario:
+            measure(scenario, photos, tmp)
+
+
+if __name__ == '__main__':
+    main()
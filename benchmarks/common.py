@@ -0,0 +1,68 @@
+"""Shared helpers for the benchmark scripts: a throwaway app and fast seeding."""
+import os
+import random
+import sqlite3
+import statistics
+import time
+from datetime import date, timedelta
+
+from project import create_app
+from project.config import Config
+
+CATEGORIES = ['Food & Dining', 'Travel', 'Shopping', 'Entertainment', 'Bills', 'Other', None]
+MERCHANTS = ['Fresh Mart', 'Spice Route', 'Cafe Noir', 'City Fuel', 'Metro Rail',
+             'Book Nook', 'Power Co', 'Pharma Plus', 'Cinema Hall', 'ABC Traders']
+
+
+def make_app(db_path, **overrides):
+    """A full app pointed at its own SQLite file."""
+    class BenchConfig(Config):
+        SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.abspath(db_path)
+        OCR_WORKERS = 1
+        # Every benchmark client logs in from one address
+        LOGIN_MAX_PER_IP = LOGIN_MAX_PER_ACCOUNT = 10 ** 9
+    for key, value in overrides.items():
+        setattr(BenchConfig, key, value)
+    return create_app(BenchConfig)
+
+
+def seed(db_path, users, expenses_per_user, years=3, with_text=False, seed_value=42):
+    """Bulk-insert users and expenses straight through sqlite3 (ORM inserts
+    would take minutes at a million rows). Summary tables are not touched;
+    call summary.rebuild() afterwards if a benchmark needs them."""
+    rng = random.Random(seed_value)
+    start = date.today() - timedelta(days=365 * years)
+    conn = sqlite3.connect(db_path)
+    conn.executemany(
+        "INSERT INTO user (id, first_name, last_name, email, password, profile_image) "
+        "VALUES (?, ?, ?, ?, ?, 'default.png')",
+        [(uid, f'User{uid}', 'Bench', f'user{uid}@bench.test', 'x') for uid in range(1, users + 1)],
+    )
+
+    def rows():
+        for uid in range(1, users + 1):
+            for _ in range(expenses_per_user):
+                merchant = rng.choice(MERCHANTS)
+                day = start + timedelta(days=rng.randrange(365 * years))
+                text = (f"{merchant.upper()}\nInvoice No: INV-{rng.randrange(1_000_000):06d}\n"
+                        f"Item {rng.randrange(100)} {rng.random() * 90:.2f}\nTotal") if with_text else None
+                yield (merchant, round(rng.lognormvariate(3.5, 1.0), 2), rng.choice(CATEGORIES),
+                       day.isoformat(), text, uid)
+
+    conn.executemany(
+        "INSERT INTO expense (name, amount, category, date, text, user_id) VALUES (?, ?, ?, ?, ?, ?)",
+        rows(),
+    )
+    conn.commit()
+    conn.close()
+
+
+def timed(func, repeat=5):
+    """Median wall time of func() in milliseconds, plus its last result."""
+    times = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times), result
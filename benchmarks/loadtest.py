@@ -0,0 +1,388 @@
+"""Load test of the real routes: latency percentiles and throughput per route.
+
+Seeds a database with --users users and --expenses expenses each (summary
+tables and search index included), then runs each scenario in turn:
+--concurrency threads, each logged in as its own user, send requests until
+the scenario's request budget is spent. Requests go through the Flask test
+client, or with --http through a real local HTTP server.
+
+Receipt uploads use the sample images in uploads/. With --ocr stub (the
+default) a stand-in tesseract returns a fixed receipt, so the numbers cover
+the app's own work (store, queue, worker pool, parsing) and not the OCR
+engine's; --ocr tesseract uses the real one. Each upload gets a few random
+bytes appended so the OCR cache doesn't answer it (--ocr-cache allows that).
+
+Results go to benchmarks/results/loadtest-<commit>.json; --compare prints
+the change against an earlier results file.
+
+    python -m benchmarks.loadtest --users 20 --expenses 2000 --requests 200 --concurrency 4
+    python -m benchmarks.loadtest --scenario home analytics --compare benchmarks/results/loadtest-abc1234.json
+"""
+import argparse
+import glob
+import http.cookiejar
+import io
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import stat
+import subprocess
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from datetime import date, datetime
+
+from sqlalchemy import update
+from werkzeug.serving import make_server
+
+from project import db, bcrypt, summary
+from project.models import User
+
+from benchmarks.common import make_app, seed, CATEGORIES
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+UPLOADS = os.path.join(ROOT, 'uploads')
+RESULTS = os.path.join(os.path.dirname(__file__), 'results')
+PASSWORD = 'bench'
+
+STUB_TESSERACT = """#!/bin/sh
+# Stand-in tesseract for the load test: tesseract <image> <outbase> [options]
+if [ "$1" = "--version" ]; then echo "tesseract 5.0.0"; exit 0; fi
+printf 'FRESH MART\\nDate: 12/03/2024\\nMilk 2.50\\nBread 3.10\\nTax 0.40\\nTotal 6.00\\n' > "$2.txt"
+"""
+
+
+# ---------- CLIENTS ----------
+class TestClient:
+    """The Flask test client behind the same small interface as HttpClient."""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def get(self, path):
+        response = self.client.get(path)
+        return response.status_code, response.data
+
+    def post(self, path, data=None, files=None):
+        data = dict(data or {})
+        for field, (filename, content) in (files or {}).items():
+            data[field] = (io.BytesIO(content), filename)
+        response = self.client.post(path, data=data,
+                                    content_type='multipart/form-data' if files else None)
+        return response.status_code, response.data
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    # Time the request itself, not the page it redirects to
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HttpClient:
+    """urllib against a live server, with its own cookie jar (session)."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect())
+
+    def _open(self, request):
+        try:
+            with self.opener.open(request) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+    def get(self, path):
+        return self._open(urllib.request.Request(self.base_url + path))
+
+    def post(self, path, data=None, files=None):
+        if files:
+            body, content_type = _multipart(data or {}, files)
+        else:
+            body = urllib.parse.urlencode(data or {}).encode()
+            content_type = 'application/x-www-form-urlencoded'
+        return self._open(urllib.request.Request(self.base_url + path, data=body, method='POST',
+                                                 headers={'Content-Type': content_type}))
+
+
+def _multipart(data, files):
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in data.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    for name, (filename, content) in files.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                     f'Content-Type: application/octet-stream\r\n\r\n'.encode() + content + b'\r\n')
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+# ---------- SCENARIOS ----------
+# Each takes (client, state) and returns the HTTP status that decides
+# success. `scale` shrinks the request budget for the slow ones.
+def login(client, state):
+    status, _ = client.post('/login', data=dict(username=state.email, password=PASSWORD))
+    return status
+
+
+def add_expense(client, state):
+    status, _ = client.post('/add_expense', data=dict(
+        name=state.rng.choice(['Fresh Mart', 'Cafe Noir', 'City Fuel']),
+        amount=f'{state.rng.uniform(1, 300):.2f}', category=state.rng.choice(CATEGORIES[:-1]),
+        date=date.today().isoformat()))
+    return status
+
+
+def upload_receipt(client, state):
+    """Upload one sample receipt and wait until its OCR result is ready."""
+    filename, content = state.rng.choice(state.samples)
+    if not state.ocr_cache:
+        content += os.urandom(16)  # new bytes, new hash: no cache hit
+    status, body = client.post('/upload_receipt', files=dict(receipt=(filename, content)))
+    if status >= 400:
+        return status
+    result = json.loads(body)
+    status_url = result.get('status_url')
+    while result.get('status') == 'queued':
+        time.sleep(0.02)
+        status, body = client.get(status_url)
+        if status >= 400:
+            return status
+        result = json.loads(body)
+    return 200 if result.get('status') == 'done' else 500
+
+
+def page(path):
+    def scenario(client, state):
+        status, _ = client.get(path)
+        return status
+    scenario.__doc__ = f"GET {path}"
+    return scenario
+
+
+SCENARIOS = dict(
+    login=(login, 0.25),
+    home=(page('/home'), 1),
+    get_dashboard_stats=(page('/get_dashboard_stats'), 1),
+    view_expenses=(page('/expenses'), 1),
+    analytics=(page('/analytics'), 1),
+    report=(page('/report'), 1),
+    add_expense=(add_expense, 1),
+    upload_receipt=(upload_receipt, 0.5),
+)
+
+
+class WorkerState:
+    def __init__(self, email, samples, ocr_cache, seed_value):
+        self.email = email
+        self.samples = samples
+        self.ocr_cache = ocr_cache
+        self.rng = random.Random(seed_value)
+
+
+# ---------- RUNNING ----------
+def percentile(ordered, p):
+    """Nearest-rank percentile of an already sorted list."""
+    if not ordered:
+        return None
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def run_scenario(name, workers, requests, warmup):
+    fn, _ = SCENARIOS[name]
+    latencies, errors = [], 0
+    lock = threading.Lock()
+    remaining = [requests]
+
+    def take():
+        with lock:
+            if remaining[0] <= 0:
+                return False
+            remaining[0] -= 1
+            return True
+
+    def run(client, state):
+        nonlocal errors
+        try:
+            for _ in range(warmup):
+                fn(client, state)
+        finally:
+            barrier.wait()
+        while take():
+            start = time.perf_counter()
+            try:
+                ok = fn(client, state) < 400
+            except Exception:
+                ok = False
+            elapsed = time.perf_counter() - start
+            with lock:
+                if ok:
+                    latencies.append(elapsed)
+                else:
+                    errors += 1
+
+    barrier = threading.Barrier(len(workers) + 1)
+    threads = [threading.Thread(target=run, args=worker) for worker in workers]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - start
+
+    latencies.sort()
+    ms = lambda seconds: None if seconds is None else round(seconds * 1000, 2)  # noqa: E731
+    return dict(
+        requests=len(latencies) + errors, errors=errors,
+        p50_ms=ms(percentile(latencies, 50)), p95_ms=ms(percentile(latencies, 95)),
+        p99_ms=ms(percentile(latencies, 99)), max_ms=ms(latencies[-1] if latencies else None),
+        mean_ms=ms(sum(latencies) / len(latencies) if latencies else None),
+        throughput_rps=round(len(latencies) / wall, 1) if wall else None,
+    )
+
+
+def setup(tmp, args):
+    """A seeded app in `tmp`: every user's password is PASSWORD."""
+    overrides = dict(
+        UPLOAD_FOLDER=os.path.join(tmp, 'uploads'),
+        IMAGE_CACHE_FOLDER=os.path.join(tmp, 'images'),
+        OCR_WORKERS=args.ocr_workers,
+        OCR_QUEUE_SIZE=max(32, args.concurrency * 4),
+        SLOW_REQUEST_MS=10 ** 9,
+    )
+    if args.ocr == 'stub':
+        stub = os.path.join(tmp, 'tesseract')
+        with open(stub, 'w') as f:
+            f.write(STUB_TESSERACT)
+        os.chmod(stub, os.stat(stub).st_mode | stat.S_IEXEC)
+        overrides['TESSERACT_CMD'] = stub
+        overrides['OCR_ENGINE'] = 'pytesseract'  # the stub is a command
+    else:
+        overrides['TESSERACT_CMD'] = shutil.which('tesseract')
+
+    db_path = os.path.join(tmp, 'loadtest.db')
+    app = make_app(db_path, **overrides)
+    seed(db_path, args.users, args.expenses, with_text=True, seed_value=args.seed)
+    with app.app_context():
+        password = bcrypt.generate_password_hash(PASSWORD).decode('utf-8')
+        db.session.execute(update(User).values(password=password))
+        db.session.commit()
+        summary.rebuild()
+    return app
+
+
+def git_version():
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def print_table(results, baseline=None):
+    header = f"{'scenario':<20} {'reqs':>6} {'errs':>5} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>8}"
+    print(header)
+    print('-' * len(header))
+
+    def fmt(value):
+        return f"{value:>9.2f}" if value is not None else f"{'-':>9}"
+
+    for name, r in results.items():
+        print(f"{name:<20} {r['requests']:>6} {r['errors']:>5} {fmt(r['p50_ms'])} {fmt(r['p95_ms'])} "
+              f"{fmt(r['p99_ms'])} {r['throughput_rps'] or 0:>8.1f}")
+        before = (baseline or {}).get(name)
+        if before:
+            changes = []
+            for key in ('p50_ms', 'p95_ms', 'p99_ms', 'throughput_rps'):
+                if before.get(key) and r.get(key) is not None:
+                    changes.append(f"{key.split('_')[0]} {(r[key] - before[key]) / before[key]:+.0%}")
+            print(f"{'':<20}   vs baseline: {', '.join(changes)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--expenses', type=int, default=2000, help='Seeded expenses per user.')
+    parser.add_argument('--requests', type=int, default=200,
+                        help='Requests per scenario (login and upload_receipt run a fraction).')
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--warmup', type=int, default=3, help='Unmeasured requests per thread first.')
+    parser.add_argument('--scenario', choices=SCENARIOS, nargs='+', default=list(SCENARIOS))
+    parser.add_argument('--http', action='store_true', help='Go through a local HTTP server.')
+    parser.add_argument('--ocr', choices=('stub', 'tesseract'), default='stub')
+    parser.add_argument('--ocr-workers', type=int, default=2)
+    parser.add_argument('--ocr-cache', action='store_true', help='Let repeated uploads hit the OCR cache.')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='Results file (default benchmarks/results/loadtest-<commit>.json).')
+    parser.add_argument('--compare', help='Earlier results file to compare against.')
+    args = parser.parse_args()
+
+    samples = [(os.path.basename(path), open(path, 'rb').read())
+               for path in sorted(glob.glob(os.path.join(UPLOADS, '*.png')) + glob.glob(os.path.join(UPLOADS, '*.jpg')))]
+    tmp = tempfile.mkdtemp(prefix='loadtest-')
+    server = None
+    try:
+        print(f"Seeding {args.users} users x {args.expenses} expenses...")
+        app = setup(tmp, args)
+        if args.http:
+            server = make_server('127.0.0.1', 0, app, threaded=True)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            base_url = f'http://127.0.0.1:{server.server_port}'
+            make_client = lambda: HttpClient(base_url)  # noqa: E731
+        else:
+            make_client = lambda: TestClient(app)  # noqa: E731
+
+        # One logged-in client per thread, each as its own user
+        workers = []
+        for i in range(args.concurrency):
+            email = f'user{i % args.users + 1}@bench.test'
+            client = make_client()
+            client.post('/login', data=dict(username=email, password=PASSWORD))
+            workers.append((client, WorkerState(email, samples, args.ocr_cache, args.seed + i)))
+
+        results = {}
+        for name in args.scenario:
+            requests = max(1, int(args.requests * SCENARIOS[name][1]))
+            results[name] = run_scenario(name, workers, requests, args.warmup)
+            print(f"  {name}: done")
+    finally:
+        if server is not None:
+            server.shutdown()
+        from project.jobs import job_queue
+        from project.images import images
+        job_queue.shutdown()
+        images.shutdown()
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+    print()
+    print_table(results, baseline)
+
+    version = git_version()
+    output = args.output or os.path.join(RESULTS, f'loadtest-{version}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(dict(
+            meta=dict(commit=version, date=datetime.now().isoformat(timespec='seconds'),
+                      python=platform.python_version(), platform=platform.platform(),
+                      cpus=os.cpu_count(), transport='http' if args.http else 'test_client',
+                      args=vars(args)),
+            results=results,
+        ), f, indent=2)
+    print(f"\nSaved {output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -46,14 +46,14 @@ db = SQLAlchemy()
 
 bcrypt = Bcrypt()
 
-def create_app():
+def create_app(config_class=Config):
     app = Flask(__name__, 
                 instance_relative_config=True,
                 static_folder='static',  # Tell Flask where static is
                 template_folder='templates') # Tell Flask where templates is
     
     # 1. Load configuration
-    app.config.from_object(Config)
+    app.config.from_object(config_class)
     
     # 2. Ensure the instance folder exists
     try:
@@ -61,20 +61,113 @@ def create_app():
     except OSError:
         pass # Already exists
 
-    # 3. Initialize database
-    db.init_app(app)
+    # Client address, scheme and host from the proxies' X-Forwarded-* headers
+    # (only safe when clients can't reach the app without going through them)
+    proxies = app.config['TRUSTED_PROXIES']
+    if proxies:
+        from werkzeug.middleware.proxy_fix import ProxyFix
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=proxies, x_proto=proxies, x_host=proxies)
+
+    # 3. Initialize database (engine pools and SQLite pragmas: database.py)
+    from .database import init_db
+    init_db(app)
 
     bcrypt.init_app(app)
 
+    # bcrypt on a bounded thread pool, and login throttling (see passwords.py)
+    from .passwords import passwords
+    passwords.init_app(app)
+
+    # Signed-in user lookups, cached across requests (see auth.py)
+    from .auth import user_cache
+    user_cache.init_app(app)
+
+    # Background OCR worker pool for receipt uploads, plus the result cache
+    from .jobs import job_queue
+    from .ocr_cache import ocr_cache
+    job_queue.init_app(app)
+    ocr_cache.init_app(app)
+
+    # Per-user server-sent event streams for live dashboard numbers
+    from .events import events
+    events.init_app(app)
+
+    # Per-user cache for the /analytics/insights numbers
+    from .insights import insights_cache
+    insights_cache.init_app(app)
+
+    # Uploads are hashed (and kept in memory when small) as the request is
+    # parsed, and receipts are written to the store in the background (see store.py)
+    from .store import uploads
+    uploads.init_app(app)
+
+    # Rendered pages cached per user and data version, with ETags (see page_cache.py)
+    from .page_cache import response_cache
+    response_cache.init_app(app)
+
+    # Thumbnails of profile pictures and receipts (see images.py)
+    from .images import images
+    images.init_app(app)
+
+    # Fingerprinted, precompressed static files and their URLs (see assets.py)
+    from .assets import assets
+    assets.init_app(app)
+
+    # Request/SQL/span metrics for /metrics, and the opt-in slow-request
+    # profiler (see instrumentation.py). After the extensions it reports on
+    from .instrumentation import metrics
+    metrics.init_app(app)
+
     # 4. Import and register the routes Blueprint
     from .routes import main as main_blueprint
     app.register_blueprint(main_blueprint)
 
+    # 5-8. Tables, migrations and summary backfill; the production server
+    # does this once before starting its workers (see server.py)
+    if app.config['DB_SETUP_ON_START']:
+        setup_database(app)
+
     with app.app_context():
         # 5. Import models (so SQLAlchemy knows about them)
         from . import models
+
+        # 7. Schema migrations on demand (see migrations.py)
+        from .migrations import db_upgrade_command, db_version_command
+        app.cli.add_command(db_upgrade_command)
+        app.cli.add_command(db_version_command)
+
+        from .search import search_reindex_command
+        app.cli.add_command(search_reindex_command)
+
+        # 8. Dashboard summary tables, rebuilt on demand
+        from .summary import rebuild_summaries_command
+        app.cli.add_command(rebuild_summaries_command)
+
+        # 9. Bulk CSV/JSON import and export (see bulk.py)
+        from .bulk import import_expenses_command, export_expenses_command
+        app.cli.add_command(import_expenses_command)
+        app.cli.add_command(export_expenses_command)
+
+        # 10. Static asset build (see assets.py)
+        from .assets import build_assets_command
+        app.cli.add_command(build_assets_command)
         
+        return app
+
+
+def setup_database(app):
+    """Create missing tables, apply migrations and backfill the summary tables."""
+    with app.app_context():
+        # 5. Import models (so SQLAlchemy knows about them)
+        from . import models
+
         # 6. Create database tables (if they don't exist)
-        db.create_all() 
-        
-        return app
\ No newline at end of file
+        db.create_all()
+
+        # 7. Bring older databases up to date (see migrations.py)
+        from .migrations import upgrade
+        upgrade()
+
+        # 8. Dashboard summary tables: backfill once
+        from .summary import rebuild_if_missing
+        rebuild_if_missing()
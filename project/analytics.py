@@ -0,0 +1,92 @@
+from collections import namedtuple
+from dataclasses import dataclass, field
+from datetime import datetime
+from . import db
+from .models import Expense, ExpenseSummary
+from .instrumentation import traced
+
+TopExpense = namedtuple('TopExpense', 'name amount')
+
+# (year, month, category, total, count) - one row per user/month/category
+Group = namedtuple('Group', 'year month category total count')
+
+
+@dataclass
+class Analytics:
+    """Every number the dashboard, /analytics and /report show for one user."""
+    total_spent: float = 0.0
+    expense_count: int = 0
+    this_month_spent: float = 0.0
+    this_month_count: int = 0
+    category_count: int = 0
+    monthly: list = field(default_factory=list)       # [('2025-01', total), ...] oldest first
+    by_category: list = field(default_factory=list)   # [(category, total), ...] biggest first
+    top_expenses: list = field(default_factory=list)  # [TopExpense, ...] biggest first
+
+    def dashboard(self):
+        """The dict behind /get_dashboard_stats and the live stats stream."""
+        return dict(
+            total_spent=self.total_spent,
+            this_month_spent=self.this_month_spent,
+            this_month_count=self.this_month_count,
+            category_count=self.category_count,
+            receipt_count=self.expense_count,
+        )
+
+
+# ---------- GROUPED ROWS ----------
+def summary_groups(user_id):
+    """Per month/category totals, read from the incrementally maintained
+    summary table (a few dozen rows however many expenses there are)."""
+    return [Group(*row) for row in db.session.query(
+        ExpenseSummary.year, ExpenseSummary.month, ExpenseSummary.category,
+        ExpenseSummary.total, ExpenseSummary.count,
+    ).filter_by(user_id=user_id)]
+
+
+def top_expenses(user_id, n=5):
+    # Walks the (user_id, amount) index backwards and stops after n rows
+    rows = (db.session.query(Expense.name, Expense.amount)
+            .filter(Expense.user_id == user_id)
+            .order_by(Expense.amount.desc(), Expense.id.desc()).limit(n))
+    return [TopExpense(name, amount) for name, amount in rows]
+
+
+# ---------- SERVICE ----------
+def build(groups, top=(), today=None):
+    """Fold grouped rows into an Analytics result in one pass."""
+    today = today or datetime.utcnow()
+    result = Analytics(top_expenses=list(top))
+    monthly = {}
+    categories = {}
+    for group in groups:
+        result.total_spent += group.total
+        result.expense_count += group.count
+        if (group.year, group.month) == (today.year, today.month):
+            result.this_month_spent += group.total
+            result.this_month_count += group.count
+        key = (group.year, group.month)
+        monthly[key] = monthly.get(key, 0) + group.total
+        categories[group.category] = categories.get(group.category, 0) + group.total
+
+    result.monthly = [(f"{year:04d}-{month:02d}", total)
+                      for (year, month), total in sorted(monthly.items())]
+    result.by_category = sorted(((category or 'Uncategorized', total)
+                                 for category, total in categories.items()),
+                                key=lambda item: item[1], reverse=True)
+    # Uncategorized counts as one, as SELECT DISTINCT category counted NULL
+    result.category_count = len(categories)
+    return result
+
+
+@traced('analytics')
+def for_user(user_id, top_n=5, today=None):
+    """Analytics for one user: one read of the summary table plus a LIMIT
+    query for the top expenses (skipped when top_n is 0)."""
+    top = top_expenses(user_id, top_n) if top_n else ()
+    return build(summary_groups(user_id), top, today)
+
+
+@traced('dashboard_stats')
+def dashboard_stats(user_id, today=None):
+    return for_user(user_id, top_n=0, today=today).dashboard()
@@ -0,0 +1,285 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import shlex
+import subprocess
+import urllib.request
+from urllib.parse import urljoin, urlsplit
+import click
+from flask import current_app, request, send_from_directory, url_for
+from flask.cli import with_appcontext
+
+try:
+    import brotli
+except ImportError:  # optional: pip install brotli (for .br files)
+    brotli = None
+
+# Third-party files the pages use: where they live under static/ once
+# vendored, and the CDN they come from (and are linked to until then)
+VENDOR = {
+    'vendor/chart.umd.js': 'https://cdn.jsdelivr.net/npm/chart.js@4.4.1/dist/chart.umd.js',
+    'vendor/fontawesome/css/all.min.css':
+        'https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.4.0/css/all.min.css',
+    'vendor/inter/inter.css':
+        'https://fonts.googleapis.com/css2?family=Inter:wght@300;400;500;600;700;800&display=swap',
+}
+
+DIST = 'dist'                # fingerprinted copies, under static/
+MANIFEST = 'manifest.json'   # in DIST: {'style.css': 'dist/style.3f2a9c1e.css', ...}
+SKIP = ('dist', 'src', 'profile_pics')  # not fingerprinted: build output, sources, user uploads
+COMPRESSIBLE = ('.css', '.js', '.svg', '.json', '.map', '.txt', '.ttf', '.eot')
+
+mimetypes.add_type('font/woff2', '.woff2')
+mimetypes.add_type('font/woff', '.woff')
+
+# Google Fonts only serves woff2 to browsers it recognises
+USER_AGENT = 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36'
+CSS_URL = re.compile(r'''url\(\s*(['"]?)([^'")]+)\1\s*\)''')
+
+
+# ---------- BUILD: VENDOR ----------
+def _download(url):
+    req = urllib.request.Request(url, headers={'User-Agent': USER_AGENT})
+    with urllib.request.urlopen(req, timeout=60) as response:
+        return response.read()
+
+
+def vendor_css(static, path, url, data, log):
+    """Download what a stylesheet points at (fonts, images) next to it, and
+    point it at those copies instead."""
+    folder = os.path.dirname(os.path.join(static, path))
+
+    def fetch(match):
+        ref = match.group(2)
+        if ref.startswith(('data:', '#')):
+            return match.group(0)
+        source = urljoin(url, ref)
+        if urlsplit(ref).scheme or ref.startswith('//'):
+            local = os.path.join(folder, 'files', os.path.basename(urlsplit(source).path))
+        else:
+            local = os.path.normpath(os.path.join(folder, urlsplit(ref).path))
+            if not local.startswith(os.path.join(static, 'vendor') + os.sep):
+                return match.group(0)
+        if not os.path.exists(local):
+            os.makedirs(os.path.dirname(local), exist_ok=True)
+            log(f"  {source}")
+            _write(local, _download(source))
+        return f'url({os.path.relpath(local, folder).replace(os.sep, "/")})'
+
+    return CSS_URL.sub(fetch, data.decode()).encode()
+
+
+def vendor(static, refresh=False, log=click.echo):
+    for path, url in VENDOR.items():
+        target = os.path.join(static, path)
+        if os.path.exists(target) and not refresh:
+            continue
+        log(f"vendor {path} <- {url}")
+        data = _download(url)
+        if path.endswith('.css'):
+            data = vendor_css(static, path, url, data, log)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        _write(target, data)
+
+
+# ---------- BUILD: TAILWIND ----------
+def build_tailwind(static, command, log=click.echo):
+    """static/tailwind.css with only the classes the templates use.
+
+    Returns False (the pages keep the Play CDN) when the Tailwind CLI
+    can't be run.
+    """
+    if not command:
+        log("tailwind: skipped; set TAILWIND_CMD to the Tailwind v3 CLI")
+        return False
+    src = os.path.join(static, 'src')
+    args = shlex.split(command) + ['-c', os.path.join(src, 'tailwind.config.js'),
+                                   '-i', os.path.join(src, 'tailwind.css'),
+                                   '-o', os.path.join(static, 'tailwind.css'), '--minify']
+    log(f"tailwind: {' '.join(args)}")
+    try:
+        subprocess.run(args, check=True, stdout=subprocess.DEVNULL)
+    except (OSError, subprocess.CalledProcessError) as e:
+        log(f"tailwind: skipped ({e}); set TAILWIND_CMD to the Tailwind v3 CLI")
+        return False
+    return True
+
+
+# ---------- BUILD: FINGERPRINT AND COMPRESS ----------
+def _write(path, data):
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def _fingerprinted(path, data):
+    stem, ext = os.path.splitext(path)
+    return f'{DIST}/{stem}.{hashlib.sha256(data).hexdigest()[:10]}{ext}'
+
+
+def compress(path, data):
+    """Write path.gz (and path.br with brotli installed) when it's worth it."""
+    if not path.endswith(COMPRESSIBLE):
+        return
+    for suffix, packed in (('.gz', lambda: gzip.compress(data, 9, mtime=0)),
+                           ('.br', lambda: brotli.compress(data) if brotli is not None else None)):
+        out = packed()
+        if out is not None and len(out) < 0.9 * len(data):
+            _write(path + suffix, out)
+
+
+def fingerprint(static, log=click.echo):
+    """Copy every static file into dist/ under a name with its content hash,
+    precompressed, and write the manifest. Files from the previous build
+    are kept for one more, so pages rendered before a deploy still load."""
+    sources = []
+    for folder, dirs, files in os.walk(static):
+        if folder == static:
+            dirs[:] = [d for d in dirs if d not in SKIP]
+        for name in files:
+            sources.append(os.path.relpath(os.path.join(folder, name), static).replace(os.sep, '/'))
+    # Stylesheets last: their url()s are rewritten to the fingerprinted names
+    sources.sort(key=lambda path: (path.endswith('.css'), path))
+
+    manifest = {}
+    for path in sources:
+        with open(os.path.join(static, path), 'rb') as f:
+            data = f.read()
+        if path.endswith('.css'):
+            data = _rewrite_css(path, data, manifest)
+        manifest[path] = _fingerprinted(path, data)
+        target = os.path.join(static, manifest[path])
+        if not os.path.exists(target):
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            _write(target, data)
+            compress(target, data)
+
+    dist = os.path.join(static, DIST)
+    previous = load_manifest(static)
+    keep = {os.path.join(static, p) for p in list(manifest.values()) + list(previous.values())}
+    for folder, _, files in os.walk(dist):
+        for name in files:
+            path = os.path.join(folder, name)
+            base = re.sub(r'\.(gz|br)$', '', path)
+            if name != MANIFEST and base not in keep:
+                os.remove(path)
+    _write(os.path.join(dist, MANIFEST), json.dumps(manifest, indent=1, sort_keys=True).encode())
+    log(f"fingerprinted {len(manifest)} files into static/{DIST}/")
+    return manifest
+
+
+def _rewrite_css(path, data, manifest):
+    folder = os.path.dirname(path)
+    dist_folder = os.path.dirname(_fingerprinted(path, b''))
+
+    def rewrite(match):
+        ref = match.group(2)
+        parts = urlsplit(ref)
+        if parts.scheme or ref.startswith(('data:', '#', '/')):
+            return match.group(0)
+        target = os.path.normpath(os.path.join(folder, parts.path)).replace(os.sep, '/')
+        if target not in manifest:
+            return match.group(0)
+        new = os.path.relpath(manifest[target], dist_folder).replace(os.sep, '/')
+        return f'url({new}{"#" + parts.fragment if parts.fragment else ""})'
+
+    return CSS_URL.sub(rewrite, data.decode()).encode()
+
+
+def load_manifest(static):
+    try:
+        with open(os.path.join(static, DIST, MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+@click.command('build-assets')
+@click.option('--refresh', is_flag=True, help='Download vendored files again.')
+@click.option('--offline', is_flag=True, help="Don't download; use what's vendored already.")
+@with_appcontext
+def build_assets_command(refresh, offline):
+    """Vendor CDN files, build Tailwind, fingerprint and precompress static/."""
+    static = current_app.static_folder
+    if not offline:
+        vendor(static, refresh)
+    build_tailwind(static, current_app.config['TAILWIND_CMD'])
+    fingerprint(static)
+    if brotli is None:
+        click.echo("brotli not installed: wrote .gz files only")
+    click.echo("Restart the app to serve the new build.")
+
+
+# ---------- SERVING ----------
+class Assets:
+    """Links pages to the built assets and serves them.
+
+    asset_url() takes the same filename as url_for('static', ...) and gives
+    the fingerprinted copy from the last `flask build-assets`; url_for
+    itself does too, for files in the manifest. A vendored file that hasn't
+    been downloaded yet is linked from its CDN (ASSETS_CDN_FALLBACK).
+    Fingerprinted files are served gzip- or brotli-encoded when the client
+    accepts it, with immutable cache headers. The manifest is read at
+    startup.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.manifest = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.manifest = load_manifest(app.static_folder)
+        app.url_defaults(self._fingerprint_url)
+        app.view_functions['static'] = self.send_static
+        app.jinja_env.globals.update(asset_url=asset_url, asset_built=self.built,
+                                     tailwind_theme=self.tailwind_theme)
+        app.extensions['assets'] = self
+
+    def built(self, filename):
+        return filename in self.manifest or os.path.exists(os.path.join(self.app.static_folder, filename))
+
+    def tailwind_theme(self):
+        with open(os.path.join(self.app.static_folder, 'src', 'theme.json')) as f:
+            return json.load(f)
+
+    def _fingerprint_url(self, endpoint, values):
+        if endpoint == 'static' and values.get('filename') in self.manifest:
+            values['filename'] = self.manifest[values['filename']]
+
+    def send_static(self, filename):
+        if not filename.startswith(DIST + '/'):
+            return self.app.send_static_file(filename)
+        static = self.app.static_folder
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        max_age = self.app.config['ASSETS_MAX_AGE']
+        for suffix, encoding in (('.br', 'br'), ('.gz', 'gzip')):
+            if request.accept_encodings[encoding] and os.path.isfile(os.path.join(static, filename + suffix)):
+                response = send_from_directory(static, filename + suffix, mimetype=mimetype, max_age=max_age)
+                response.headers['Content-Encoding'] = encoding
+                break
+        else:
+            response = send_from_directory(static, filename, mimetype=mimetype, max_age=max_age)
+        response.vary.add('Accept-Encoding')
+        # The name changes whenever the content does
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+        return response
+
+
+assets = Assets()
+
+
+def asset_url(filename):
+    """url_for('static', filename=...), fingerprinted, or the CDN copy of a
+    vendored file that isn't there yet."""
+    if (filename in VENDOR and current_app.config['ASSETS_CDN_FALLBACK']
+            and not assets.built(filename)):
+        return VENDOR[filename]
+    return url_for('static', filename=filename)
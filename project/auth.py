@@ -0,0 +1,106 @@
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from functools import wraps
+from flask import g, session, redirect, url_for, jsonify
+from . import db
+from .models import User
+
+# What pages need to know about the signed-in user: no password hash, and
+# safe to share between threads (unlike a User row bound to a session)
+CurrentUser = namedtuple('CurrentUser', 'id first_name last_name email profile_image')
+
+
+def snapshot(user):
+    return CurrentUser(user.id, user.first_name, user.last_name, user.email, user.profile_image)
+
+
+# ---------- CACHE ----------
+class UserCache:
+    """Recently seen users across requests: an LRU whose entries expire.
+
+    profile() drops a user's entry when it changes them. Each server process
+    has its own cache, so another process may show an old name or picture
+    for up to USER_CACHE_TTL seconds.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._entries = OrderedDict()  # user_id -> (expires, CurrentUser)
+        self._generation = {}  # user_id -> invalidation count
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.extensions['user_cache'] = self
+
+    def get(self, user_id):
+        """The user as a CurrentUser, or None if there is no such user."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            generation = self._generation.get(user_id, 0)
+
+        user = db.session.get(User, user_id)
+        if user is None:
+            return None
+        current = snapshot(user)
+        with self._lock:
+            # Don't store a row that raced with an update
+            if self._generation.get(user_id, 0) != generation:
+                return current
+            self._entries[user_id] = (now + self.app.config['USER_CACHE_TTL'], current)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.app.config['USER_CACHE_SIZE']:
+                self._entries.popitem(last=False)
+        return current
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+            self._generation[user_id] = self._generation.get(user_id, 0) + 1
+
+    def stats(self):
+        with self._lock:
+            return dict(hits=self.hits, misses=self.misses, size=len(self._entries))
+
+
+user_cache = UserCache()
+
+
+# ---------- CURRENT USER ----------
+def current_user():
+    """The signed-in user (a CurrentUser), or None. Looked up once per request."""
+    if '_current_user' not in g:
+        user_id = session.get('user_id')
+        g._current_user = user_cache.get(user_id) if user_id is not None else None
+    return g._current_user
+
+
+def login_required(view=None, *, api=False):
+    """Only for signed-in users; others are sent to the login page, or with
+    api=True get a JSON 401.
+
+    A session whose user no longer exists is cleared and counts as signed out.
+    """
+    if view is None:
+        return lambda view: login_required(view, api=api)
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if current_user() is None:
+            if 'user_id' in session:
+                session.pop('user_id')
+            if api:
+                return jsonify(success=False, message="Not logged in"), 401
+            return redirect(url_for('main.login'))
+        return view(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,323 @@
+import csv
+import io
+import json
+import math
+from datetime import datetime, date
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import insert
+from . import db
+from .models import User, Expense
+from . import summary
+from .signals import expenses_changed
+
+# Columns written by export and read by import, in this order
+COLUMNS = ('date', 'name', 'amount', 'category', 'text')
+FORMATS = ('csv', 'json', 'jsonl')
+DATE_FORMATS = ('%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y')
+
+NAME_MAX = Expense.__table__.c.name.type.length
+CATEGORY_MAX = Expense.__table__.c.category.type.length
+# Largest single JSON record read, in characters; anything bigger ends the read
+RECORD_MAX = 1024 * 1024
+
+
+def guess_format(filename, default='csv'):
+    ext = filename.rsplit('.', 1)[-1].lower() if filename and '.' in filename else ''
+    if ext == 'ndjson':
+        return 'jsonl'
+    return ext if ext in FORMATS else default
+
+
+# ---------- READERS ----------
+# Each yields (line number or record number, dict) one record at a time, so
+# memory stays flat however big the file is.
+def read_csv(stream):
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    reader = csv.DictReader(text)
+    if reader.fieldnames:
+        reader.fieldnames = [field.strip().lower() for field in reader.fieldnames]
+    for record in reader:
+        yield reader.line_num, record
+
+
+def read_jsonl(stream, max_record=RECORD_MAX):
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig')
+    number = 0
+    while True:
+        line = text.readline(max_record + 1)
+        if not line:
+            return
+        number += 1
+        if len(line) > max_record:
+            # Skip the rest of the line without holding on to it
+            while line and not line.endswith('\n'):
+                line = text.readline(max_record)
+            yield number, ValueError(f"line is longer than {max_record} characters")
+        elif line.strip():
+            try:
+                yield number, json.loads(line)
+            except ValueError as e:
+                yield number, e
+
+
+def read_json(stream, chunk_size=64 * 1024, max_record=RECORD_MAX):
+    """Objects of a top-level JSON array, decoded one at a time.
+
+    A record that still doesn't decode after max_record characters (too
+    big, or malformed) ends the read, rather than buffering the rest of
+    the file.
+    """
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig')
+    decoder = json.JSONDecoder()
+    buffer, pos, number, eof = '', 0, 0, False
+
+    def fill():
+        nonlocal buffer, pos, eof
+        chunk = text.read(chunk_size)
+        eof = not chunk
+        buffer = buffer[pos:] + chunk
+        pos = 0
+
+    def skip(chars):
+        # Skip whitespace and any of `chars`, reading more as needed
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and (buffer[pos].isspace() or buffer[pos] in chars):
+                pos += 1
+            if pos < len(buffer) or eof:
+                return
+            fill()
+
+    fill()
+    skip('')
+    if buffer[pos:pos + 1] != '[':
+        raise ValueError("Expected a JSON array of expenses")
+    pos += 1
+    while True:
+        skip(',')
+        if pos >= len(buffer):
+            raise ValueError("Unexpected end of JSON")
+        if buffer[pos] == ']':
+            return
+        try:
+            record, end = decoder.raw_decode(buffer, pos)
+        except ValueError:
+            if eof:
+                raise
+            if len(buffer) - pos > max_record:
+                raise ValueError(f"record {number + 1} is not valid JSON within {max_record} characters")
+            fill()  # the object runs past the buffer; read more and retry
+            continue
+        number += 1
+        pos = end
+        yield number, record
+
+
+READERS = dict(csv=read_csv, json=read_json, jsonl=read_jsonl)
+
+
+# ---------- VALIDATION ----------
+def _string(record, field):
+    # CSV only gives strings; JSON could give anything
+    value = record.get(field)
+    if value is not None and not isinstance(value, str):
+        raise ValueError(f"{field} must be a string")
+    return value
+
+
+def parse_date(value):
+    if isinstance(value, date):
+        return value
+    value = value.strip()
+    try:
+        return date.fromisoformat(value)  # fast path for YYYY-MM-DD
+    except ValueError:
+        pass
+    for fmt in DATE_FORMATS[1:]:
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            continue
+    raise ValueError(f"invalid date {value!r} (use YYYY-MM-DD)")
+
+
+def clean_row(record, user_id):
+    """A raw CSV/JSON record as an expense insert dict, or ValueError."""
+    if isinstance(record, Exception):
+        raise ValueError(f"invalid JSON: {record}")
+    if not isinstance(record, dict):
+        raise ValueError("expected an object")
+
+    name = (_string(record, 'name') or '').strip()
+    if not name:
+        raise ValueError("name is required")
+    if len(name) > NAME_MAX:
+        raise ValueError(f"name is longer than {NAME_MAX} characters")
+
+    try:
+        amount = float(str(record.get('amount', '')).replace(',', '').strip())
+    except ValueError:
+        raise ValueError(f"invalid amount {record.get('amount')!r}")
+    if not math.isfinite(amount):
+        raise ValueError("amount must be a finite number")
+
+    raw_date = record.get('date')
+    if not raw_date:
+        raise ValueError("date is required")
+
+    category = (_string(record, 'category') or '').strip() or None
+    if category and len(category) > CATEGORY_MAX:
+        raise ValueError(f"category is longer than {CATEGORY_MAX} characters")
+
+    return dict(name=name, amount=round(amount, 2), category=category,
+                date=parse_date(str(raw_date)), text=_string(record, 'text') or None,
+                user_id=user_id)
+
+
+# ---------- IMPORT ----------
+def _flush(user_id, batch):
+    """Insert one batch and its summary deltas in a single transaction."""
+    # Core insert: a single executemany (the ORM bulk path splits batches
+    # up by which columns are None)
+    try:
+        db.session.execute(insert(Expense.__table__), batch)
+        summary.record_many(user_id, batch)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+
+def import_expenses(user_id, stream, fmt, batch_size=1000, max_errors=100, dry_run=False):
+    """Validate and insert expenses from a CSV/JSON/JSON Lines byte stream.
+
+    Rows are inserted batch_size at a time, one transaction per batch. Bad
+    rows are skipped and reported (the first max_errors of them); the good
+    rows around them are still imported. If a batch can't be saved the
+    import stops there: `imported` counts the batches already committed
+    and `message` says what went wrong.
+    """
+    result = dict(imported=0, failed=0, errors=[])
+    batch = []
+    try:
+        try:
+            for number, record in READERS[fmt](stream):
+                try:
+                    row = clean_row(record, user_id)
+                except ValueError as e:
+                    result['failed'] += 1
+                    if len(result['errors']) < max_errors:
+                        result['errors'].append(dict(row=number, error=str(e)))
+                    continue
+                batch.append(row)
+                if len(batch) >= batch_size:
+                    if not dry_run:
+                        _flush(user_id, batch)
+                    result['imported'] += len(batch)
+                    batch = []
+        except (ValueError, UnicodeDecodeError, csv.Error) as e:
+            # The file itself is broken; keep what was imported so far
+            result['errors'].append(dict(row=None, error=f"could not read file: {e}"))
+        if batch:
+            if not dry_run:
+                _flush(user_id, batch)
+            result['imported'] += len(batch)
+    except Exception as e:
+        # _flush rolled this batch back; the ones before it stay committed
+        result['message'] = f"Could not save expenses: {e}"
+    return result
+
+
+# ---------- EXPORT ----------
+def export_query(user_id, filters=(), session=None):
+    return ((session or db.session).query(Expense.date, Expense.name, Expense.amount, Expense.category, Expense.text)
+            .filter(Expense.user_id == user_id, *filters)
+            .order_by(Expense.date, Expense.id))
+
+
+def export_expenses(query, fmt, chunk_size=500):
+    """Yield the file in text chunks as rows are read from the database."""
+    rows = query.yield_per(chunk_size)
+    if fmt == 'csv':
+        out = io.StringIO()
+        writer = csv.writer(out)
+        writer.writerow(COLUMNS)
+        for number, row in enumerate(rows, 1):
+            writer.writerow((row.date.isoformat(), row.name, row.amount, row.category or '', row.text or ''))
+            if number % chunk_size == 0:
+                yield out.getvalue()
+                out.seek(0)
+                out.truncate()
+        yield out.getvalue()
+        return
+
+    def as_json(row):
+        return json.dumps(dict(date=row.date.isoformat(), name=row.name, amount=row.amount,
+                               category=row.category, text=row.text))
+
+    if fmt == 'jsonl':
+        buffer = []
+        for row in rows:
+            buffer.append(as_json(row) + '\n')
+            if len(buffer) == chunk_size:
+                yield ''.join(buffer)
+                buffer = []
+        yield ''.join(buffer)
+        return
+
+    yield '['
+    buffer, first = [], True
+    for row in rows:
+        buffer.append(as_json(row))
+        if len(buffer) == chunk_size:
+            yield ('' if first else ',') + ',\n'.join(buffer)
+            buffer, first = [], False
+    if buffer:
+        yield ('' if first else ',') + ',\n'.join(buffer)
+    yield ']\n'
+
+
+# ---------- CLI ----------
+def _user_id(email):
+    user = User.query.filter_by(email=email).first()
+    if user is None:
+        raise click.BadParameter(f"No user with email {email}", param_hint='--email')
+    return user.id
+
+
+@click.command('import-expenses')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--email', required=True, help='Owner of the imported expenses.')
+@click.option('--format', 'fmt', type=click.Choice(FORMATS), default=None,
+              help='Defaults to the file extension.')
+@click.option('--batch-size', type=int, default=None)
+@click.option('--dry-run', is_flag=True, help='Validate only; insert nothing.')
+@with_appcontext
+def import_expenses_command(path, email, fmt, batch_size, dry_run):
+    """Import expenses from a CSV, JSON or JSON Lines file."""
+    user_id = _user_id(email)
+    with open(path, 'rb') as stream:
+        result = import_expenses(user_id, stream, fmt or guess_format(path),
+                                 batch_size or current_app.config['BULK_BATCH_SIZE'],
+                                 current_app.config['BULK_MAX_ERRORS'], dry_run)
+    for error in result['errors']:
+        click.echo(f"row {error['row']}: {error['error']}", err=True)
+    verb = 'Would import' if dry_run else 'Imported'
+    click.echo(f"{verb} {result['imported']} expenses, {result['failed']} rows failed.")
+    if result['imported'] and not dry_run:
+        expenses_changed.send(current_app._get_current_object(), user_id=user_id)
+    if 'message' in result:
+        raise click.ClickException(result['message'])
+
+
+@click.command('export-expenses')
+@click.option('--email', required=True)
+@click.option('--format', 'fmt', type=click.Choice(FORMATS), default='csv')
+@click.option('--output', '-o', type=click.File('w', encoding='utf-8'), default='-')
+@with_appcontext
+def export_expenses_command(email, fmt, output):
+    """Write a user's expenses as CSV, JSON or JSON Lines."""
+    for chunk in export_expenses(export_query(_user_id(email)), fmt):
+        output.write(chunk)
@@ -1,13 +1,30 @@
 import os
+import shutil
 
 # Get the absolute path of the directory where this file is
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
 
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or '4fb6a3d56aacbdc28fa545785879d90a' # Use an env variable in production
-    SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(BASE_DIR, '..', 'instance', 'app.db')
+    # DATABASE_URL to leave SQLite; DATABASE_READ_URL for a read replica
+    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///' + os.path.join(BASE_DIR, '..', 'instance', 'app.db')
+    DATABASE_READ_URL = os.environ.get('DATABASE_READ_URL')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+    # Connection pools (see database.py): read/write, and read-only for streams
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 10))
+    DB_READ_POOL_SIZE = int(os.environ.get('DB_READ_POOL_SIZE', 5))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 10))
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+
+    # SQLite connection pragmas (see database.py)
+    SQLITE_JOURNAL_MODE = os.environ.get('SQLITE_JOURNAL_MODE', 'WAL')
+    SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')
+    SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 10000))
+    SQLITE_CACHE_SIZE_KB = int(os.environ.get('SQLITE_CACHE_SIZE_KB', 64 * 1024))
+    SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+    SQLITE_IMMEDIATE_WRITES = os.environ.get('SQLITE_IMMEDIATE_WRITES', '1') == '1'
+
     
     # This is for RECEIPTS (unchanged)
     UPLOAD_FOLDER = os.path.join(BASE_DIR, '..', 'uploads') 
@@ -15,5 +32,125 @@ class Config:
     # ADD THIS: This is for PROFILE PICS
     PROFILE_PIC_FOLDER = os.path.join(BASE_DIR, 'static', 'profile_pics')
 
-    # Tesseract config
-    TESSERACT_CMD = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
\ No newline at end of file
+    # Tesseract config; OCR_ENGINE is auto, tesserocr or pytesseract (see ocr_engine.py)
+    TESSERACT_CMD = os.environ.get('TESSERACT_CMD') or shutil.which('tesseract') or r"C:\Program Files\Tesseract-OCR\tesseract.exe"
+    OCR_ENGINE = os.environ.get('OCR_ENGINE', 'auto')
+    OCR_LANG = os.environ.get('OCR_LANG', 'eng')
+    OCR_TESSDATA = os.environ.get('OCR_TESSDATA')
+    OCR_WORDS = os.environ.get('OCR_WORDS') == '1'
+
+    # OCR job queue: worker processes and how many uploads may wait for one
+    OCR_WORKERS = int(os.environ.get('OCR_WORKERS', os.cpu_count() or 2))
+    OCR_QUEUE_SIZE = int(os.environ.get('OCR_QUEUE_SIZE', 32))
+    # Re-queue jobs a restart left behind (see jobs.py)
+    OCR_RESUME_JOBS = os.environ.get('OCR_RESUME_JOBS', '1') == '1'
+
+    # PDF receipts: render DPI, page limit and pages OCR'd at once (0 = auto)
+    OCR_PDF_DPI = int(os.environ.get('OCR_PDF_DPI', 300))
+    OCR_PDF_MAX_PAGES = int(os.environ.get('OCR_PDF_MAX_PAGES', 20))
+    OCR_PDF_PAGES_IN_FLIGHT = int(os.environ.get('OCR_PDF_PAGES_IN_FLIGHT', 0))
+
+    # Image cleanup before Tesseract (see preprocess.py)
+    OCR_PREPROCESS = [step for step in os.environ.get('OCR_PREPROCESS', 'exif,grayscale,crop,downscale').split(',') if step]
+    OCR_TARGET_DPI = int(os.environ.get('OCR_TARGET_DPI', 300))
+    OCR_RECEIPT_WIDTH_IN = float(os.environ.get('OCR_RECEIPT_WIDTH_IN', 3.15))
+
+    # OCR result cache size, and how often a hit updates its last-use time
+    OCR_CACHE_MAX_BYTES = int(os.environ.get('OCR_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+    OCR_CACHE_TOUCH_SECONDS = int(os.environ.get('OCR_CACHE_TOUCH_SECONDS', 600))
+
+    # /expenses and /api/expenses paging; the API streams rows in chunks
+    EXPENSES_PAGE_SIZE = int(os.environ.get('EXPENSES_PAGE_SIZE', 50))
+    EXPENSES_MAX_PAGE_SIZE = int(os.environ.get('EXPENSES_MAX_PAGE_SIZE', 1000))
+    EXPENSES_STREAM_CHUNK = int(os.environ.get('EXPENSES_STREAM_CHUNK', 200))
+
+    # Dashboard live updates (server-sent events, see events.py)
+    SSE_MAX_STREAMS = int(os.environ.get('SSE_MAX_STREAMS', 100))
+    SSE_MAX_STREAMS_PER_USER = int(os.environ.get('SSE_MAX_STREAMS_PER_USER', 5))
+    SSE_KEEPALIVE = int(os.environ.get('SSE_KEEPALIVE', 20))
+    SSE_RETRY_MS = int(os.environ.get('SSE_RETRY_MS', 5000))
+    SSE_QUEUE_SIZE = int(os.environ.get('SSE_QUEUE_SIZE', 16))
+    SSE_POLL_SECONDS = float(os.environ.get('SSE_POLL_SECONDS', 3))
+
+    # Spending insights for /analytics/insights (see insights.py)
+    INSIGHTS_DAYS = int(os.environ.get('INSIGHTS_DAYS', 90))
+    INSIGHTS_MONTHS = int(os.environ.get('INSIGHTS_MONTHS', 12))
+    INSIGHTS_Z_THRESHOLD = float(os.environ.get('INSIGHTS_Z_THRESHOLD', 3.0))
+    INSIGHTS_MIN_SAMPLES = int(os.environ.get('INSIGHTS_MIN_SAMPLES', 5))
+    INSIGHTS_MAX_ANOMALIES = int(os.environ.get('INSIGHTS_MAX_ANOMALIES', 20))
+    INSIGHTS_CACHE_SIZE = int(os.environ.get('INSIGHTS_CACHE_SIZE', 256))
+
+    # Bulk import: rows per transaction, and bad rows listed in the result
+    BULK_BATCH_SIZE = int(os.environ.get('BULK_BATCH_SIZE', 1000))
+    BULK_MAX_ERRORS = int(os.environ.get('BULK_MAX_ERRORS', 100))
+
+    # Upload limits and receipt storage (see store.py)
+    MAX_CONTENT_LENGTH = int(os.environ.get('MAX_CONTENT_LENGTH', 25 * 1024 * 1024))
+    BULK_MAX_BYTES = int(os.environ.get('BULK_MAX_BYTES', 256 * 1024 * 1024))
+    UPLOAD_SPOOL_BYTES = int(os.environ.get('UPLOAD_SPOOL_BYTES', 1024 * 1024))
+    UPLOAD_WRITERS = int(os.environ.get('UPLOAD_WRITERS', 2))
+    RECEIPT_MAX_PIXELS = int(os.environ.get('RECEIPT_MAX_PIXELS', 60_000_000))
+
+    # Batch receipt upload (/upload_receipts)
+    BATCH_MAX_FILES = int(os.environ.get('BATCH_MAX_FILES', 30))
+    BATCH_MAX_FILE_BYTES = int(os.environ.get('BATCH_MAX_FILE_BYTES', 20 * 1024 * 1024))
+    BATCH_TIMEOUT = int(os.environ.get('BATCH_TIMEOUT', 300))
+
+    # Resized copies of profile pictures and receipts (see images.py)
+    IMAGE_CACHE_FOLDER = os.environ.get('IMAGE_CACHE_FOLDER') or os.path.join(BASE_DIR, '..', 'instance', 'images')
+    IMAGE_SIZES = [int(size) for size in os.environ.get('IMAGE_SIZES', '96,256,768').split(',')]
+    IMAGE_WORKERS = int(os.environ.get('IMAGE_WORKERS', 2))
+    IMAGE_RENDER_TIMEOUT = int(os.environ.get('IMAGE_RENDER_TIMEOUT', 10))
+    IMAGE_MAX_AGE = int(os.environ.get('IMAGE_MAX_AGE', 365 * 24 * 3600))
+    PROFILE_PIC_MAX_SIZE = int(os.environ.get('PROFILE_PIC_MAX_SIZE', 1024))
+
+    # Metrics, slow-request log and profiler (see instrumentation.py)
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') == '1'
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+    SLOW_REQUEST_MS = int(os.environ.get('SLOW_REQUEST_MS', 1000))
+    PROFILER_ENABLED = os.environ.get('PROFILER_ENABLED') == '1'
+    PROFILER_INTERVAL_MS = int(os.environ.get('PROFILER_INTERVAL_MS', 5))
+    PROFILE_FOLDER = os.environ.get('PROFILE_FOLDER') or os.path.join(BASE_DIR, '..', 'instance', 'profiles')
+    PROFILE_MAX_FILES = int(os.environ.get('PROFILE_MAX_FILES', 200))
+
+    # Signed-in user cache for @login_required (see auth.py)
+    USER_CACHE_SIZE = int(os.environ.get('USER_CACHE_SIZE', 1024))
+    USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', 60))
+
+    # Password hashing and login throttling (see passwords.py)
+    BCRYPT_LOG_ROUNDS = int(os.environ.get('BCRYPT_LOG_ROUNDS', 12))
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', max(1, (os.cpu_count() or 2) // 2)))
+    PASSWORD_HASH_QUEUE = int(os.environ.get('PASSWORD_HASH_QUEUE', 16))
+    PASSWORD_QUEUE_TIMEOUT = float(os.environ.get('PASSWORD_QUEUE_TIMEOUT', 5))
+    LOGIN_MAX_PER_IP = int(os.environ.get('LOGIN_MAX_PER_IP', 30))
+    LOGIN_MAX_PER_ACCOUNT = int(os.environ.get('LOGIN_MAX_PER_ACCOUNT', 10))
+    LOGIN_RATE_WINDOW = int(os.environ.get('LOGIN_RATE_WINDOW', 300))
+
+    # Rendered page cache: memory, redis or none (see page_cache.py)
+    RESPONSE_CACHE_BACKEND = os.environ.get('RESPONSE_CACHE_BACKEND', 'memory')
+    RESPONSE_CACHE_MAX_BYTES = int(os.environ.get('RESPONSE_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+    RESPONSE_CACHE_URL = os.environ.get('RESPONSE_CACHE_URL', 'redis://localhost:6379/0')
+    RESPONSE_CACHE_TTL = int(os.environ.get('RESPONSE_CACHE_TTL', 3600))
+
+    # Static assets built by `flask build-assets` (see assets.py)
+    ASSETS_CDN_FALLBACK = os.environ.get('ASSETS_CDN_FALLBACK', '1') == '1'
+    ASSETS_MAX_AGE = int(os.environ.get('ASSETS_MAX_AGE', 365 * 24 * 3600))
+    TAILWIND_CMD = os.environ.get('TAILWIND_CMD') or shutil.which('tailwindcss')
+
+    # Create tables and run migrations in create_app() (see server.py)
+    DB_SETUP_ON_START = os.environ.get('DB_SETUP_ON_START', '1') == '1'
+
+    # Production server: python -m project.server (see server.py)
+    SERVER_BIND = os.environ.get('SERVER_BIND', f"0.0.0.0:{os.environ.get('PORT', 8000)}")
+    SERVER_WORKERS = int(os.environ.get('SERVER_WORKERS', os.cpu_count() or 1))
+    SERVER_THREADS = int(os.environ.get('SERVER_THREADS', 16))
+    SERVER_MAX_REQUESTS = int(os.environ.get('SERVER_MAX_REQUESTS', 2000))
+    SERVER_MAX_REQUESTS_JITTER = int(os.environ.get('SERVER_MAX_REQUESTS_JITTER', 200))
+    SERVER_TIMEOUT = int(os.environ.get('SERVER_TIMEOUT', 120))
+    SERVER_GRACEFUL_TIMEOUT = int(os.environ.get('SERVER_GRACEFUL_TIMEOUT', 60))
+    SERVER_KEEPALIVE = int(os.environ.get('SERVER_KEEPALIVE', 5))
+    SERVER_PIDFILE = os.environ.get('SERVER_PIDFILE')
+    SERVER_ACCESS_LOG = os.environ.get('SERVER_ACCESS_LOG', '-')  # '-' = stdout; '' = off
+
+    # Reverse proxies whose X-Forwarded-* headers are trusted (0 = none)
+    TRUSTED_PROXIES = int(os.environ.get('TRUSTED_PROXIES', 0))
@@ -0,0 +1,127 @@
+from flask import current_app, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from . import db
+
+READ_BIND = 'read'
+READ_ONLY_METHODS = {'GET', 'HEAD', 'OPTIONS'}
+
+
+# ---------- ENGINE OPTIONS ----------
+def normalize_url(url):
+    # Heroku-style postgres:// URLs are rejected by SQLAlchemy 2
+    if url.startswith('postgres://'):
+        return 'postgresql://' + url[len('postgres://'):]
+    return url
+
+
+def engine_options(config, url, pool_size):
+    if url.startswith('sqlite'):
+        # The busy timeout is set as a pragma on connect (see set_sqlite_pragmas)
+        return dict(pool_size=pool_size, max_overflow=0,
+                    connect_args=dict(check_same_thread=False))
+    return dict(pool_size=pool_size, max_overflow=config['DB_MAX_OVERFLOW'],
+                pool_pre_ping=True, pool_recycle=config['DB_POOL_RECYCLE'])
+
+
+def configure(app):
+    """Fill in the SQLAlchemy engine settings before db.init_app().
+
+    The default engine is the read/write one. A second engine, bound as
+    'read', serves long read-only work (streamed lists and exports) from
+    its own pool, optionally against a replica (DATABASE_READ_URL).
+    """
+    config = app.config
+    url = normalize_url(config['SQLALCHEMY_DATABASE_URI'])
+    read_url = normalize_url(config.get('DATABASE_READ_URL') or url)
+    config['SQLALCHEMY_DATABASE_URI'] = url
+    config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {})
+    for key, value in engine_options(config, url, config['DB_POOL_SIZE']).items():
+        config['SQLALCHEMY_ENGINE_OPTIONS'].setdefault(key, value)
+    binds = config.setdefault('SQLALCHEMY_BINDS', {})
+    binds.setdefault(READ_BIND, dict(url=read_url, **engine_options(config, read_url, config['DB_READ_POOL_SIZE'])))
+
+
+# ---------- SQLITE ----------
+def sqlite_pragmas(config, read_only=False):
+    pragmas = [
+        f"PRAGMA journal_mode={config['SQLITE_JOURNAL_MODE']}",
+        f"PRAGMA synchronous={config['SQLITE_SYNCHRONOUS']}",
+        f"PRAGMA busy_timeout={int(config['SQLITE_BUSY_TIMEOUT_MS'])}",
+        f"PRAGMA cache_size=-{int(config['SQLITE_CACHE_SIZE_KB'])}",
+        f"PRAGMA mmap_size={int(config['SQLITE_MMAP_SIZE'])}",
+        "PRAGMA temp_store=MEMORY",
+    ]
+    if read_only:
+        pragmas.append("PRAGMA query_only=ON")
+    return pragmas
+
+
+def writing():
+    """Will this transaction (probably) write?
+
+    Safe-method requests and views marked @reads_only are assumed not to.
+    """
+    if not has_request_context():
+        return True
+    if request.method in READ_ONLY_METHODS:
+        return False
+    view = current_app.view_functions.get(request.endpoint)
+    return not getattr(view, 'reads_only', False)
+
+
+def reads_only(view):
+    """Mark a POST view that never writes, so it doesn't take the write lock."""
+    view.reads_only = True
+    return view
+
+
+def end_transaction():
+    """Finish the current transaction before slow work (password hashing).
+
+    A POST takes the SQLite write lock at its first query; without this it
+    would hold it, and block every other writer, for the whole hash.
+    """
+    db.session.commit()
+
+
+def tune_sqlite(engine, config, read_only=False):
+    pragmas = sqlite_pragmas(config, read_only)
+    immediate = config['SQLITE_IMMEDIATE_WRITES'] and not read_only
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        # Let SQLAlchemy, not the sqlite3 module, decide when BEGIN happens
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+    @event.listens_for(engine, 'begin')
+    def begin(conn):
+        # A transaction that reads and then writes has to upgrade its lock,
+        # and in WAL mode that fails at once ("database is locked") if
+        # another writer committed in between - the busy timeout can't help.
+        # BEGIN IMMEDIATE takes the write lock up front (waiting up to the
+        # busy timeout for it), so writers queue instead of failing.
+        conn.exec_driver_sql('BEGIN IMMEDIATE' if immediate and writing() else 'BEGIN')
+
+
+def init_db(app):
+    """db.init_app() plus connection tuning for each engine."""
+    configure(app)
+    db.init_app(app)
+    with app.app_context():
+        for key, engine in db.engines.items():
+            if engine.dialect.name == 'sqlite' and engine.url.database not in (None, '', ':memory:'):
+                tune_sqlite(engine, app.config, read_only=key == READ_BIND)
+
+
+# ---------- READ SESSIONS ----------
+def read_session():
+    """A session on the read pool, for long read-only queries and streams.
+
+    The caller closes it (or uses it as a context manager).
+    """
+    return Session(db.engines[READ_BIND])
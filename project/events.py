@@ -0,0 +1,165 @@
+import json
+import queue
+import threading
+import time
+from datetime import datetime, timedelta
+from . import analytics, db
+from .models import OcrJob, UserSummary
+from .signals import expenses_changed
+
+
+class TooManyStreams(Exception):
+    """Raised when the server (or one user) already has the maximum open streams."""
+
+
+class EventBroker:
+    """Per-user server-sent event streams for the dashboard.
+
+    Writers call publish()/stats_changed() after they commit; every open
+    stream of that user gets the message. Nothing is computed or sent for
+    users with no open stream, and an idle stream only wakes up to send a
+    keepalive comment.
+
+    Subscribers live in this process only. Changes made by other
+    processes (other server workers, `flask import-expenses`) are picked
+    up by one watcher thread per process, which every SSE_POLL_SECONDS
+    checks the UserSummary.version and finished OCR jobs of the users with
+    a stream open here. Those arrive up to that late, and may repeat a
+    push already made in this process.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._streams = {}  # user_id -> set of queues
+        self._count = 0
+        self._lock = threading.Lock()
+        self._watcher = None
+        self._versions = {}  # user_id -> UserSummary.version last seen by the watcher
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.extensions['events'] = self
+        expenses_changed.connect(self._on_expenses_changed, app)
+
+    def _on_expenses_changed(self, app, user_id):
+        self.stats_changed(user_id)
+
+    # ---------- SUBSCRIBERS ----------
+    def subscribe(self, user_id):
+        config = self.app.config
+        with self._lock:
+            user_streams = self._streams.setdefault(user_id, set())
+            if (self._count >= config['SSE_MAX_STREAMS']
+                    or len(user_streams) >= config['SSE_MAX_STREAMS_PER_USER']):
+                if not user_streams:
+                    del self._streams[user_id]
+                raise TooManyStreams()
+            inbox = queue.Queue(maxsize=config['SSE_QUEUE_SIZE'])
+            user_streams.add(inbox)
+            self._count += 1
+            if self._watcher is None and config['SSE_POLL_SECONDS'] > 0:
+                self._watcher = threading.Thread(target=self._watch, name='sse-watcher', daemon=True)
+                self._watcher.start()
+        return inbox
+
+    def unsubscribe(self, user_id, inbox):
+        with self._lock:
+            user_streams = self._streams.get(user_id)
+            if user_streams is None or inbox not in user_streams:
+                return
+            user_streams.discard(inbox)
+            if not user_streams:
+                del self._streams[user_id]
+            self._count -= 1
+
+    def has_subscribers(self, user_id):
+        return user_id in self._streams
+
+    def stats(self):
+        """Connection gauge: open streams overall and users with one open."""
+        with self._lock:
+            return dict(open_streams=self._count, users=len(self._streams),
+                        max_streams=self.app.config['SSE_MAX_STREAMS'])
+
+    # ---------- PUBLISHING ----------
+    def publish(self, user_id, event, data):
+        with self._lock:
+            inboxes = list(self._streams.get(user_id, ()))
+        message = format_event(event, data)
+        for inbox in inboxes:
+            try:
+                inbox.put_nowait(message)
+            except queue.Full:
+                # A stalled client; it gets a fresh snapshot when it reconnects
+                pass
+
+    def stats_changed(self, user_id):
+        """Push the user's dashboard numbers (read from the summary tables)."""
+        if self.has_subscribers(user_id):
+            self.publish(user_id, 'stats', analytics.dashboard_stats(user_id))
+
+    def stream(self, user_id, inbox, first_message=None):
+        """The response body of one stream: its messages until the client goes away."""
+        keepalive = self.app.config['SSE_KEEPALIVE']
+        try:
+            yield f"retry: {self.app.config['SSE_RETRY_MS']}\n\n"
+            if first_message:
+                yield first_message
+            while True:
+                try:
+                    yield inbox.get(timeout=keepalive)
+                except queue.Empty:
+                    # Comment line; also how we notice the client has gone
+                    yield ": keepalive\n\n"
+        finally:
+            self.unsubscribe(user_id, inbox)
+
+    # ---------- OTHER PROCESSES ----------
+    def _watch(self):
+        interval = self.app.config['SSE_POLL_SECONDS']
+        since = datetime.utcnow()
+        while True:
+            time.sleep(interval)
+            with self._lock:
+                users = list(self._streams)
+            if not users:
+                self._versions.clear()
+                since = datetime.utcnow()
+                continue
+            try:
+                with self.app.app_context():
+                    since = self.poll(users, since, timedelta(seconds=interval))
+            except Exception:
+                self.app.logger.exception("Could not check for changes from other processes")
+
+    def poll(self, users, since, overlap):
+        """Push stats to `users` whose version changed (or hasn't been seen
+        yet) and the jobs they had finish since `since`, minus `overlap` for
+        commits that landed after their finished_at was set. Returns the
+        time to pass as `since` next."""
+        now = datetime.utcnow()
+        rows = (db.session.query(UserSummary.user_id, UserSummary.version)
+                .filter(UserSummary.user_id.in_(users)).all())
+        jobs = (db.session.query(OcrJob.id, OcrJob.user_id, OcrJob.status)
+                .filter(OcrJob.user_id.in_(users), OcrJob.finished_at >= since - overlap).all())
+
+        versions = dict(rows)
+        for user_id in users:
+            version = versions.get(user_id, 0)
+            if self._versions.get(user_id) != version:
+                self._versions[user_id] = version
+                self.stats_changed(user_id)
+        for user_id in set(self._versions) - set(users):
+            del self._versions[user_id]
+        for job_id, user_id, status in jobs:
+            self.publish(user_id, 'job', dict(job_id=job_id, status=status))
+        return now
+
+
+def format_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+events = EventBroker()
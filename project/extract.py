@@ -0,0 +1,182 @@
+import re
+from datetime import date
+
+# ---------- PATTERNS (compiled once) ----------
+# Lines are lower-cased once and matched without IGNORECASE, which is
+# noticeably cheaper for the keyword alternations.
+
+# 1,234.56 / 1,00,000.00 (lakh grouping) / 1234,56 / ₹ 120 / Rs.450/- /
+# INR.250 / "Total:450" / "Total:-450" - but not the 18 in "18%" and not the
+# pieces of dates and times like 14/08/2024 or 21:14
+MONEY_RE = re.compile(
+    r'(?:(?<![\w.,/:-])|(?<=[a-z\s%]:)|(?<=[a-z\s%]:-)|(?<==))'
+    r'(?:(?:rs|inr)\.?|[\$₹€])?\s*'
+    r'(\d{1,3}(?:,\d{3})+|\d{1,2}(?:,\d{2})+,\d{3}|\d+)(?:[.,](\d{2}))?'
+    r'(?![\d%:])(?!/(?!-))(?![.,-]\d)(?!\s*%)'
+)
+
+# Alternatives only compete when they start at the same place, so the
+# specific ones come first: "Sub Total" and "Taxable Value" are not totals,
+# "Total GST" is tax, and "Tax Invoice No 12" or "GSTIN 29ABC..." are not
+# amounts at all
+KEYWORD_RE = re.compile(
+    r'(?P<subtotal>sub\s*-?\s*total|taxable\s*(?:value|amount))'
+    r'|(?P<ignore>total\s*(?:qty|quantity|items?|no\.?\s*of)|tax\s*invoice|(?:invoice|bill)\s*(?:no|#)|gstin)'
+    r'|(?P<tax>(?:total\s*)?(?:[cs]gst|igst|gst|vat|tax)\b)'
+    r'|(?P<grand>grand\s*total|total\s*(?:amount|due|payable)|amount\s*(?:due|payable)|net\s*(?:amount|payable))'
+    r'|(?P<total>total)'
+    r'|(?P<amount>amount)'
+)
+
+MONTHS = ('jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec')
+DATE_RE = re.compile(
+    r'(?P<iso>(?P<iy>\d{4})[-/.](?P<im>\d{1,2})[-/.](?P<id>\d{1,2}))'
+    r'|(?P<dmy>(?P<d>\d{1,2})[-/.](?P<m>\d{1,2})[-/.](?P<y>\d{4}|\d{2}))'
+    r'|(?P<text>(?P<td>\d{1,2})\s*(?P<tm>' + '|'.join(MONTHS) + r')[a-z]*\.?,?\s*(?P<ty>\d{4}|\d{2}))'
+)
+
+# "Paneer Tikka   2 x 180.00   360.00" -> description, optional qty, amount at the end
+ITEM_RE = re.compile(
+    r'^(?P<name>[A-Za-z][A-Za-z0-9&().\'/ -]*?[A-Za-z).])\s+'
+    r'(?:(?P<qty>\d{1,3})\s*(?:[xX@*]|nos?|pcs?)?\s+)?'
+    r'(?:(?:[Rr]s\.?|INR\.?|[\$₹€])?\s*\d+(?:[.,]\d{2})?\s+)?'
+    r'(?:[Rr]s\.?|INR\.?|[\$₹€])?\s*\d[\d,]*(?:[.,]\d{2})?(?:/-)?\s*$'
+)
+
+LETTERS_RE = re.compile(r'[A-Za-z]')
+DATE_LABEL_RE = re.compile(r'date|dt\b')
+NOT_MERCHANT_RE = re.compile(
+    r'invoice|receipt|bill\s*(?:no|#)|tax|gst|tel|phone|ph\.?:|www\.|@|date|cash\s*memo'
+)
+
+# How much each kind of total line is trusted
+TOTAL_CONFIDENCE = {'grand': 0.9, 'total': 0.8, 'amount': 0.6}
+
+
+# ---------- HELPERS ----------
+def _money_values(line):
+    return [float(whole.replace(',', '') + '.' + (cents or '0'))
+            for whole, cents in MONEY_RE.findall(line)]
+
+
+def _parse_date(match):
+    try:
+        if match.group('iso'):
+            return date(int(match.group('iy')), int(match.group('im')), int(match.group('id')))
+        if match.group('dmy'):
+            year = int(match.group('y'))
+            year = year + 2000 if year < 100 else year
+            return date(year, int(match.group('m')), int(match.group('d')))
+        year = int(match.group('ty'))
+        year = year + 2000 if year < 100 else year
+        return date(year, MONTHS.index(match.group('tm')[:3]) + 1, int(match.group('td')))
+    except ValueError:
+        # e.g. 31/02 or a US-style month/day we can't place
+        return None
+
+
+def _close(a, b):
+    return abs(a - b) <= max(0.02, 0.01 * b)
+
+
+# ---------- EXTRACTOR ----------
+def extract_fields(text_data):
+    """Pull merchant, total, date, tax and line items out of OCR text.
+
+    Every line is tokenized once. Each field comes back with a 0-1
+    confidence in fields['confidence'] (items carry their own).
+    """
+    first_line = None
+    merchant = None
+    merchant_confidence = 0.0
+    receipt_date = None
+    date_confidence = 0.0
+    subtotal = None
+    tax_total = 0.0
+    tax_found = False
+    total = None
+    total_kind = None
+    largest = 0.0
+    items = []
+
+    for position, raw_line in enumerate(text_data.splitlines()):
+        line = raw_line.strip()
+        if not line:
+            continue
+        if first_line is None:
+            first_line = line
+        lower = line.lower()
+
+        if receipt_date is None:
+            date_match = DATE_RE.search(lower)
+            if date_match:
+                receipt_date = _parse_date(date_match)
+                date_confidence = 0.9 if DATE_LABEL_RE.search(lower) else 0.7
+
+        values = _money_values(lower)
+        if values:
+            largest = max(largest, max(values))
+
+        if merchant is None and not values and LETTERS_RE.search(line) and not NOT_MERCHANT_RE.search(lower):
+            merchant = line
+            # The name is usually the very first line, often in capitals
+            merchant_confidence = 0.8 if position < 3 else 0.5
+            if line.isupper():
+                merchant_confidence += 0.1
+            continue
+
+        if not values:
+            continue
+
+        keyword = KEYWORD_RE.search(lower)
+        kind = keyword.lastgroup if keyword else None
+        if kind == 'ignore':
+            continue
+        if kind == 'subtotal':
+            subtotal = max(values)
+        elif kind in TOTAL_CONFIDENCE:
+            # Prefer the strongest kind of total line; among equals, the lowest one
+            if total_kind is None or TOTAL_CONFIDENCE[kind] >= TOTAL_CONFIDENCE[total_kind]:
+                total, total_kind = max(values), kind
+        elif kind == 'tax':
+            tax_total += values[-1]
+            tax_found = True
+        elif total_kind is None:
+            item = ITEM_RE.match(line)
+            if item:
+                items.append(dict(
+                    name=item.group('name').strip(),
+                    quantity=int(item.group('qty')) if item.group('qty') else 1,
+                    amount=values[-1],
+                    confidence=0.6 if len(values) > 1 else 0.5,
+                ))
+
+    if merchant is None and first_line is not None:
+        merchant, merchant_confidence = first_line, 0.3
+
+    if total is not None:
+        total_confidence = TOTAL_CONFIDENCE[total_kind]
+        # Cross-checks: subtotal + tax or the items adding up to the total
+        if subtotal is not None and _close(subtotal + tax_total, total):
+            total_confidence = 0.95
+        elif items and _close(sum(item['amount'] for item in items), total):
+            total_confidence = max(total_confidence, 0.9)
+    elif largest:
+        # No total line: fall back to the largest number on the receipt
+        total, total_confidence = largest, 0.3
+    else:
+        total_confidence = 0.0
+
+    return dict(
+        merchant=merchant,
+        total=total,
+        date=receipt_date.isoformat() if receipt_date else None,
+        tax=round(tax_total, 2) if tax_found else None,
+        items=items,
+        confidence=dict(
+            merchant=round(min(merchant_confidence, 1.0), 2),
+            total=total_confidence,
+            date=date_confidence if receipt_date else 0.0,
+            tax=0.7 if tax_found else 0.0,
+        ),
+    )
@@ -0,0 +1,233 @@
+import io
+import os
+import re
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from flask import url_for
+from PIL import Image, ImageOps
+from pdf2image import convert_from_path
+from .store import ArchiveEntry, check_pixels, save_upload, shard_path
+
+# URL extension -> (Pillow format, mimetype, save options)
+FORMATS = {
+    'webp': ('WEBP', 'image/webp', dict(quality=80, method=4)),
+    'jpg': ('JPEG', 'image/jpeg', dict(quality=82, optimize=True, progressive=True)),
+}
+RECEIPT_NAME = re.compile(r'[0-9a-f]{64}\.(png|jpg|jpeg|pdf)')
+PROFILE_NAME = re.compile(r'[\w.-]+\.(png|jpg|jpeg)')
+
+
+# ---------- RENDERING ----------
+# Plain functions of paths and numbers: they run on the pool's threads,
+# outside any app context.
+def _save(image, path, fmt, **options):
+    # Write next to the target and rename, so readers never see half a file
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            image.save(out, fmt, **options)
+        os.replace(tmp_path, path)
+    except Exception:
+        os.remove(tmp_path)
+        raise
+
+
+def _flatten(image):
+    """RGB (or RGBA when the image has transparency) for the encoders."""
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        return image.convert('RGBA')
+    return image.convert('RGB')
+
+
+def _on_white(image):
+    if image.mode != 'RGBA':
+        return image
+    flat = Image.new('RGB', image.size, 'white')
+    flat.paste(image, mask=image.getchannel('A'))
+    return flat
+
+
+def shrink(image, max_size):
+    """The image upright and at most max_size px a side, encoded in its own format."""
+    fmt = image.format
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail((max_size, max_size), Image.LANCZOS)
+    out = io.BytesIO()
+    image.save(out, fmt, **(dict(quality=90, optimize=True) if fmt == 'JPEG' else dict(optimize=True)))
+    return out.getvalue()
+
+
+def render(source, target_dir, sizes):
+    """Write every size x format of `source` to target_dir/<size>.<ext>.
+
+    Sizes are bounding boxes; images are never scaled up. The source is
+    only read. PDFs get a preview of page one.
+    """
+    largest = max(sizes)
+    if source.lower().endswith('.pdf'):
+        image = convert_from_path(source, first_page=1, last_page=1, size=largest)[0]
+    else:
+        image = Image.open(source)
+        # JPEGs decode straight at 1/2, 1/4 or 1/8 scale when that is
+        # still at least as big as the largest copy
+        image.draft('RGB', (largest, largest))
+        image = ImageOps.exif_transpose(image)
+    image = _flatten(image)
+
+    os.makedirs(target_dir, exist_ok=True)
+    # Largest first, each one resized from the last
+    for size in sorted(sizes, reverse=True):
+        image.thumbnail((size, size), Image.LANCZOS)
+        for ext, (fmt, _, options) in FORMATS.items():
+            _save(image if fmt != 'JPEG' else _on_white(image),
+                  os.path.join(target_dir, f'{size}.{ext}'), fmt, **options)
+
+
+def is_image(path):
+    try:
+        with Image.open(path) as image:
+            image.verify()
+        return True
+    except Exception:
+        return False
+
+
+# ---------- SERVICE ----------
+class ImageService:
+    """Resized copies of profile pictures and receipts, made in a thread pool.
+
+    Copies live under IMAGE_CACHE_FOLDER/<kind>/<name>/<size>.<ext>. Source
+    names never change content (receipts are content-addressed, new profile
+    pictures get a new name), so each copy can be cached forever.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._executor = None
+        self._running = {}  # (kind, name) -> Future
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.extensions['images'] = self
+        app.add_template_global(self.url, 'image_url')
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.app.config['IMAGE_WORKERS'],
+                                                thread_name_prefix='images')
+        return self._executor
+
+    # ---- names and paths ----
+    def valid(self, kind, name, size, ext):
+        pattern = RECEIPT_NAME if kind == 'receipt' else PROFILE_NAME if kind == 'profile' else None
+        return (pattern is not None and pattern.fullmatch(name) is not None
+                and size in self.app.config['IMAGE_SIZES'] and ext in FORMATS)
+
+    def source_path(self, kind, name):
+        if kind == 'profile':
+            return os.path.join(self.app.config['PROFILE_PIC_FOLDER'], name)
+        digest, ext = name.split('.', 1)
+        return shard_path(self.app.config['UPLOAD_FOLDER'], digest, ext)
+
+    def folder(self, kind, name):
+        return os.path.join(self.app.config['IMAGE_CACHE_FOLDER'], kind, name)
+
+    def path(self, kind, name, size, ext):
+        return os.path.join(self.folder(kind, name), f'{size}.{ext}')
+
+    def url(self, kind, name, size, ext='webp'):
+        """Template helper; `name` may also be a stored receipt path."""
+        return url_for('main.image', kind=kind, name=os.path.basename(name), size=size, ext=ext)
+
+    @staticmethod
+    def etag(name, size, ext):
+        return f'{name}-{size}.{ext}'
+
+    @staticmethod
+    def mimetype(ext):
+        return FORMATS[ext][1]
+
+    def receipt_path(self, name):
+        """The stored receipt for a name handed out by upload_receipt, if it exists."""
+        if not name or not RECEIPT_NAME.fullmatch(name):
+            return None
+        path = self.source_path('receipt', name)
+        return path if os.path.exists(path) else None
+
+    # ---- work ----
+    def ensure(self, kind, name):
+        """Start making every copy of one image; returns its Future.
+
+        A request for an image that is already being worked on shares the
+        running job instead of starting another. Raises FileNotFoundError
+        when there is no such image.
+        """
+        key = (kind, name)
+        source = self.source_path(kind, name)
+        if not os.path.isfile(source):
+            raise FileNotFoundError(source)
+        with self._lock:
+            future = self._running.get(key)
+            if future is not None:
+                return future
+            future = self.executor.submit(render, source, self.folder(kind, name),
+                                          list(self.app.config['IMAGE_SIZES']))
+            self._running[key] = future
+        # Outside the lock: runs at once if the future is already done
+        future.add_done_callback(lambda f: self._done(key, f))
+        return future
+
+    def _done(self, key, future):
+        with self._lock:
+            if self._running.get(key) is future:
+                del self._running[key]
+
+    def discard(self, kind, name, source=False):
+        """Delete an image's copies (and with source=True, the original)."""
+        shutil.rmtree(self.folder(kind, name), ignore_errors=True)
+        if source:
+            try:
+                os.remove(self.source_path(kind, name))
+            except FileNotFoundError:
+                pass
+
+    def save_profile_picture(self, file, user_id):
+        """Store an uploaded profile picture under a content-derived name.
+
+        A picture bigger than PROFILE_PIC_MAX_SIZE is shrunk first, so the
+        name is that of the bytes stored. Returns the file name
+        (user_<id>_<hash>.<ext>), or raises ValueError if the file is not an
+        image (UploadTooLarge if it has more than RECEIPT_MAX_PIXELS pixels).
+        """
+        config = self.app.config
+
+        def path_for(folder, digest, ext):
+            return os.path.join(folder, f'user_{user_id}_{digest[:16]}.{ext}')
+
+        check_pixels(file.stream, config['RECEIPT_MAX_PIXELS'])
+        position = file.stream.tell()
+        with Image.open(file.stream) as image:
+            if max(image.size) > config['PROFILE_PIC_MAX_SIZE']:
+                file = ArchiveEntry(file.filename, io.BytesIO(shrink(image, config['PROFILE_PIC_MAX_SIZE'])))
+        if not isinstance(file, ArchiveEntry):
+            file.stream.seek(position)
+
+        _, path = save_upload(file, config['PROFILE_PIC_FOLDER'], path_for)
+        if not is_image(path):
+            os.remove(path)
+            raise ValueError("That file is not a valid image.")
+        return os.path.basename(path)
+
+    def shutdown(self, wait=True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+
+
+images = ImageService()
@@ -0,0 +1,183 @@
+import threading
+from collections import OrderedDict
+from datetime import datetime
+import numpy as np
+from . import db
+from .models import Expense
+from .signals import expenses_changed
+from .instrumentation import traced
+from .page_cache import data_version
+
+
+# ---------- FETCH ----------
+def fetch_columns(user_id):
+    """One query for the user's (id, date, amount, category) columns, as arrays."""
+    rows = (db.session.query(Expense.id, Expense.date, Expense.amount, Expense.category)
+            .filter(Expense.user_id == user_id).all())
+    if not rows:
+        return None
+    ids, dates, amounts, categories = zip(*rows)
+    return dict(
+        id=np.array(ids, dtype=np.int64),
+        date=np.array(dates, dtype='datetime64[D]'),
+        amount=np.array(amounts, dtype=np.float64),
+        category=np.array([category or 'Uncategorized' for category in categories], dtype=object),
+    )
+
+
+# ---------- CALCULATIONS ----------
+def rolling_spend(dates, amounts, today, days):
+    """Daily spend and trailing 7/30-day sums for the last `days` days."""
+    first = today - np.timedelta64(days + 30 - 1, 'D')
+    keep = (dates >= first) & (dates <= today)
+    offsets = (dates[keep] - first).astype(np.int64)
+    daily = np.bincount(offsets, weights=amounts[keep], minlength=days + 30)
+
+    # Window sums from one cumulative sum (cumulative[k] = daily[:k].sum())
+    cumulative = np.concatenate(([0.0], np.cumsum(daily)))
+    end = np.arange(30, days + 30) + 1
+    sum7 = cumulative[end] - cumulative[end - 7]
+    sum30 = cumulative[end] - cumulative[end - 30]
+    return daily[30:], sum7, sum30
+
+
+def monthly_totals(dates, amounts, today, months):
+    """Totals for the last `months` calendar months, oldest first."""
+    this_month = today.astype('datetime64[M]')
+    first = this_month - np.timedelta64(months - 1, 'M')
+    month_of = dates.astype('datetime64[M]')
+    keep = (month_of >= first) & (month_of <= this_month)
+    offsets = (month_of[keep] - first).astype(np.int64)
+    totals = np.bincount(offsets, weights=amounts[keep], minlength=months)
+    labels = np.arange(first, this_month + 1).astype(str)
+    return labels, totals
+
+
+def category_anomalies(columns, since, threshold, min_samples):
+    """Expenses (on or after `since`) far from their category's usual amount.
+
+    z = (amount - category mean) / category std, with mean and std taken
+    over all of the user's expenses in that category.
+    """
+    names, codes = np.unique(columns['category'], return_inverse=True)
+    amounts = columns['amount']
+    count = np.bincount(codes, minlength=len(names))
+    mean = np.bincount(codes, weights=amounts, minlength=len(names)) / count
+    mean_sq = np.bincount(codes, weights=amounts * amounts, minlength=len(names)) / count
+    std = np.sqrt(np.maximum(mean_sq - mean * mean, 0.0))
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z = (amounts - mean[codes]) / std[codes]
+    flagged = ((np.abs(z) >= threshold) & (count[codes] >= min_samples)
+               & (std[codes] > 0) & (columns['date'] >= since))
+    order = np.argsort(-np.abs(z[flagged]))
+    index = np.flatnonzero(flagged)[order]
+    return [dict(id=int(columns['id'][i]), date=str(columns['date'][i]),
+                 amount=float(amounts[i]), category=str(names[codes[i]]),
+                 category_mean=round(float(mean[codes[i]]), 2), z_score=round(float(z[i]), 2))
+            for i in index]
+
+
+def month_projection(dates, amounts, today, daily_rate):
+    """Spend so far this month plus the trailing daily rate for the days left."""
+    month_start = today.astype('datetime64[M]').astype('datetime64[D]')
+    next_month = (today.astype('datetime64[M]') + 1).astype('datetime64[D]')
+    so_far = float(amounts[(dates >= month_start) & (dates <= today)].sum())
+    days_left = int((next_month - today).astype(np.int64)) - 1
+    return dict(spent_so_far=round(so_far, 2), days_left=days_left,
+                daily_rate=round(daily_rate, 2),
+                projected_total=round(so_far + daily_rate * days_left, 2))
+
+
+@traced('insights')
+def compute(user_id, config, today=None):
+    """All insights for one user, as a JSON-ready dict."""
+    today = np.datetime64(today or datetime.utcnow().date(), 'D')
+    columns = fetch_columns(user_id)
+    if columns is None:
+        dates, amounts = np.array([], dtype='datetime64[D]'), np.array([], dtype=np.float64)
+    else:
+        dates, amounts = columns['date'], columns['amount']
+    days = config['INSIGHTS_DAYS']
+
+    daily, sum7, sum30 = rolling_spend(dates, amounts, today, days)
+    series_dates = np.arange(today - np.timedelta64(days - 1, 'D'), today + 1).astype(str)
+
+    labels, totals = monthly_totals(dates, amounts, today, config['INSIGHTS_MONTHS'])
+    previous = np.concatenate(([np.nan], totals[:-1]))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        change_pct = np.where(previous > 0, (totals - previous) / previous * 100, np.nan)
+
+    anomalies = []
+    if columns is not None:
+        since = today - np.timedelta64(days - 1, 'D')
+        anomalies = category_anomalies(columns, since, config['INSIGHTS_Z_THRESHOLD'],
+                                       config['INSIGHTS_MIN_SAMPLES'])
+
+    return dict(
+        as_of=str(today),
+        rolling=dict(
+            last_7_days=round(float(sum7[-1]), 2),
+            last_30_days=round(float(sum30[-1]), 2),
+            series=[dict(date=d, spent=round(float(s), 2),
+                         avg_7=round(float(a7) / 7, 2), avg_30=round(float(a30) / 30, 2))
+                    for d, s, a7, a30 in zip(series_dates, daily, sum7, sum30)],
+        ),
+        months=[dict(month=label, total=round(float(total), 2),
+                     change=None if np.isnan(prev) else round(float(total - prev), 2),
+                     change_pct=None if np.isnan(pct) else round(float(pct), 1))
+                for label, total, prev, pct in zip(labels, totals, previous, change_pct)],
+        anomalies=anomalies[:config['INSIGHTS_MAX_ANOMALIES']],
+        projection=month_projection(dates, amounts, today, float(sum30[-1]) / 30),
+    )
+
+
+# ---------- CACHE ----------
+class InsightsCache:
+    """Last computed insights per user, for the user's current data version.
+
+    Entries are keyed by UserSummary.version (bumped by every expense write,
+    from any process) and the UTC day, so rolling windows move on at
+    midnight. Writes in this process also drop the entry at once.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._entries = OrderedDict()  # user_id -> (day, version, result)
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.extensions['insights_cache'] = self
+        expenses_changed.connect(self._on_expenses_changed, app)
+
+    def _on_expenses_changed(self, app, user_id):
+        self.invalidate(user_id)
+
+    def get(self, user_id):
+        today = datetime.utcnow().date()
+        # Read before computing: a write that races with compute() bumps the
+        # version, so what we store for this one is never served
+        version, _ = data_version(user_id)
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[:2] == (today, version):
+                self._entries.move_to_end(user_id)
+                return entry[2]
+
+        result = compute(user_id, self.app.config, today)
+        with self._lock:
+            self._entries[user_id] = (today, version, result)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.app.config['INSIGHTS_CACHE_SIZE']:
+                self._entries.popitem(last=False)
+        return result
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+
+insights_cache = InsightsCache()
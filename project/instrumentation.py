@@ -0,0 +1,336 @@
+import os
+import sys
+import time
+import threading
+from bisect import bisect_left
+from collections import Counter
+from contextlib import contextmanager
+from functools import wraps
+from flask import g, request, has_request_context, template_rendered, before_render_template
+from sqlalchemy import event
+from . import db
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+
+class Histogram:
+    """Prometheus-style cumulative histogram (not thread-safe on its own)."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            yield bound, total
+
+
+def _labels(labels):
+    def escape(value):
+        return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+    return ','.join(f'{key}="{escape(value)}"' for key, value in labels)
+
+
+def _number(value):
+    return '+Inf' if value == float('inf') else repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# ---------- SAMPLING PROFILER ----------
+def fold(frame):
+    """A stack as one 'outer;...;inner' line, the flamegraph 'collapsed' format."""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f'{os.path.basename(code.co_filename)}:{code.co_qualname}')
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class SamplingProfiler:
+    """Samples the stacks of in-flight requests from one background thread.
+
+    Only threads that called start() are sampled, so an idle server costs a
+    wakeup per interval and nothing else.
+    """
+
+    def __init__(self, interval, max_stacks=20000):
+        self.interval = interval
+        self.max_stacks = max_stacks
+        self._active = {}  # thread ident -> Counter of folded stacks
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        with self._lock:
+            self._active[threading.get_ident()] = Counter()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        """Stop sampling this thread; returns its Counter of stacks."""
+        with self._lock:
+            return self._active.pop(threading.get_ident(), None)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._active:
+                    continue
+                frames = sys._current_frames()
+                for ident, stacks in self._active.items():
+                    frame = frames.get(ident)
+                    if frame is not None and len(stacks) < self.max_stacks:
+                        stacks[fold(frame)] += 1
+
+
+def write_profile(folder, name, stacks, keep):
+    """Write stacks as a .folded file (flamegraph.pl, speedscope) and prune old ones."""
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, f"{time.strftime('%Y%m%d-%H%M%S')}-{name}.folded")
+    with open(path, 'w') as out:
+        for stack, count in stacks.most_common():
+            out.write(f'{stack} {count}\n')
+    profiles = sorted(entry.path for entry in os.scandir(folder) if entry.name.endswith('.folded'))
+    for old in profiles[:-keep] if keep else ():
+        os.remove(old)
+    return path
+
+
+# ---------- METRICS ----------
+class Metrics:
+    """Per-process request, SQL and span metrics, rendered for /metrics.
+
+    Every request is timed up to the point its response is returned (for a
+    streamed body, that is time to first byte). SQL queries are counted
+    until the request is torn down, so streamed queries are included.
+    Each server process keeps its own numbers; scrape every process.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.profiler = None
+        self._histograms = {}  # (name, labels) -> Histogram
+        self._counters = Counter()  # (name, labels) -> count
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.extensions['metrics'] = self
+        if not app.config['METRICS_ENABLED']:
+            return
+        if app.config['PROFILER_ENABLED']:
+            self.profiler = SamplingProfiler(app.config['PROFILER_INTERVAL_MS'] / 1000)
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        before_render_template.connect(self._before_render, app)
+        template_rendered.connect(self._rendered, app)
+        with app.app_context():
+            for bind, engine in db.engines.items():
+                self._watch_engine(engine, bind or 'default')
+
+    # ---- recording ----
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def increment(self, name, amount=1, **labels):
+        with self._lock:
+            self._counters[(name, tuple(sorted(labels.items())))] += amount
+
+    def observe_span(self, name, seconds):
+        """Time spent in one named piece of work (OCR, bcrypt, a template...)."""
+        if self.app is None or not self.app.config['METRICS_ENABLED']:
+            return
+        self.observe('app_span_seconds', seconds, span=name)
+        if has_request_context() and '_metrics_start' in g:
+            g._metrics_spans[name] += seconds
+
+    # ---- request hooks ----
+    def _before_request(self):
+        g._metrics_start = time.perf_counter()
+        g._metrics_queries = 0
+        g._metrics_query_seconds = 0.0
+        g._metrics_spans = Counter()
+        g._metrics_templates = []
+        if self.profiler is not None:
+            self.profiler.start()
+
+    def _after_request(self, response):
+        if '_metrics_start' not in g:
+            return response
+        elapsed = time.perf_counter() - g._metrics_start
+        endpoint = request.endpoint or 'unmatched'
+        self.observe('app_request_seconds', elapsed, endpoint=endpoint, method=request.method)
+        self.increment('app_requests_total', endpoint=endpoint, method=request.method,
+                       status=response.status_code)
+
+        if elapsed * 1000 >= self.app.config['SLOW_REQUEST_MS']:
+            self.app.logger.warning(
+                "Slow request %s %s: %.0f ms, %d queries (%.0f ms)%s", request.method, request.path,
+                elapsed * 1000, g._metrics_queries, g._metrics_query_seconds * 1000,
+                ''.join(f", {name} {seconds * 1000:.0f} ms" for name, seconds in g._metrics_spans.items()))
+            stacks = self.profiler.stop() if self.profiler is not None else None
+            if stacks:
+                write_profile(self.app.config['PROFILE_FOLDER'], f"{endpoint}-{elapsed * 1000:.0f}ms",
+                              stacks, self.app.config['PROFILE_MAX_FILES'])
+        elif self.profiler is not None:
+            self.profiler.stop()
+        return response
+
+    def _teardown_request(self, exc):
+        if '_metrics_start' not in g:
+            return
+        if self.profiler is not None:
+            self.profiler.stop()  # after_request didn't run
+        endpoint = request.endpoint or 'unmatched'
+        self.observe('app_request_queries', g._metrics_queries, QUERY_BUCKETS, endpoint=endpoint)
+        self.observe('app_request_query_seconds', g._metrics_query_seconds, endpoint=endpoint)
+
+    # ---- templates ----
+    def _before_render(self, app, template, context):
+        if has_request_context() and '_metrics_start' in g:
+            g._metrics_templates.append(time.perf_counter())
+
+    def _rendered(self, app, template, context):
+        if has_request_context() and g.get('_metrics_templates'):
+            self.observe_span(f'template:{template.name}', time.perf_counter() - g._metrics_templates.pop())
+
+    # ---- SQL ----
+    def _watch_engine(self, engine, bind):
+        @event.listens_for(engine, 'before_cursor_execute')
+        def before(conn, cursor, statement, parameters, context, executemany):
+            conn.info['_metrics_query_start'] = time.perf_counter()
+
+        @event.listens_for(engine, 'after_cursor_execute')
+        def after(conn, cursor, statement, parameters, context, executemany):
+            seconds = time.perf_counter() - conn.info['_metrics_query_start']
+            self.observe('app_db_query_seconds', seconds, bind=bind)
+            if has_request_context() and '_metrics_start' in g:
+                g._metrics_queries += 1
+                g._metrics_query_seconds += seconds
+
+    # ---- exposition ----
+    def _gauges(self):
+        """(name, type, help, value, labels) for numbers other extensions keep."""
+        extensions = self.app.extensions
+        with self.app.app_context():
+            for bind, engine in db.engines.items():
+                pool = engine.pool
+                if hasattr(pool, 'checkedout'):
+                    yield ('app_db_pool_checked_out', 'gauge', "Connections in use", pool.checkedout(),
+                           (('bind', bind or 'default'),))
+        if 'events' in extensions:
+            stats = extensions['events'].stats()
+            yield 'app_sse_open_streams', 'gauge', "Open server-sent event streams", stats['open_streams'], ()
+            yield 'app_sse_users', 'gauge', "Users with an open stream", stats['users'], ()
+        if 'ocr_jobs' in extensions:
+            yield 'app_ocr_jobs_pending', 'gauge', "OCR jobs queued or running", extensions['ocr_jobs'].pending, ()
+        if 'passwords' in extensions:
+            yield ('app_password_hashes_pending', 'gauge', "Password hashes running or queued",
+                   extensions['passwords'].pending, ())
+        if 'user_cache' in extensions:
+            stats = extensions['user_cache'].stats()
+            yield 'app_user_cache_hits_total', 'counter', "Signed-in user lookups served from cache", stats['hits'], ()
+            yield 'app_user_cache_misses_total', 'counter', "Signed-in user lookups that hit the database", stats['misses'], ()
+        if 'response_cache' in extensions:
+            stats = extensions['response_cache'].stats()
+            if stats:
+                yield 'app_response_cache_entries', 'gauge', "Pages in the response cache", stats['entries'], ()
+                yield 'app_response_cache_bytes', 'gauge', "Size of the pages in the response cache", stats['bytes'], ()
+        if 'ocr_cache' in extensions:
+            stats = extensions['ocr_cache'].stats()
+            yield 'app_ocr_cache_hits_total', 'counter', "OCR cache hits", stats['hits'], ()
+            yield 'app_ocr_cache_misses_total', 'counter', "OCR cache misses", stats['misses'], ()
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            counters = sorted(self._counters.items())
+            snapshots = [(key, list(h.cumulative()), h.sum, h.count) for key, h in histograms]
+
+        lines, described = [], set()
+
+        def describe(name, kind, text=''):
+            if name not in described:
+                described.add(name)
+                lines.append(f'# HELP {name} {text or HELP.get(name, name)}')
+                lines.append(f'# TYPE {name} {kind}')
+
+        for (name, labels), buckets, total, count in snapshots:
+            describe(name, 'histogram')
+            for bound, cumulative in buckets:
+                lines.append(f'{name}_bucket{{{_labels(labels + (("le", _number(bound)),))}}} {cumulative}')
+            lines.append(f'{name}_sum{{{_labels(labels)}}} {_number(total)}')
+            lines.append(f'{name}_count{{{_labels(labels)}}} {count}')
+        for (name, labels), value in counters:
+            describe(name, 'counter')
+            lines.append(f'{name}{{{_labels(labels)}}} {value}')
+        for name, kind, text, value, labels in self._gauges():
+            describe(name, kind, text)
+            lines.append(f'{name}{{{_labels(labels)}}} {_number(value)}' if labels else f'{name} {_number(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+HELP = dict(
+    app_request_seconds="Time to build each response, by endpoint",
+    app_requests_total="Responses by endpoint and status",
+    app_request_queries="SQL queries per request, by endpoint",
+    app_request_query_seconds="SQL time per request, by endpoint",
+    app_db_query_seconds="Time per SQL query",
+    app_password_rejected_total="Password hashes refused because the pool was busy",
+    app_login_throttled_total="Login, registration and password-change attempts over the rate limit",
+    app_response_cache_total="Cached pages served (hit), built (miss) or answered with a 304 (not_modified), by endpoint",
+    app_span_seconds="Time in instrumented work (OCR, bcrypt and its queue, templates, analytics)",
+)
+
+
+metrics = Metrics()
+
+
+# ---------- SPANS ----------
+@contextmanager
+def span(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.observe_span(name, time.perf_counter() - start)
+
+
+def traced(name):
+    """Decorator form of span()."""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def timed(fn, *args):
+    """fn(*args) and the seconds it took. For work in other processes,
+    whose spans can't be recorded where they run."""
+    start = time.perf_counter()
+    return fn(*args), time.perf_counter() - start
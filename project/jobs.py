@@ -0,0 +1,241 @@
+import json
+import threading
+import time
+import uuid
+import multiprocessing
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from . import db
+from .models import OcrJob
+from .ocr import process_receipt, ocr_settings, init_worker
+from .ocr_cache import ocr_cache
+from .events import events
+from .instrumentation import metrics, timed
+
+
+class JobQueueFull(Exception):
+    """Raised when too many OCR jobs are already waiting."""
+
+
+class JobQueue:
+    """Runs receipt OCR in a bounded process pool.
+
+    Job state lives in the OcrJob table, so a restarted app can pick up
+    anything that was still queued when it went down. Finished jobs are
+    recorded on a thread of our own, not the pool's result thread. If a
+    worker process dies, the jobs in the pool fail and the next one
+    starts a new pool.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._executor = None
+        self._recorder = None
+        self._pending = 0
+        self._backlog = deque()  # (job_id, file_path) resumed jobs waiting for room
+        self._lock = threading.Lock()
+        self._resumed = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.extensions['ocr_jobs'] = self
+        app.before_request(self._resume_pending)
+
+    @property
+    def executor(self):
+        # Created lazily so the dev-server reloader and spawned children
+        # (which re-import run.py) never start a pool of their own
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.app.config['OCR_WORKERS'],
+                                                     initializer=init_worker,
+                                                     initargs=(ocr_settings(self.app.config),))
+                # One thread writes finished jobs to the database, cache and
+                # event streams, off the pool's own result-handling thread
+                self._recorder = ThreadPoolExecutor(max_workers=1, thread_name_prefix='ocr-record')
+            return self._executor
+
+    def _reset(self, executor):
+        """Drop a broken pool; the next job starts a new one."""
+        with self._lock:
+            if self._executor is not executor:
+                return  # already replaced
+            self._executor = None
+        self.app.logger.warning("OCR worker pool broke (a worker died); starting a new one")
+        executor.shutdown(wait=False)
+
+    @property
+    def pending(self):
+        return self._pending
+
+    def submit(self, user_id, filename, file_path, content_hash=None, data=None):
+        job, _ = self.submit_many(user_id, [(filename, file_path, content_hash)],
+                                  data=[data])[0]
+        return job
+
+    def submit_many(self, user_id, files, data=None):
+        """Queue (filename, file_path, content_hash) tuples as one batch.
+
+        `data` optionally lists each file's bytes (or None), for OCR to use
+        instead of reading a file that may still be being written.
+        Either the whole batch fits in the queue or JobQueueFull is raised
+        and nothing is queued. Returns [(job, future), ...] in input order;
+        each future resolves to the OCR payload.
+        """
+        with self._lock:
+            if self._pending + len(files) > self.app.config['OCR_QUEUE_SIZE']:
+                raise JobQueueFull()
+            self._pending += len(files)
+
+        jobs = [OcrJob(id=uuid.uuid4().hex, user_id=user_id, filename=filename,
+                       file_path=file_path, content_hash=content_hash)
+                for filename, file_path, content_hash in files]
+        started = []
+        try:
+            db.session.add_all(jobs)
+            db.session.commit()
+            for job, (_, file_path, _), source in zip(jobs, files, data or [None] * len(files)):
+                started.append((job, self._start(job.id, file_path, source)))
+        except Exception as e:
+            with self._lock:
+                self._pending -= len(files) - len(started)
+            # Jobs committed but never handed to the pool would stay queued
+            self._fail_unstarted([job.id for job in jobs[len(started):]], e)
+            raise
+        return started
+
+    def _fail_unstarted(self, job_ids, error):
+        try:
+            db.session.rollback()
+            (OcrJob.query.filter(OcrJob.id.in_(job_ids), OcrJob.status == 'queued')
+             .update(dict(status='failed', error=f"Could not start: {error}",
+                          finished_at=datetime.utcnow()), synchronize_session=False))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            self.app.logger.exception("Could not mark unstarted OCR jobs failed")
+
+    def _start(self, job_id, file_path, data=None):
+        # The worker also reports how long OCR itself took. Callers get a
+        # future of just the payload, resolved once the job row is updated.
+        result = Future()
+        submitted = time.perf_counter()
+        args = (timed, process_receipt, file_path, ocr_settings(self.app.config), data)
+        executor = self.executor
+        try:
+            worker = executor.submit(*args)
+        except BrokenProcessPool:
+            self._reset(executor)
+            executor = self.executor
+            worker = executor.submit(*args)
+        recorder = self._recorder
+        worker.add_done_callback(
+            lambda f: recorder.submit(self._finish, job_id, f, result, submitted, executor))
+        return result
+
+    def _finish(self, job_id, worker, result, submitted, executor):
+        with self._lock:
+            self._pending -= 1
+
+        try:
+            payload, seconds = worker.result()
+            error = None
+            metrics.observe_span('ocr', seconds)
+        except Exception as e:
+            payload, error = None, e
+            if isinstance(e, BrokenProcessPool):
+                self._reset(executor)
+        # Includes the wait for a free worker
+        metrics.observe_span('ocr_job', time.perf_counter() - submitted)
+
+        try:
+            self._record(job_id, payload, error)
+        finally:
+            if error is None:
+                result.set_result(payload)
+            else:
+                result.set_exception(error)
+            self._resume_backlog()
+
+    def _record(self, job_id, payload, error):
+        # Runs on the recorder thread, so it needs its own context
+        with self.app.app_context():
+            job = db.session.get(OcrJob, job_id)
+            if job is None:
+                return
+            if error is None:
+                job.result = json.dumps(payload)
+                job.status = 'done'
+            else:
+                job.error = str(error)
+                job.status = 'failed'
+            job.finished_at = datetime.utcnow()
+            db.session.commit()
+
+            if payload is not None and job.content_hash:
+                ocr_cache.put(job.content_hash, ocr_settings(self.app.config), payload)
+
+            # Lets an open dashboard fetch the result now instead of polling
+            events.publish(job.user_id, 'job', dict(job_id=job.id, status=job.status))
+
+    def _resume_pending(self):
+        # Re-queue jobs left behind by a restart, once, on the first request
+        if self._resumed:
+            return
+        with self._lock:
+            if self._resumed:
+                return
+            self._resumed = True
+        if multiprocessing.parent_process() is not None or not self.app.config['OCR_RESUME_JOBS']:
+            return
+
+        # Oldest first, no more at once than the queue holds; the rest
+        # start as those finish
+        queued = (db.session.query(OcrJob.id, OcrJob.file_path)
+                  .filter(OcrJob.status == 'queued').order_by(OcrJob.created_at).all())
+        with self._lock:
+            self._backlog.extend(queued)
+        self._resume_backlog()
+
+    def _resume_backlog(self):
+        while True:
+            with self._lock:
+                if not self._backlog or self._pending >= self.app.config['OCR_QUEUE_SIZE']:
+                    return
+                job_id, file_path = self._backlog.popleft()
+                self._pending += 1
+            try:
+                self._start(job_id, file_path)
+            except Exception as e:
+                with self._lock:
+                    self._pending -= 1
+                with self.app.app_context():
+                    self._fail_unstarted([job_id], e)
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            self._backlog.clear()  # still queued in the table for the next start
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+        if self._recorder is not None:
+            # After the pool, so the jobs it just finished are recorded
+            self._recorder.shutdown(wait=wait)
+            self._recorder = None
+
+
+def job_payload(job):
+    """The JSON body returned by the job status endpoint."""
+    payload = dict(success=job.status != 'failed', job_id=job.id, status=job.status)
+    if job.status == 'done':
+        payload.update(json.loads(job.result))
+    elif job.status == 'failed':
+        payload['message'] = f"OCR failed: {job.error}"
+    return payload
+
+
+job_queue = JobQueue()
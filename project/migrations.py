@@ -0,0 +1,80 @@
+from datetime import datetime
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import inspect, text, insert, func
+from . import db
+from .models import Expense, SchemaVersion
+from .search import create_index
+
+# (version, description, function) - append new ones, never edit old ones.
+# db.create_all() already builds the latest schema for a new database, so
+# every step must check before it changes anything.
+MIGRATIONS = []
+
+
+def migration(version, description):
+    def decorator(fn):
+        MIGRATIONS.append((version, description, fn))
+        return fn
+    return decorator
+
+
+def _has_column(conn, table, column):
+    return column in {col['name'] for col in inspect(conn).get_columns(table)}
+
+
+# ---------- MIGRATIONS ----------
+@migration(1, "Add expense.file_path")
+def add_expense_file_path(conn):
+    # Was utils/check_db.py
+    if not _has_column(conn, 'expense', 'file_path'):
+        conn.execute(text("ALTER TABLE expense ADD COLUMN file_path VARCHAR(255)"))
+
+
+@migration(2, "Composite (user_id, ...) indexes on expense")
+def add_expense_indexes(conn):
+    for index in Expense.__table__.indexes:
+        index.create(conn, checkfirst=True)
+
+
+@migration(3, "Full-text search index over expense name/category/text")
+def add_expense_search_index(conn):
+    create_index(conn)
+
+
+# ---------- RUNNER ----------
+def current_version():
+    return db.session.query(func.max(SchemaVersion.version)).scalar() or 0
+
+
+def upgrade():
+    """Apply every migration newer than the database, each in its own transaction."""
+    applied = []
+    version = current_version()
+    db.session.commit()
+    for number, description, fn in sorted(MIGRATIONS, key=lambda m: m[0]):
+        if number <= version:
+            continue
+        with db.engine.begin() as conn:
+            fn(conn)
+            conn.execute(insert(SchemaVersion).values(
+                version=number, description=description, applied_at=datetime.utcnow()))
+        applied.append((number, description))
+    return applied
+
+
+@click.command('db-upgrade')
+@with_appcontext
+def db_upgrade_command():
+    """Apply pending schema migrations."""
+    applied = upgrade()
+    for number, description in applied:
+        click.echo(f"Applied {number}: {description}")
+    click.echo(f"Schema is at version {current_version()}.")
+
+
+@click.command('db-version')
+@with_appcontext
+def db_version_command():
+    """Show the current schema version."""
+    click.echo(current_version())
@@ -24,6 +24,14 @@ class Expense(db.Model):
     # Foreign Key: Links this expense to a user
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
 
+    # Every query filters by user first; these cover the date, category and
+    # amount lookups that follow (added to old databases by migrations.py)
+    __table_args__ = (
+        db.Index('ix_expense_user_date', 'user_id', 'date'),
+        db.Index('ix_expense_user_category', 'user_id', 'category'),
+        db.Index('ix_expense_user_amount', 'user_id', 'amount'),
+    )
+
 # NEW: A proper model for your contact form
 class ContactMessage(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -32,4 +40,58 @@ class ContactMessage(db.Model):
     subject = db.Column(db.String(100), nullable=False)
     message = db.Column(db.Text, nullable=False)
     newsletter = db.Column(db.Boolean, default=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
\ No newline at end of file
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+# Background OCR jobs for /upload_receipt (see jobs.py)
+class OcrJob(db.Model):
+    id = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    filename = db.Column(db.String(255), nullable=False)
+    file_path = db.Column(db.String(255), nullable=False)
+    content_hash = db.Column(db.String(64), nullable=True)  # sha256 of the upload
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued / done / failed
+    result = db.Column(db.Text, nullable=True)  # JSON payload once done
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+
+# OCR results keyed by receipt content + OCR settings (see ocr_cache.py)
+class OcrCacheEntry(db.Model):
+    key = db.Column(db.String(64), primary_key=True)
+    content_hash = db.Column(db.String(64), nullable=False)
+    result = db.Column(db.Text, nullable=False)  # JSON payload
+    size = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_used_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+
+# Dashboard aggregates, kept up to date by the expense write routes
+# (see summary.py). Uncategorized expenses are stored under category ''.
+class UserSummary(db.Model):
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    total = db.Column(db.Float, nullable=False, default=0.0)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    # Bumped with every change to the user's expenses: page ETags (page_cache.py)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=True)
+
+class ExpenseSummary(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    year = db.Column(db.Integer, nullable=False)
+    month = db.Column(db.Integer, nullable=False)
+    category = db.Column(db.String(50), nullable=False, default='')
+    total = db.Column(db.Float, nullable=False, default=0.0)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'year', 'month', 'category'),
+    )
+
+
+# Applied schema migrations (see migrations.py)
+class SchemaVersion(db.Model):
+    version = db.Column(db.Integer, primary_key=True)
+    description = db.Column(db.String(200), nullable=False)
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow)
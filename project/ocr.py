@@ -0,0 +1,176 @@
+import io
+import os
+import json
+import tempfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+from pdf2image import convert_from_path, pdfinfo_from_path
+from .extract import extract_fields
+from .preprocess import preprocess
+from .ocr_engine import OcrResult, get_engine, word_dict
+
+
+class OcrError(Exception):
+    """OCR failure that can cross the worker-process boundary.
+
+    The OCR libraries' own exceptions don't always pickle, which breaks the
+    process pool.
+    """
+
+
+# ---------- SETTINGS ----------
+def ocr_settings(config):
+    """Pull the OCR options out of the app config as a plain, picklable dict."""
+    # One budget of cores: OCR_WORKERS processes, each OCRing up to
+    # pdf_pages_in_flight pages, each Tesseract with omp_thread_limit threads
+    cpus = os.cpu_count() or 1
+    workers = max(1, config.get('OCR_WORKERS') or 1)
+    pages = config.get('OCR_PDF_PAGES_IN_FLIGHT') or max(1, cpus // workers)
+    return dict(
+        engine=config.get('OCR_ENGINE', 'auto'),
+        tesseract_cmd=config.get('TESSERACT_CMD'),
+        lang=config.get('OCR_LANG', 'eng'),
+        tessdata=config.get('OCR_TESSDATA'),
+        words=config.get('OCR_WORDS', False),
+        pdf_dpi=config.get('OCR_PDF_DPI', 300),
+        pdf_pages_in_flight=pages,
+        omp_thread_limit=max(1, cpus // (workers * pages)),
+        preprocess=list(config.get('OCR_PREPROCESS') or ()),
+        target_dpi=config.get('OCR_TARGET_DPI', 300),
+        receipt_width_in=config.get('OCR_RECEIPT_WIDTH_IN', 3.15),
+    )
+
+
+# Settings that change what OCR produces, and so belong in the cache key.
+# Bump FIELDS_VERSION whenever guess_fields changes its output.
+RESULT_SETTINGS = ('lang', 'words', 'pdf_dpi', 'preprocess', 'target_dpi', 'receipt_width_in')
+FIELDS_VERSION = 2
+
+
+def settings_fingerprint(settings):
+    fingerprint = {key: settings.get(key) for key in RESULT_SETTINGS}
+    fingerprint['fields_version'] = FIELDS_VERSION
+    return json.dumps(fingerprint, sort_keys=True)
+
+
+# ---------- TEXT EXTRACTION ----------
+def read_receipt(file_path, settings=None, data=None):
+    """OCR an image or every page of a PDF with this process's engine.
+
+    `data` is the image's bytes when the caller has them in memory (the
+    file may not be written yet); PDFs are always read from file_path.
+    Returns an OcrResult; with settings['words'] its words are JSON-ready
+    dicts (PDF words also carry their page number), otherwise None.
+    """
+    settings = settings or {}
+    if file_path.lower().endswith('.pdf'):
+        return read_pdf(file_path,
+                        dpi=settings.get('pdf_dpi', 300),
+                        pages_in_flight=settings.get('pdf_pages_in_flight', 1),
+                        settings=settings)
+    img = preprocess(Image.open(io.BytesIO(data) if data is not None else file_path), settings)
+    result = get_engine(settings).recognize(img, words=settings.get('words', False))
+    return OcrResult(result.text, _words(result))
+
+
+def _words(result, **extra):
+    if result.words is None:
+        return None
+    return [dict(word_dict(word), **extra) for word in result.words]
+
+
+def _ocr_pdf_page(file_path, page_number, dpi, output_folder, settings):
+    # Render just this page to a file. With no preprocessing, the engine
+    # reads it straight from disk and the bitmap is never held in Python memory
+    page_paths = convert_from_path(file_path, dpi, output_folder=output_folder,
+                                   first_page=page_number, last_page=page_number,
+                                   fmt='png', paths_only=True)
+    engine = get_engine(settings)
+    words = settings.get('words', False)
+    try:
+        text_data, page_words = "", [] if words else None
+        for path in page_paths:
+            if not settings.get('preprocess'):
+                result = engine.recognize(path, words=words)
+            else:
+                with Image.open(path) as page:
+                    result = engine.recognize(preprocess(page, settings, source_dpi=dpi), words=words)
+            text_data += result.text
+            if words:
+                page_words += _words(result, page=page_number)
+        return OcrResult(text_data, page_words)
+    finally:
+        for path in page_paths:
+            os.remove(path)
+
+
+def read_pdf(file_path, dpi=300, pages_in_flight=1, settings=None):
+    """OCR a PDF page by page, at most `pages_in_flight` pages at a time.
+
+    Pages are rendered lazily with pdftoppm and recognised in parallel;
+    the text (and words) come back in page order.
+    """
+    page_count = pdfinfo_from_path(file_path)['Pages']
+    pages_in_flight = max(1, min(pages_in_flight, page_count))
+
+    results = [None] * page_count
+    with tempfile.TemporaryDirectory() as tmp_dir, \
+            ThreadPoolExecutor(max_workers=pages_in_flight) as executor:
+        in_flight = deque()
+        for page_number in range(1, page_count + 1):
+            if len(in_flight) >= pages_in_flight:
+                index, future = in_flight.popleft()
+                results[index] = future.result()
+            future = executor.submit(_ocr_pdf_page, file_path, page_number, dpi, tmp_dir,
+                                     settings or {})
+            in_flight.append((page_number - 1, future))
+        for index, future in in_flight:
+            results[index] = future.result()
+    words = None
+    if (settings or {}).get('words'):
+        words = [word for result in results for word in result.words]
+    return OcrResult("".join(result.text for result in results), words)
+
+
+# ---------- FIELD GUESSING ----------
+def guess_fields(text_data):
+    """Build the upload payload: expense_name/amount/raw_text plus the extra fields."""
+    fields = extract_fields(text_data)
+    return dict(
+        expense_name=fields['merchant'] or "Scanned Receipt",
+        amount=fields['total'] or 0.0,
+        raw_text=text_data,
+        date=fields['date'],
+        tax=fields['tax'],
+        items=fields['items'],
+        confidence=fields['confidence'],
+    )
+
+
+def init_worker(settings):
+    """Runs once in each OCR worker process, before its first job: picks the
+    engine (and for tesserocr loads the language data) for the process."""
+    get_engine(settings)
+
+
+def process_receipt(file_path, settings=None, data=None):
+    """OCR a receipt and return the expense_name/amount/raw_text payload.
+
+    Runs inside the OCR worker processes, so it only takes plain arguments
+    (see ocr_settings, and read_receipt for `data`). Those processes were
+    set up by init_worker. With
+    OCR_WORDS the payload also has every word's confidence and box, and
+    their mean as ocr_confidence.
+    """
+    settings = settings or {}
+    try:
+        result = read_receipt(file_path, settings, data)
+    except Exception as e:
+        raise OcrError(str(e)) from None
+    payload = guess_fields(result.text)
+    if result.words is not None:
+        payload['words'] = result.words
+        payload['ocr_confidence'] = (round(sum(word['confidence'] for word in result.words) / len(result.words), 1)
+                                     if result.words else None)
+    return payload
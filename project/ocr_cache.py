@@ -0,0 +1,88 @@
+import json
+import math
+import hashlib
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import delete, func, select
+from . import db
+from .models import OcrCacheEntry
+from .ocr import settings_fingerprint
+
+
+class OcrCache:
+    """Persistent receipt-hash -> OCR payload cache with LRU eviction.
+
+    Entries live in the ocr_cache_entry table; once their total size passes
+    OCR_CACHE_MAX_BYTES the least recently used ones are dropped. A hit
+    only writes its last-use time when that is OCR_CACHE_TOUCH_SECONDS
+    old, so repeat hits stay reads.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.extensions['ocr_cache'] = self
+
+    @staticmethod
+    def make_key(content_hash, settings):
+        raw = f"{content_hash}:{settings_fingerprint(settings)}"
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def get(self, content_hash, settings):
+        entry = db.session.get(OcrCacheEntry, self.make_key(content_hash, settings))
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+
+        now = datetime.utcnow()
+        touch = timedelta(seconds=self.app.config['OCR_CACHE_TOUCH_SECONDS'])
+        if entry.last_used_at is None or now - entry.last_used_at >= touch:
+            entry.last_used_at = now
+            db.session.commit()
+        return json.loads(entry.result)
+
+    def put(self, content_hash, settings, payload):
+        key = self.make_key(content_hash, settings)
+        result = json.dumps(payload)
+        entry = db.session.get(OcrCacheEntry, key)
+        if entry is None:
+            entry = OcrCacheEntry(key=key, content_hash=content_hash)
+            db.session.add(entry)
+        entry.result = result
+        entry.size = len(result)
+        entry.last_used_at = datetime.utcnow()
+        db.session.commit()
+        self._evict()
+
+    def _evict(self):
+        max_bytes = self.app.config['OCR_CACHE_MAX_BYTES']
+        total, count = db.session.query(func.coalesce(func.sum(OcrCacheEntry.size), 0),
+                                        func.count(OcrCacheEntry.key)).one()
+        if total <= max_bytes:
+            return
+
+        # Enough of the least recently used entries, at the average size, to
+        # get back under budget; if that falls short the next put drops more
+        excess = math.ceil((total - max_bytes) * count / total)
+        oldest = select(OcrCacheEntry.key).order_by(OcrCacheEntry.last_used_at).limit(excess)
+        db.session.execute(delete(OcrCacheEntry).where(OcrCacheEntry.key.in_(oldest))
+                           .execution_options(synchronize_session=False))
+        db.session.commit()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return dict(hits=self.hits, misses=self.misses,
+                        hit_rate=self.hits / lookups if lookups else 0.0)
+
+
+ocr_cache = OcrCache()
@@ -0,0 +1,157 @@
+import os
+import queue
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+import pytesseract
+
+try:
+    import tesserocr
+except ImportError:  # optional: pip install tesserocr (needs libtesseract)
+    tesserocr = None
+
+# One recognised word: Tesseract's 0-100 confidence and its box in pixels
+Word = namedtuple('Word', 'text confidence left top width height')
+OcrResult = namedtuple('OcrResult', 'text words')  # words is None unless asked for
+
+
+def word_dict(word):
+    return dict(text=word.text, confidence=round(word.confidence, 1),
+                box=[word.left, word.top, word.width, word.height])
+
+
+# ---------- BACKENDS ----------
+# Both take a PIL image or a path to an image file.
+class PytesseractEngine:
+    """Runs the tesseract command once per image (and once more for words).
+
+    Every call starts a process, loads the language data and goes through
+    temp files; the fallback when tesserocr isn't installed.
+    """
+
+    name = 'pytesseract'
+
+    def __init__(self, settings):
+        if settings.get('tesseract_cmd'):
+            pytesseract.pytesseract.tesseract_cmd = settings['tesseract_cmd']
+        if settings.get('omp_thread_limit'):
+            # The env= pytesseract starts tesseract with: only those
+            # processes get the limit, not this one
+            pytesseract.pytesseract.environ = dict(os.environ, OMP_THREAD_LIMIT=str(settings['omp_thread_limit']))
+        self.lang = settings.get('lang') or 'eng'
+
+    def recognize(self, image, words=False):
+        text = pytesseract.image_to_string(image, lang=self.lang)
+        if not words:
+            return OcrResult(text, None)
+        data = pytesseract.image_to_data(image, lang=self.lang, output_type=pytesseract.Output.DICT)
+        found = [Word(data['text'][i], float(data['conf'][i]), data['left'][i], data['top'][i],
+                      data['width'][i], data['height'][i])
+                 for i in range(len(data['text']))
+                 if data['level'][i] == 5 and float(data['conf'][i]) >= 0 and data['text'][i].strip()]
+        return OcrResult(text, found)
+
+
+class TesserocrEngine:
+    """Tesseract through its C API, with the language data loaded once.
+
+    Keeps a pool of ready PyTessBaseAPI instances (one per page OCR'd at
+    the same time; each is used by one thread at a time) and hands them
+    images in memory. Recognition releases the GIL.
+    """
+
+    name = 'tesserocr'
+
+    def __init__(self, settings, size=1):
+        self.lang = settings.get('lang') or 'eng'
+        self.tessdata = settings.get('tessdata')
+        self.size = max(1, size)
+        self._idle = queue.LifoQueue()
+        self._created = 1
+        self._lock = threading.Lock()
+        # Load one now, so the first receipt doesn't pay for it
+        self._idle.put(self._new_api())
+
+    def _new_api(self):
+        if self.tessdata:
+            return tesserocr.PyTessBaseAPI(path=self.tessdata, lang=self.lang)
+        return tesserocr.PyTessBaseAPI(lang=self.lang)
+
+    @contextmanager
+    def _api(self):
+        try:
+            api = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                create = self._created < self.size
+                if create:
+                    self._created += 1
+            if not create:
+                api = self._idle.get()
+            else:
+                try:
+                    api = self._new_api()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+        try:
+            yield api
+        finally:
+            api.Clear()  # drop the image and results, keep the model
+            self._idle.put(api)
+
+    def recognize(self, image, words=False):
+        with self._api() as api:
+            if isinstance(image, str):
+                api.SetImageFile(image)
+            else:
+                api.SetImage(image)
+            api.Recognize()
+            text = api.GetUTF8Text()
+            if not words:
+                return OcrResult(text, None)
+            found = []
+            for result in tesserocr.iterate_level(api.GetIterator(), tesserocr.RIL.WORD):
+                word = result.GetUTF8Text(tesserocr.RIL.WORD)
+                box = result.BoundingBox(tesserocr.RIL.WORD)
+                if word and word.strip() and box:
+                    left, top, right, bottom = box
+                    found.append(Word(word, result.Confidence(tesserocr.RIL.WORD),
+                                      left, top, right - left, bottom - top))
+            return OcrResult(text, found)
+
+
+ENGINES = dict(pytesseract=PytesseractEngine, tesserocr=TesserocrEngine)
+
+
+def engine_name(settings):
+    """The backend OCR_ENGINE picks: 'auto' means tesserocr when it's installed."""
+    name = settings.get('engine') or 'auto'
+    if name == 'auto':
+        return 'tesserocr' if tesserocr is not None else 'pytesseract'
+    if name not in ENGINES:
+        raise ValueError(f"Unknown OCR_ENGINE {name!r} (choose from auto, {', '.join(ENGINES)})")
+    if name == 'tesserocr' and tesserocr is None:
+        raise RuntimeError("OCR_ENGINE=tesserocr but the tesserocr package is not installed")
+    return name
+
+
+# ---------- PER-PROCESS ENGINE ----------
+# Each OCR worker process builds its engine once (see ocr.init_worker)
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine(settings=None):
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                settings = settings or {}
+                name = engine_name(settings)
+                if name == 'tesserocr':
+                    _engine = TesserocrEngine(settings, size=settings.get('pdf_pages_in_flight', 1))
+                else:
+                    _engine = PytesseractEngine(settings)
+    return _engine
@@ -0,0 +1,196 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from functools import wraps
+from flask import current_app, request, session, make_response
+from . import db
+from .models import UserSummary
+from .auth import current_user
+from .instrumentation import metrics
+
+try:
+    import redis
+except ImportError:  # optional: pip install redis (for RESPONSE_CACHE_BACKEND=redis)
+    redis = None
+
+
+# ---------- BACKENDS ----------
+# Both map a key to bytes (the mimetype, a NUL, then the body)
+class MemoryBackend:
+    """An LRU of responses in this process, bounded by their total size."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old)
+            self._entries[key] = value
+            self._bytes += len(value)
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def stats(self):
+        with self._lock:
+            return dict(entries=len(self._entries), bytes=self._bytes)
+
+
+class RedisBackend:
+    """Responses in Redis (or anything speaking its protocol), shared by
+    every server process. Entries expire after `ttl` seconds; eviction
+    before that is the server's maxmemory-policy (use allkeys-lru)."""
+
+    def __init__(self, url, ttl, prefix='page:'):
+        if redis is None:
+            raise RuntimeError("RESPONSE_CACHE_BACKEND=redis but the redis package is not installed")
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key):
+        try:
+            return self.client.get(self.prefix + key)
+        except redis.RedisError:
+            return None  # a cache that's down is a miss, not an error page
+
+    def set(self, key, value):
+        try:
+            self.client.set(self.prefix + key, value, ex=self.ttl)
+        except redis.RedisError:
+            pass
+
+    def stats(self):
+        return {}
+
+
+# ---------- CACHE ----------
+def code_version(root):
+    """A hash of the app's code, templates and asset manifest, so a deploy
+    changes every ETag."""
+    digest = hashlib.sha1()
+    manifest = os.path.join(root, 'static', 'dist', 'manifest.json')
+    if os.path.exists(manifest):
+        with open(manifest, 'rb') as f:
+            digest.update(f.read())
+    for folder, dirs, files in sorted(os.walk(root)):
+        dirs[:] = [d for d in dirs if d not in ('__pycache__', 'static')]
+        for name in sorted(files):
+            if name.endswith(('.py', '.html')):
+                info = os.stat(os.path.join(folder, name))
+                digest.update(f'{folder}/{name}:{info.st_mtime_ns}:{info.st_size};'.encode())
+    return digest.hexdigest()[:12]
+
+
+def data_version(user_id):
+    """(version, updated_at) of the user's expenses; (0, None) before the first.
+
+    Read as columns, not a UserSummary object: summary.py updates those rows
+    without syncing the session.
+    """
+    row = (db.session.query(UserSummary.version, UserSummary.updated_at)
+           .filter(UserSummary.user_id == user_id).first())
+    return (row.version, row.updated_at) if row else (0, None)
+
+
+class ResponseCache:
+    """Whole rendered pages per user, validated by the user's data version.
+
+    A page's ETag is built from the version summary.py bumps on every
+    expense write (plus the signed-in user's details, the day and the code
+    version), so a browser that already has it gets a 304 without the page
+    being rebuilt, and any other request for it is served from the backend.
+    Entries for older versions are never served again and age out.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.backend = None
+        self.salt = ''
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        kind = app.config['RESPONSE_CACHE_BACKEND']
+        if kind == 'memory':
+            self.backend = MemoryBackend(app.config['RESPONSE_CACHE_MAX_BYTES'])
+        elif kind == 'redis':
+            self.backend = RedisBackend(app.config['RESPONSE_CACHE_URL'], app.config['RESPONSE_CACHE_TTL'])
+        elif kind == 'none':
+            self.backend = None  # ETags and 304s only
+        else:
+            raise ValueError(f"Unknown RESPONSE_CACHE_BACKEND {kind!r} (choose from memory, redis, none)")
+        self.salt = code_version(app.root_path)
+        app.extensions['response_cache'] = self
+
+    def stats(self):
+        return self.backend.stats() if self.backend is not None else {}
+
+    def etag(self, user):
+        """The ETag of this request's page for `user`, and when their data last changed."""
+        version, updated_at = data_version(user.id)
+        args = sorted(request.args.items(multi=True))
+        state = (request.endpoint, args, version, user, datetime.utcnow().date(), self.salt)
+        return hashlib.sha1(repr(state).encode()).hexdigest()[:20], updated_at
+
+
+response_cache = ResponseCache()
+
+
+def cached_page(view):
+    """Serve a signed-in user's GET page from the response cache, or a 304.
+
+    Goes under @login_required. Only for views whose output depends on
+    nothing but the user, their expenses, the date and the query string.
+    Pages with a flash message waiting are always built fresh.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if request.method != 'GET' or '_flashes' in session:
+            return view(*args, **kwargs)
+        user = current_user()
+        tag, updated_at = response_cache.etag(user)
+        endpoint = request.endpoint
+
+        if request.if_none_match.contains(tag):
+            metrics.increment('app_response_cache_total', result='not_modified', endpoint=endpoint)
+            response = make_response('', 304)
+        else:
+            backend = response_cache.backend
+            key = f'{user.id}:{tag}'
+            cached = backend.get(key) if backend is not None else None
+            if cached is not None:
+                metrics.increment('app_response_cache_total', result='hit', endpoint=endpoint)
+                mimetype, _, body = cached.partition(b'\0')
+                response = current_app.response_class(body, mimetype=mimetype.decode())
+            else:
+                metrics.increment('app_response_cache_total', result='miss', endpoint=endpoint)
+                response = make_response(view(*args, **kwargs))
+                if backend is not None and response.status_code == 200 and not response.is_streamed:
+                    backend.set(key, response.mimetype.encode() + b'\0' + response.get_data())
+
+        response.set_etag(tag)
+        if updated_at is not None:
+            response.last_modified = updated_at
+        # Private to this user; the browser must check back (cheaply) every time
+        response.headers['Cache-Control'] = 'private, no-cache'
+        response.vary.add('Cookie')
+        return response
+    return wrapper
@@ -0,0 +1,79 @@
+import base64
+from datetime import datetime
+from sqlalchemy import tuple_
+from .models import Expense
+from .search import search_filter
+
+# Query-string filters understood by /expenses and /api/expenses
+FILTER_ARGS = ('name', 'date', 'category', 'min_amount', 'max_amount')
+
+
+class BadRequestArgs(ValueError):
+    """A filter or cursor in the query string could not be parsed."""
+
+
+# ---------- CURSORS ----------
+# A cursor is the (date, id) of the last row on the previous page, so the
+# next page is a range scan on the (user_id, date) index rather than OFFSET.
+def encode_cursor(expense_date, expense_id):
+    raw = f"{expense_date.isoformat()}:{expense_id}".encode('ascii')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        day, expense_id = base64.urlsafe_b64decode(padded).decode('ascii').split(':')
+        return datetime.strptime(day, '%Y-%m-%d').date(), int(expense_id)
+    except (ValueError, UnicodeDecodeError):
+        raise BadRequestArgs("Invalid cursor")
+
+
+# ---------- FILTERS ----------
+def expense_filters(args):
+    """Turn request args into filter clauses (all AND-ed after user_id)."""
+    filters = []
+    try:
+        if args.get('name'):
+            # Full-text match on name, category and OCR text (see search.py)
+            filters.append(search_filter(args['name']))
+        if args.get('date'):
+            filters.append(Expense.date == datetime.strptime(args['date'], '%Y-%m-%d').date())
+        if args.get('category'):
+            if args['category'] == 'Uncategorized':
+                filters.append(Expense.category.is_(None) | (Expense.category == ''))
+            else:
+                filters.append(Expense.category == args['category'])
+        if args.get('min_amount'):
+            filters.append(Expense.amount >= float(args['min_amount']))
+        if args.get('max_amount'):
+            filters.append(Expense.amount <= float(args['max_amount']))
+    except ValueError:
+        raise BadRequestArgs("Invalid filter value")
+    return filters
+
+
+def page_size(args, config):
+    try:
+        size = int(args.get('page_size') or config['EXPENSES_PAGE_SIZE'])
+    except ValueError:
+        raise BadRequestArgs("Invalid page_size")
+    return max(1, min(size, config['EXPENSES_MAX_PAGE_SIZE']))
+
+
+# ---------- KEYSET PAGE ----------
+def keyset_query(query, cursor=None):
+    """Newest first, starting after `cursor` (an encoded (date, id))."""
+    if cursor:
+        after_date, after_id = decode_cursor(cursor)
+        query = query.filter(tuple_(Expense.date, Expense.id) < (after_date, after_id))
+    return query.order_by(Expense.date.desc(), Expense.id.desc())
+
+
+def keyset_page(query, cursor, size):
+    """Return (rows, next_cursor); next_cursor is None on the last page."""
+    rows = keyset_query(query, cursor).limit(size + 1).all()
+    if len(rows) <= size:
+        return rows, None
+    rows = rows[:size]
+    return rows, encode_cursor(rows[-1].date, rows[-1].id)
@@ -0,0 +1,226 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout
+from sqlalchemy import update
+from . import db, bcrypt
+from .models import User
+from .instrumentation import metrics, span, timed
+
+
+class HashingBusy(Exception):
+    """Raised when no hashing worker is free soon enough (the caller sends a 503)."""
+
+
+class TooManyAttempts(Exception):
+    """Raised when a client IP or account is over its attempt limit."""
+
+    def __init__(self, retry_after):
+        super().__init__(retry_after)
+        self.retry_after = max(1, int(retry_after))
+
+
+# ---------- RATE LIMITING ----------
+class RateLimiter:
+    """Sliding-window attempt counts per key, in this process's memory."""
+
+    def __init__(self, window):
+        self.window = window
+        self._hits = {}  # key -> deque of attempt times
+        self._lock = threading.Lock()
+        self._calls = 0
+
+    def hit(self, key, limit):
+        """Count an attempt. Returns 0, or the seconds until one is allowed
+        again (an attempt over the limit is not counted)."""
+        now = time.monotonic()
+        with self._lock:
+            hits = self._hits.setdefault(key, deque())
+            while hits and hits[0] <= now - self.window:
+                hits.popleft()
+            if len(hits) >= limit:
+                return hits[0] + self.window - now
+            hits.append(now)
+            self._calls += 1
+            if self._calls % 1000 == 0:
+                self._sweep(now)
+            return 0
+
+    def reset(self, key):
+        with self._lock:
+            self._hits.pop(key, None)
+
+    def _sweep(self, now):
+        # Forget keys that have gone quiet, so the dict doesn't grow forever
+        for key in [key for key, hits in self._hits.items() if not hits or hits[-1] <= now - self.window]:
+            del self._hits[key]
+
+
+# ---------- HASHING ----------
+def _hash(password):
+    return bcrypt.generate_password_hash(password).decode('utf-8')
+
+
+def _check(pw_hash, password):
+    return bcrypt.check_password_hash(pw_hash, password)
+
+
+def hash_rounds(pw_hash):
+    """The cost factor a bcrypt hash was made with ($2b$<rounds>$...)."""
+    try:
+        return int(pw_hash.split('$')[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+class Passwords:
+    """Password hashing on a small, bounded thread pool, plus login throttling.
+
+    bcrypt releases the GIL, so a few hashing threads use a few cores while
+    request threads keep serving pages. At most PASSWORD_HASH_WORKERS hash
+    at once and PASSWORD_HASH_QUEUE more wait; beyond that, or after waiting
+    PASSWORD_QUEUE_TIMEOUT seconds, HashingBusy is raised instead.
+
+    Attempt counts are kept per process: with N server workers a client
+    that lands on all of them gets up to N times the LOGIN_MAX_* limits.
+    Client IPs come from request.remote_addr, which is the proxy's address
+    unless TRUSTED_PROXIES is set (see create_app).
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.limiter = None
+        self._executor = None
+        self._slots = None
+        self._pending = 0
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.extensions['passwords'] = self
+        config = app.config
+        self.limiter = RateLimiter(config['LOGIN_RATE_WINDOW'])
+        if config['PASSWORD_HASH_WORKERS']:
+            self._slots = threading.BoundedSemaphore(config['PASSWORD_HASH_WORKERS'] + config['PASSWORD_HASH_QUEUE'])
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.app.config['PASSWORD_HASH_WORKERS'],
+                                                thread_name_prefix='passwords')
+        return self._executor
+
+    @property
+    def pending(self):
+        """Hashes running or waiting for a worker."""
+        return self._pending
+
+    def _acquire(self):
+        if not self._slots.acquire(blocking=False):
+            return False
+        with self._lock:
+            self._pending += 1
+        return True
+
+    def _release(self, future=None):
+        with self._lock:
+            self._pending -= 1
+        self._slots.release()
+
+    def _run(self, fn, *args):
+        if self._slots is None:
+            # PASSWORD_HASH_WORKERS = 0: on the request thread
+            with span('bcrypt'):
+                return fn(*args)
+        if not self._acquire():
+            metrics.increment('app_password_rejected_total', reason='queue_full')
+            raise HashingBusy()
+        queued = time.perf_counter()
+        timeout = self.app.config['PASSWORD_QUEUE_TIMEOUT']
+
+        def job():
+            # Waited too long: the client has probably given up, skip the work
+            if time.perf_counter() - queued > timeout:
+                metrics.increment('app_password_rejected_total', reason='queue_timeout')
+                raise HashingBusy()
+            return timed(fn, *args)
+
+        try:
+            future = self.executor.submit(job)
+        except Exception:
+            self._release()
+            raise
+        future.add_done_callback(self._release)
+        try:
+            result, seconds = future.result(timeout=max(0, queued + timeout - time.perf_counter()))
+        except FuturesTimeout:
+            # Still queued: drop it. Already hashing: let it finish, unwaited for
+            future.cancel()
+            metrics.increment('app_password_rejected_total', reason='queue_timeout')
+            raise HashingBusy()
+        waited = time.perf_counter() - queued
+        # Recorded here so the request's slow-log line shows them too
+        metrics.observe_span('bcrypt', seconds)
+        metrics.observe_span('bcrypt_queue', waited - seconds)
+        return result
+
+    # ---- hashing ----
+    def hash(self, password):
+        return self._run(_hash, password)
+
+    def check(self, pw_hash, password):
+        return self._run(_check, pw_hash, password)
+
+    def needs_rehash(self, pw_hash):
+        rounds = hash_rounds(pw_hash)
+        return rounds is not None and rounds != self.app.config['BCRYPT_LOG_ROUNDS']
+
+    def rehash_later(self, user_id, old_hash, password):
+        """Re-hash at the current cost in the background, after a good login.
+
+        Skipped if the pool is busy (the next login tries again), and the
+        stored hash is only replaced if it hasn't changed meanwhile.
+        """
+        app = self.app
+
+        def rehash():
+            with span('bcrypt'):
+                new_hash = _hash(password)
+            with app.app_context():
+                db.session.execute(update(User)
+                                   .where(User.id == user_id, User.password == old_hash)
+                                   .values(password=new_hash))
+                db.session.commit()
+
+        if self._slots is None:
+            rehash()
+        elif self._acquire():
+            self.executor.submit(rehash).add_done_callback(self._release)
+
+    # ---- throttling ----
+    def throttle(self, ip, account=None):
+        """Count an attempt from `ip` (and on `account`), before any hashing.
+
+        Raises TooManyAttempts when either is over its limit.
+        """
+        config = self.app.config
+        wait = self.limiter.hit(('ip', ip), config['LOGIN_MAX_PER_IP'])
+        if not wait and account:
+            wait = self.limiter.hit(('account', account.strip().lower()), config['LOGIN_MAX_PER_ACCOUNT'])
+        if wait:
+            metrics.increment('app_login_throttled_total')
+            raise TooManyAttempts(wait)
+
+    def succeeded(self, account):
+        """A good login clears the account's count (the IP's stays)."""
+        self.limiter.reset(('account', account.strip().lower()))
+
+    def shutdown(self, wait=True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+
+
+passwords = Passwords()
@@ -0,0 +1,157 @@
+from PIL import Image, ImageOps
+
+# Steps run in this order; OCR_PREPROCESS picks which ones are on
+STEPS = ('exif', 'grayscale', 'crop', 'deskew', 'downscale', 'binarize')
+
+# Crop and deskew work on a small preview, then apply the result at full size
+PREVIEW_SIZE = 600
+DESKEW_MAX_ANGLE = 5.0
+DESKEW_STEP = 0.5
+
+A4_WIDTH_IN = 8.27
+
+
+# ---------- HELPERS ----------
+def otsu_threshold(gray):
+    """Pick the grey level that best splits a greyscale image in two."""
+    histogram = gray.histogram()[:256]
+    total = sum(histogram)
+    sum_all = sum(i * count for i, count in enumerate(histogram))
+
+    sum_bg = weight_bg = 0
+    best_level, best_variance = 127, 0.0
+    for level, count in enumerate(histogram):
+        weight_bg += count
+        if weight_bg == 0:
+            continue
+        weight_fg = total - weight_bg
+        if weight_fg == 0:
+            break
+        sum_bg += level * count
+        mean_bg = sum_bg / weight_bg
+        mean_fg = (sum_all - sum_bg) / weight_fg
+        variance = weight_bg * weight_fg * (mean_bg - mean_fg) ** 2
+        if variance > best_variance:
+            best_level, best_variance = level, variance
+    return best_level
+
+
+def _preview(gray):
+    scale = min(1.0, PREVIEW_SIZE / max(gray.size))
+    if scale == 1.0:
+        return gray, 1.0
+    size = (max(1, round(gray.width * scale)), max(1, round(gray.height * scale)))
+    return gray.resize(size, Image.BILINEAR), scale
+
+
+def _as_gray(img):
+    return img if img.mode == 'L' else img.convert('L')
+
+
+# ---------- STEPS ----------
+def crop_to_receipt(img, padding=0.02):
+    """Crop to the paper (brighter than the background), then to the ink on it."""
+    preview, scale = _preview(_as_gray(img))
+    threshold = otsu_threshold(preview)
+
+    box = preview.point(lambda p: 255 if p > threshold else 0).getbbox()
+    if box is None:
+        return img
+    paper = preview.crop(box)
+    ink = paper.point(lambda p: 255 if p <= threshold else 0).getbbox()
+    if ink is not None:
+        box = (box[0] + ink[0], box[1] + ink[1], box[0] + ink[2], box[1] + ink[3])
+
+    pad_x = round(preview.width * padding)
+    pad_y = round(preview.height * padding)
+    left = max(0, box[0] - pad_x) / scale
+    top = max(0, box[1] - pad_y) / scale
+    right = min(preview.width, box[2] + pad_x) / scale
+    bottom = min(preview.height, box[3] + pad_y) / scale
+    return img.crop((round(left), round(top), round(right), round(bottom)))
+
+
+def find_skew(img):
+    """Angle (degrees) that makes the text lines most horizontal.
+
+    Uses the projection-profile method: when lines are level, the row
+    averages alternate sharply between ink and paper, so their variance
+    peaks.
+    """
+    preview, _ = _preview(_as_gray(img))
+    threshold = otsu_threshold(preview)
+    ink = preview.point(lambda p: 255 if p <= threshold else 0)
+
+    best_angle, best_score = 0.0, -1.0
+    steps = int(DESKEW_MAX_ANGLE / DESKEW_STEP)
+    for i in range(-steps, steps + 1):
+        angle = i * DESKEW_STEP
+        rotated = ink.rotate(angle, resample=Image.NEAREST, expand=True)
+        # Squashing to one column gives the mean of every row
+        rows = list(rotated.resize((1, rotated.height), Image.BOX).getdata())
+        mean = sum(rows) / len(rows)
+        score = sum((r - mean) ** 2 for r in rows)
+        if score > best_score:
+            best_angle, best_score = angle, score
+    return best_angle
+
+
+def deskew(img):
+    angle = find_skew(img)
+    if angle == 0.0:
+        return img
+    fill = 255 if img.mode == 'L' else (255,) * len(img.getbands())
+    return img.rotate(angle, resample=Image.BICUBIC, expand=True, fillcolor=fill)
+
+
+def estimate_dpi(img, receipt_width_in):
+    """Best guess at the scan resolution of a receipt image.
+
+    Trust a real DPI tag if the file has one. Otherwise assume the (cropped)
+    image is as wide as the paper: a till receipt if it is tall and narrow,
+    an A4 invoice if not.
+    """
+    dpi = img.info.get('dpi')
+    if dpi and dpi[0] >= 150:
+        return float(dpi[0])
+    width_in = receipt_width_in if img.height >= 2 * img.width else A4_WIDTH_IN
+    return img.width / width_in
+
+
+def downscale(img, target_dpi, receipt_width_in, source_dpi=None):
+    """Shrink to roughly target_dpi. Never upscales."""
+    dpi = source_dpi or estimate_dpi(img, receipt_width_in)
+    if dpi <= target_dpi:
+        return img
+    scale = target_dpi / dpi
+    size = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+    return img.resize(size, Image.LANCZOS)
+
+
+def binarize(img):
+    gray = _as_gray(img)
+    threshold = otsu_threshold(gray)
+    return gray.point(lambda p: 255 if p > threshold else 0, mode='1')
+
+
+# ---------- PIPELINE ----------
+def preprocess(img, settings, source_dpi=None):
+    """Run the configured steps (settings['preprocess']) over a PIL image."""
+    enabled = set(settings.get('preprocess') or ())
+    if not enabled:
+        return img
+
+    if 'exif' in enabled:
+        img = ImageOps.exif_transpose(img)
+    if 'grayscale' in enabled:
+        img = _as_gray(img)
+    if 'crop' in enabled:
+        img = crop_to_receipt(img)
+    if 'deskew' in enabled:
+        img = deskew(img)
+    if 'downscale' in enabled:
+        img = downscale(img, settings.get('target_dpi', 300),
+                        settings.get('receipt_width_in', 3.15), source_dpi)
+    if 'binarize' in enabled:
+        img = binarize(img)
+    return img
@@ -1,19 +1,38 @@
 import os
+import hmac
 import json
-import re
 from datetime import datetime
-from PIL import Image
-import pytesseract
-from pdf2image import convert_from_path
+from concurrent.futures import as_completed, TimeoutError as FuturesTimeout
 from flask import (
     Blueprint, render_template, request, redirect, url_for, 
-    session, flash, jsonify, current_app
+    session, flash, jsonify, current_app, Response, stream_with_context, send_file, abort
 )
-from sqlalchemy import func
+from sqlalchemy import text
 from werkzeug.utils import secure_filename
-from . import db, bcrypt
+from werkzeug.exceptions import RequestEntityTooLarge
 from . import db
-from .models import User, Expense, ContactMessage
+from .models import User, Expense, ContactMessage, OcrJob
+from .jobs import job_queue, job_payload, JobQueueFull
+from .events import events, format_event, TooManyStreams
+from .signals import expenses_changed
+from .insights import insights_cache
+from .images import images
+from .passwords import passwords, HashingBusy, TooManyAttempts
+from .auth import current_user, login_required, user_cache
+from .page_cache import cached_page
+from .instrumentation import metrics
+from .bulk import import_expenses, export_expenses, export_query, guess_format, FORMATS
+from .ocr import ocr_settings
+from .ocr_cache import ocr_cache
+from .store import save_upload, expand_uploads, BadBatch, uploads, check_upload, UploadTooLarge
+from .database import read_session, reads_only, end_transaction
+from . import summary
+from .analytics import dashboard_stats, for_user as user_analytics
+from .search import ranked_search
+from .pagination import (
+    FILTER_ARGS, BadRequestArgs, expense_filters, page_size,
+    keyset_page, keyset_query, encode_cursor
+)
 
 # 1. Create a Blueprint
 main = Blueprint('main', __name__)
@@ -30,15 +49,42 @@ def index():
     return render_template('index.html')
 
 
+# ---------- ERRORS ----------
+@main.app_errorhandler(RequestEntityTooLarge)
+def too_large(e):
+    # Raised while the body is read, before a view sees any of it
+    limit = request.max_content_length
+    message = f"Upload too large (the limit is {limit / (1024 * 1024):.0f} MB)." if limit else "Upload too large."
+    if request.accept_mimetypes.accept_html and not request.accept_mimetypes.accept_json:
+        flash(message, 'error')
+        return redirect(request.referrer or url_for('main.home'))
+    return jsonify(success=False, message=message), 413
+
+
 # ---------- LOGIN ----------
 @main.route('/login', methods=['GET', 'POST'])
+@reads_only
 def login():
     if request.method == 'POST':
         email = request.form.get('username') # This is the email field
         password = request.form.get('password')
 
-        user = User.query.filter_by(email=email).first()
-        if user and bcrypt.check_password_hash(user.password, password):
+        # Throttled before the lookup, so a burst costs no hashing at all
+        try:
+            passwords.throttle(request.remote_addr, email)
+            user = User.query.filter_by(email=email).first()
+            valid = user is not None and passwords.check(user.password, password)
+        except TooManyAttempts as e:
+            flash('Too many login attempts. Please wait a few minutes and try again.', 'error')
+            return render_template('login.html'), 429, {'Retry-After': str(e.retry_after)}
+        except HashingBusy:
+            flash('The server is busy. Please try again in a moment.', 'error')
+            return render_template('login.html'), 503, {'Retry-After': '5'}
+        if valid:
+            passwords.succeeded(email)
+            if passwords.needs_rehash(user.password):
+                # BCRYPT_LOG_ROUNDS changed since this hash was made
+                passwords.rehash_later(user.id, user.password, password)
             session['user_id'] = user.id
             flash('Login successful!', 'success')
             return redirect(url_for('main.home'))
@@ -56,13 +102,24 @@ def register():
         email = request.form.get('email')
         password = request.form.get('password')
 
+        try:
+            passwords.throttle(request.remote_addr)
+        except TooManyAttempts as e:
+            flash('Too many attempts. Please wait a few minutes and try again.', 'error')
+            return render_template('signup.html'), 429, {'Retry-After': str(e.retry_after)}
+
         existing_user = User.query.filter_by(email=email).first()
         if existing_user:
             flash('Email already exists. Please choose another.', 'error')
         else:
             # Hash the password
-            hashed_password = bcrypt.generate_password_hash(password).decode('utf-8')
-            
+            end_transaction()
+            try:
+                hashed_password = passwords.hash(password)
+            except HashingBusy:
+                flash('The server is busy. Please try again in a moment.', 'error')
+                return render_template('signup.html'), 503, {'Retry-After': '5'}
+
             new_user = User(first_name=first_name, last_name=last_name,
                             email=email, password=hashed_password)
             db.session.add(new_user)
@@ -73,6 +130,7 @@ def register():
 
 # ---------- AJAX EMAIL CHECKER ----------
 @main.route('/check_email', methods=['POST'])
+@reads_only
 def check_email():
     email = request.form.get('email')
     if not email:
@@ -96,97 +154,224 @@ def logout():
 
 # ---------- HOME ----------
 @main.route('/home')
+@login_required
+@cached_page
 def home():
-    if 'user_id' not in session:
-        return redirect(url_for('main.login'))
+    user = current_user()
+    user_id = user.id
 
-    user = User.query.get(session['user_id'])
-    user_id = session['user_id']
-    
-    user_expenses = Expense.query.filter_by(user_id=user_id)
-    total_spent = db.session.query(func.sum(Expense.amount)).filter_by(user_id=user_id).scalar() or 0
-    
-    this_month = datetime.utcnow().month
-    this_year = datetime.utcnow().year
-    this_month_spent = db.session.query(func.sum(Expense.amount)).filter_by(user_id=user_id).filter(
-        func.extract('month', Expense.date) == this_month,
-        func.extract('year', Expense.date) == this_year
-    ).scalar() or 0
-
-    category_count = user_expenses.with_entities(Expense.category).distinct().count()
-    receipt_count = user_expenses.count()
+    # Totals come from the summary tables (see analytics.py)
+    stats = dashboard_stats(user_id)
     today = datetime.utcnow().strftime('%Y-%m-%d')
     
     return render_template('home.html', 
                            user=user, 
                            today=today,
-                           total_spent=total_spent,
-                           this_month_spent=this_month_spent,
-                           category_count=category_count,
-                           receipt_count=receipt_count)
+                           **stats)
 
 # ---------- AJAX STATS FETCHER ----------
 @main.route('/get_dashboard_stats')
+@login_required(api=True)
+@cached_page
 def get_dashboard_stats():
-    if 'user_id' not in session:
-        return jsonify(error="Not logged in"), 401
-
-    user_id = session['user_id']
-    user_expenses = Expense.query.filter_by(user_id=user_id)
+    return jsonify(dashboard_stats(current_user().id))
 
-    total_spent = db.session.query(func.sum(Expense.amount)).filter_by(user_id=user_id).scalar() or 0
-    
-    this_month = datetime.utcnow().month
-    this_year = datetime.utcnow().year
-    this_month_spent = db.session.query(func.sum(Expense.amount)).filter_by(user_id=user_id).filter(
-        func.extract('month', Expense.date) == this_month,
-        func.extract('year', Expense.date) == this_year
-    ).scalar() or 0
-
-    category_count = user_expenses.with_entities(Expense.category).distinct().count()
-    receipt_count = user_expenses.count()
-
-    return jsonify(
-        total_spent=total_spent,
-        this_month_spent=this_month_spent,
-        category_count=category_count,
-        receipt_count=receipt_count
-    )
+# ---------- LIVE DASHBOARD UPDATES (SSE) ----------
+@main.route('/events')
+@login_required(api=True)
+def event_stream():
+    user_id = current_user().id
+    try:
+        inbox = events.subscribe(user_id)
+    except TooManyStreams:
+        return jsonify(error="Too many open streams"), 503, {'Retry-After': '30'}
+
+    # Start every stream with a full snapshot; after that only changes are
+    # pushed. The body never touches the database, so an idle stream holds
+    # no connection.
+    first = format_event('stats', dashboard_stats(user_id))
+    return Response(events.stream(user_id, inbox, first), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+# ---------- METRICS (PROMETHEUS) ----------
+@main.route('/metrics')
+def metrics_endpoint():
+    # Not exposed until a scrape token is configured
+    token = current_app.config['METRICS_TOKEN']
+    if not current_app.config['METRICS_ENABLED'] or not token:
+        abort(404)
+    if not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return jsonify(error="Unauthorized"), 401
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+# ---------- HEALTH ----------
+@main.route('/healthz')
+def healthz():
+    # Liveness: the worker is up and answering. Touches nothing else, so a
+    # slow database doesn't get workers restarted
+    return jsonify(status='ok')
+
+
+@main.route('/readyz')
+def readyz():
+    # Readiness: this worker can serve real pages right now
+    checks, ready = {}, True
+    try:
+        db.session.execute(text('SELECT 1'))
+        checks['database'] = 'ok'
+    except Exception as e:
+        checks['database'], ready = f'error: {e.__class__.__name__}', False
+    uploads_folder = os.path.abspath(current_app.config['UPLOAD_FOLDER'])
+    if not os.path.isdir(uploads_folder):
+        uploads_folder = os.path.dirname(uploads_folder)  # made on the first upload
+    if os.access(uploads_folder, os.W_OK):
+        checks['uploads'] = 'ok'
+    else:
+        checks['uploads'], ready = 'not writable', False
+    checks['ocr_queue'] = f"{job_queue.pending}/{current_app.config['OCR_QUEUE_SIZE']}"
+    return jsonify(status='ok' if ready else 'unavailable', checks=checks), 200 if ready else 503
 
 # ---------- VIEW EXPENSES ----------
 @main.route('/expenses', methods=['GET'])
+@login_required
 def view_expenses():
-    if 'user_id' not in session:
-        return redirect(url_for('main.login'))
-
-    user_id = session['user_id']
-    query = Expense.query.filter_by(user_id=user_id).order_by(Expense.date.desc())
-
+    user_id = current_user().id
     search_name = request.args.get('name')
     search_date = request.args.get('date')
+    cursor = request.args.get('cursor')
 
-    if search_name:
-        query = query.filter(Expense.name.like(f'%{search_name}%'))
-    if search_date:
-        query = query.filter(Expense.date == datetime.strptime(search_date, '%Y-%m-%d').date())
+    # One page at a time, newest first (see pagination.py)
+    try:
+        query = Expense.query.filter(Expense.user_id == user_id, *expense_filters(request.args))
+        expenses, next_cursor = keyset_page(query, cursor, page_size(request.args, current_app.config))
+    except BadRequestArgs as e:
+        flash(str(e), 'error')
+        return redirect(url_for('main.view_expenses'))
 
-    expenses = query.all()
+    filters = {arg: request.args[arg] for arg in FILTER_ARGS if request.args.get(arg)}
     return render_template('expenses.html', expenses=expenses,
-                           search_name=search_name, search_date=search_date)
+                           search_name=search_name, search_date=search_date,
+                           filters=filters, next_cursor=next_cursor,
+                           is_first_page=not cursor)
+
+
+# ---------- EXPENSES JSON API ----------
+@main.route('/api/expenses')
+@login_required(api=True)
+def api_expenses():
+    # Streamed from the read-only pool, so a slow client doesn't hold a
+    # connection the writers need
+    reader = read_session()
+    try:
+        filters = expense_filters(request.args)
+        size = page_size(request.args, current_app.config)
+        cursor = request.args.get('cursor')
+        query = keyset_query(
+            reader.query(Expense.id, Expense.name, Expense.amount, Expense.category, Expense.date)
+            .filter(Expense.user_id == current_user().id, *filters),
+            cursor,
+        ).limit(size + 1)
+    except BadRequestArgs as e:
+        reader.close()
+        return jsonify(success=False, message=str(e)), 400
+
+    chunk_size = current_app.config['EXPENSES_STREAM_CHUNK']
+
+    def generate():
+        # Rows are written out as they are read, chunk_size at a time
+        with reader:
+            yield '{"expenses": ['
+            buffer, sent, last, has_more = [], 0, None, False
+            for row in query.yield_per(chunk_size):
+                if sent == size:
+                    has_more = True
+                    break
+                buffer.append(json.dumps(dict(id=row.id, name=row.name, amount=row.amount,
+                                              category=row.category, date=row.date.isoformat())))
+                sent += 1
+                last = row
+                if len(buffer) == chunk_size:
+                    yield (',' if sent > chunk_size else '') + ','.join(buffer)
+                    buffer = []
+            if buffer:
+                yield (',' if sent > len(buffer) else '') + ','.join(buffer)
+            next_cursor = encode_cursor(last.date, last.id) if has_more else None
+            yield '], "next_cursor": ' + json.dumps(next_cursor) + '}'
+
+    return Response(stream_with_context(generate()), mimetype='application/json')
+
+
+# ---------- BULK IMPORT / EXPORT ----------
+EXPORT_TYPES = dict(csv='text/csv', json='application/json', jsonl='application/x-ndjson')
+
+@main.route('/api/expenses/import', methods=['POST'])
+@login_required(api=True)
+def api_import_expenses():
+    request.max_content_length = current_app.config['BULK_MAX_BYTES']
+    file = request.files.get('file')
+    if not file or not file.filename:
+        return jsonify(success=False, message="No file uploaded"), 400
+    fmt = request.form.get('format') or guess_format(file.filename)
+    if fmt not in FORMATS:
+        return jsonify(success=False, message="Format must be csv, json or jsonl"), 400
+
+    # The upload is read a row at a time and inserted in batches (see bulk.py)
+    result = import_expenses(current_user().id, file.stream, fmt,
+                             current_app.config['BULK_BATCH_SIZE'],
+                             current_app.config['BULK_MAX_ERRORS'],
+                             dry_run=request.form.get('dry_run') == '1')
+    if result['imported'] and request.form.get('dry_run') != '1':
+        expenses_changed.send(current_app._get_current_object(), user_id=current_user().id)
+    return jsonify(success='message' not in result, **result)
+
+
+@main.route('/api/expenses/export')
+@login_required(api=True)
+def api_export_expenses():
+    fmt = request.args.get('format', 'csv')
+    if fmt not in FORMATS:
+        return jsonify(success=False, message="Format must be csv, json or jsonl"), 400
+    try:
+        filters = expense_filters(request.args)
+    except BadRequestArgs as e:
+        return jsonify(success=False, message=str(e)), 400
+
+    user_id = current_user().id
+
+    def body():
+        with read_session() as reader:
+            yield from export_expenses(export_query(user_id, filters, reader), fmt)
+
+    return Response(stream_with_context(body()), mimetype=EXPORT_TYPES[fmt],
+                    headers={'Content-Disposition': f'attachment; filename=expenses.{fmt}'})
+
+
+# ---------- EXPENSE SEARCH API ----------
+@main.route('/api/expenses/search')
+@login_required(api=True)
+def api_search_expenses():
+    term = request.args.get('q', '').strip()
+    if not term:
+        return jsonify(success=False, message="Missing search term"), 400
+    try:
+        limit = min(int(request.args.get('limit', 20)), current_app.config['EXPENSES_MAX_PAGE_SIZE'])
+    except ValueError:
+        return jsonify(success=False, message="Invalid limit"), 400
+
+    return jsonify(success=True, results=ranked_search(current_user().id, term, limit))
 
 
 # ---------- ADD EXPENSE (AJAX) ----------
 @main.route('/add_expense', methods=['POST'])
+@login_required(api=True)
 def add_expense():
-    if 'user_id' not in session:
-        return jsonify(success=False, message="Not logged in"), 401
-
     try:
         name = request.form['name']
         amount = float(request.form['amount'])
         category = request.form['category']
         date = request.form.get('date', datetime.utcnow().strftime('%Y-%m-%d'))
         text = request.form.get('text')
+        file_path = images.receipt_path(request.form.get('receipt'))
 
         new_expense = Expense(
             name=name,
@@ -194,10 +379,15 @@ def add_expense():
             category=category,
             date=datetime.strptime(date, '%Y-%m-%d').date(),
             text=text,
-            user_id=session['user_id']
+            file_path=file_path,
+            user_id=current_user().id
         )
         db.session.add(new_expense)
+        summary.expense_added(new_expense)
         db.session.commit()
+        expenses_changed.send(current_app._get_current_object(), user_id=current_user().id)
+        if file_path:
+            images.ensure('receipt', os.path.basename(file_path))
         return jsonify(success=True, message="Expense added successfully!")
     except Exception as e:
         db.session.rollback() # Important: undo changes if an error occurs
@@ -206,19 +396,20 @@ def add_expense():
 
 # ---------- EDIT EXPENSE ----------
 @main.route('/edit_expense/<int:expense_id>', methods=['POST'])
+@login_required(api=True)
 def edit_expense(expense_id):
-    if 'user_id' not in session:
-        return jsonify(success=False, message="Not logged in"), 401
-    
     expense = Expense.query.get_or_404(expense_id)
-    if expense.user_id != session['user_id']:
+    if expense.user_id != current_user().id:
         return jsonify(success=False, message="Unauthorized"), 403
 
     try:
+        old = (expense.date, expense.category, expense.amount)
         expense.name = request.form.get('name')
         expense.amount = float(request.form.get('amount', 0))
         expense.category = request.form.get('category')
+        summary.expense_changed(old, expense)
         db.session.commit()
+        expenses_changed.send(current_app._get_current_object(), user_id=current_user().id)
         return ('', 204)  # success but no HTML reload
     except Exception as e:
         db.session.rollback()
@@ -245,18 +436,18 @@ def edit_expense(expense_id):
 
 # ---------- DELETE EXPENSE ----------
 @main.route('/delete_expense/<int:expense_id>', methods=['POST'])
+@login_required(api=True)
 def delete_expense(expense_id):
-    if 'user_id' not in session:
-        return jsonify(success=False, message="Not logged in"), 401
-
     expense = Expense.query.get_or_404(expense_id)
     
-    if expense.user_id != session['user_id']:
+    if expense.user_id != current_user().id:
         return jsonify(success=False, message="Unauthorized"), 403
 
     try:
+        summary.expense_removed(expense)
         db.session.delete(expense)
         db.session.commit()
+        expenses_changed.send(current_app._get_current_object(), user_id=current_user().id)
         # This is the new reply that JavaScript is expecting
         return jsonify(success=True, message="Expense deleted successfully!")
     except Exception as e:
@@ -337,17 +528,9 @@ ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'pdf'}
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-# This is a simple regex to find dollar/rupee amounts
-# It looks for patterns like: 123.45, 123,45, 123
-MONEY_REGEX = r'[\$₹€]?\s*(\d+([.,]\d{2})?)'
-
 @main.route('/upload_receipt', methods=['POST'])
+@login_required(api=True)
 def upload_receipt():
-    pytesseract.pytesseract.tesseract_cmd = current_app.config['TESSERACT_CMD']
-
-    if 'user_id' not in session:
-        return jsonify(success=False, message="Not logged in"), 401
-    
     if 'receipt' not in request.files:
         return jsonify(success=False, message="No file uploaded"), 400
 
@@ -356,144 +539,254 @@ def upload_receipt():
         return jsonify(success=False, message="Invalid file type"), 400
 
     filename = secure_filename(file.filename)
-    file_path = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-    file.save(file_path)
-
-    text_data = ""
+    # Refuse decompression bombs (and huge PDFs) before anything is stored or decoded
     try:
-        if filename.lower().endswith('.pdf'):
-            pages = convert_from_path(file_path, 300)
-            for page in pages:
-                text_data += pytesseract.image_to_string(page)
-        else:
-            img = Image.open(file_path)
-            text_data = pytesseract.image_to_string(img)
-    except Exception as e:
-        return jsonify(success=False, message=f"OCR failed: {e}"), 500
+        check_upload(file.stream, filename, current_app.config)
+    except ValueError as e:
+        return jsonify(success=False, message=str(e)), 413 if isinstance(e, UploadTooLarge) else 400
+
+    # Hashed while the request was parsed; a small receipt is OCR'd from
+    # memory while it is written to the store (see store.py)
+    content_hash, file_path, data = uploads.store_receipt(file)
+
+    # Seen this exact receipt before? Skip OCR entirely
+    # Sent back with /add_expense to attach the receipt to the expense
+    receipt = os.path.basename(file_path)
+    cached = ocr_cache.get(content_hash, ocr_settings(current_app.config))
+    if cached is not None:
+        return jsonify(success=True, status='done', cached=True, receipt=receipt, **cached)
+
+    # OCR runs in the worker pool; the page polls the status URL for the result
+    try:
+        job = job_queue.submit(current_user().id, filename, file_path, content_hash, data=data)
+    except JobQueueFull:
+        return jsonify(success=False, message="Too many receipts are being processed. Please try again shortly."), 503, {'Retry-After': '5'}
 
-    # --- NEW OCR Guessing Logic ---
-    lines = text_data.splitlines()
-    
-    # Guess 1: The Expense Name (default to first non-empty line)
-    expense_name = "Scanned Receipt"
-    for line in lines:
-        if line.strip():
-            expense_name = line.strip()
-            break
-            
-    # Guess 2: The Amount
-    amount = 0.0
-    for line in reversed(lines): # Check from the bottom up
-        line_lower = line.lower()
-        if 'total' in line_lower or 'amount' in line_lower:
-            matches = re.findall(MONEY_REGEX, line)
-            if matches:
-                # Find the largest number on that line, it's probably the total
-                possible_amounts = [float(m[0].replace(',', '.')) for m in matches]
-                amount = max(possible_amounts)
-                break
-    
-    # If no "total" line found, just find the largest number on the receipt
-    if amount == 0.0:
-        all_matches = re.findall(MONEY_REGEX, text_data)
-        if all_matches:
-            all_amounts = [float(m[0].replace(',', '.')) for m in all_matches]
-            amount = max(all_amounts)
-
-    # We are done! Return the guesses as JSON
     return jsonify(
         success=True,
-        expense_name=expense_name,
-        amount=amount,
-        raw_text=text_data
-    )
+        job_id=job.id,
+        status=job.status,
+        status_url=url_for('main.receipt_job', job_id=job.id),
+        receipt=receipt
+    ), 202
+
+
+# ---------- OCR JOB STATUS ----------
+@main.route('/upload_receipt/<job_id>')
+@login_required(api=True)
+def receipt_job(job_id):
+    job = OcrJob.query.get_or_404(job_id)
+    if job.user_id != current_user().id:
+        return jsonify(success=False, message="Unauthorized"), 403
+
+    return jsonify(job_payload(job))
+
+
+# ---------- RESIZED IMAGES ----------
+@main.route('/images/<kind>/<name>/<int:size>.<ext>')
+def image(kind, name, size, ext):
+    if not images.valid(kind, name, size, ext):
+        abort(404)
+
+    # Profile pictures are public (like /static); receipts only for their owner
+    private = kind == 'receipt'
+    if private:
+        if current_user() is None:
+            return jsonify(success=False, message="Not logged in"), 401
+        owned = (db.session.query(Expense.id)
+                 .filter_by(user_id=current_user().id, file_path=images.source_path(kind, name))
+                 .first())
+        if owned is None:
+            abort(404)
+
+    path = images.path(kind, name, size, ext)
+    if not os.path.exists(path):
+        # Not made yet (or made before this size existed): make it now
+        try:
+            images.ensure(kind, name).result(timeout=current_app.config['IMAGE_RENDER_TIMEOUT'])
+        except FileNotFoundError:
+            abort(404)
+        except FuturesTimeout:
+            return jsonify(success=False, message="Image is still being prepared"), 503, {'Retry-After': '2'}
+        except Exception as e:
+            current_app.logger.warning("Could not resize %s/%s: %s", kind, name, e)
+            abort(404)
+
+    response = send_file(path, mimetype=images.mimetype(ext), etag=images.etag(name, size, ext),
+                         max_age=current_app.config['IMAGE_MAX_AGE'], conditional=True)
+    response.cache_control.immutable = True
+    if private:
+        response.cache_control.public = False
+        response.cache_control.private = True
+    return response
+
+
+# ---------- BATCH RECEIPT UPLOAD (NDJSON STREAM) ----------
+@main.route('/upload_receipts', methods=['POST'])
+@login_required(api=True)
+def upload_receipts():
+    """Many receipts (files and/or .zip archives) in one request.
+
+    The response is one JSON line per receipt, in the order OCR finishes,
+    then a summary line. With create=1 the expenses are also added, all
+    in one transaction once every receipt is read.
+    """
+    config = current_app.config
+    # Before the body is read: a batch may be bigger than MAX_CONTENT_LENGTH
+    request.max_content_length = config['BULK_MAX_BYTES']
+    user_id = current_user().id
+    try:
+        receipts = expand_uploads(request.files.getlist('receipts'), allowed_file,
+                                  config['BATCH_MAX_FILES'], config['BATCH_MAX_FILE_BYTES'])
+    except BadBatch as e:
+        return jsonify(success=False, message=str(e)), 400
+
+    # Store every file first, without the write lock (the user lookup may
+    # have taken it); the database is only touched once they are all on disk
+    end_transaction()
+    results, stored = [], []
+    for index, file in enumerate(receipts):
+        filename = secure_filename(file.filename)
+        # Checked before it is stored, so a refused file leaves nothing behind
+        try:
+            check_upload(file.stream, file.filename, config)
+        except ValueError as e:
+            results.append(dict(index=index, filename=filename, file_path=None,
+                                success=False, status='failed', message=str(e)))
+            continue
+        content_hash, file_path = save_upload(file, config['UPLOAD_FOLDER'])
+        stored.append((index, filename, file_path, content_hash))
+
+    settings = ocr_settings(config)
+    to_ocr = []
+    for index, filename, file_path, content_hash in stored:
+        cached = ocr_cache.get(content_hash, settings)
+        if cached is not None:
+            results.append(dict(index=index, filename=filename, file_path=file_path,
+                                success=True, status='done', cached=True, **cached))
+        else:
+            to_ocr.append((index, filename, file_path, content_hash))
+
+    # The whole batch goes to the worker pool at once, or not at all
+    try:
+        started = job_queue.submit_many(user_id, [item[1:] for item in to_ocr])
+    except JobQueueFull:
+        return jsonify(success=False, message="Too many receipts are being processed. Please try again shortly."), 503, {'Retry-After': '30'}
+    pending = {future: (item, job.id) for item, (job, future) in zip(to_ocr, started)}
+
+    create = request.form.get('create') == '1'
+    category = request.form.get('category') or None
+
+    def line(payload):
+        return json.dumps(payload) + '\n'
+
+    def generate():
+        for result in results:
+            yield line({k: v for k, v in result.items() if k != 'file_path'})
+        try:
+            for future in as_completed(pending, timeout=config['BATCH_TIMEOUT']):
+                (index, filename, file_path, _), job_id = pending[future]
+                try:
+                    result = dict(success=True, status='done', **future.result())
+                except Exception as e:
+                    result = dict(success=False, status='failed', message=f"OCR failed: {e}")
+                result.update(index=index, filename=filename, job_id=job_id)
+                yield line(result)
+                results.append(dict(result, file_path=file_path))
+        except FuturesTimeout:
+            # Still running: the client can poll these like single uploads
+            for future, ((index, filename, _, _), job_id) in pending.items():
+                if not future.done():
+                    yield line(dict(index=index, filename=filename, job_id=job_id, success=True,
+                                    status='queued', status_url=url_for('main.receipt_job', job_id=job_id)))
+
+        done = [r for r in results if r['status'] == 'done']
+        totals = dict(done=True, receipts=len(receipts), succeeded=len(done),
+                      failed=len([r for r in results if r['status'] == 'failed']))
+        if create:
+            totals.update(create_batch_expenses(user_id, done, category))
+        yield line(totals)
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
+def create_batch_expenses(user_id, results, category):
+    """Add an expense per OCR result in a single transaction."""
+    expenses, skipped = [], []
+    today = datetime.utcnow().date()
+    for result in results:
+        if not result.get('amount'):
+            skipped.append(dict(index=result['index'], message="No total found on the receipt"))
+            continue
+        try:
+            day = datetime.strptime(result.get('date') or '', '%Y-%m-%d').date()
+        except ValueError:
+            day = today
+        expenses.append(Expense(name=result['expense_name'][:100], amount=result['amount'],
+                                category=category, date=day, text=result['raw_text'],
+                                file_path=result['file_path'], user_id=user_id))
+    if expenses:
+        try:
+            db.session.add_all(expenses)
+            summary.record_many(user_id, [dict(date=e.date, category=e.category, amount=e.amount)
+                                          for e in expenses])
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            return dict(created=0, skipped=skipped, message=f"Could not save expenses: {e}")
+        expenses_changed.send(current_app._get_current_object(), user_id=user_id)
+        for path in {e.file_path for e in expenses if e.file_path}:
+            images.ensure('receipt', os.path.basename(path))
+    return dict(created=len(expenses), expense_ids=[e.id for e in expenses], skipped=skipped)
 
 
 #-----------ANALYTICS PAGE----------
 @main.route('/analytics')
+@login_required
+@cached_page
 def analytics():
-    if 'user_id' not in session:
-        return redirect(url_for('main.login'))
-
-    user_id = session['user_id']
-    user_expenses = Expense.query.filter_by(user_id=user_id)
-    total_spent = db.session.query(func.sum(Expense.amount)).filter_by(user_id=user_id).scalar() or 0
-    total_expenses = user_expenses.count()
-    
-    this_month = datetime.utcnow().month
-    this_year = datetime.utcnow().year
-    monthly_count = user_expenses.filter(
-        func.extract('month', Expense.date) == this_month,
-        func.extract('year', Expense.date) == this_year
-    ).count()
-
-    category_count = user_expenses.with_entities(Expense.category).distinct().count()
-    top_expenses = user_expenses.order_by(Expense.amount.desc()).limit(5).all()
-
-    monthly_data_query = db.session.query(
-        func.strftime('%Y-%m', Expense.date).label('month'),
-        func.sum(Expense.amount).label('total')
-    ).filter_by(user_id=user_id).group_by('month').order_by('month').all()
-    monthly_labels = [row.month for row in monthly_data_query]
-    monthly_values = [row.total for row in monthly_data_query]
-
-    category_data_query = db.session.query(
-        Expense.category,
-        func.sum(Expense.amount).label('total')
-    ).filter_by(user_id=user_id).group_by(Expense.category).all()
-    category_labels = [row.category if row.category else 'Uncategorized' for row in category_data_query]
-    category_values = [row.total for row in category_data_query]
+    result = user_analytics(current_user().id)
 
     return render_template('analytics.html',
-                           total_spent=total_spent,
-                           total_expenses=total_expenses,
-                           monthly_count=monthly_count,
-                           category_count=category_count,
-                           top_expenses=top_expenses,
-                           monthly_labels=json.dumps(monthly_labels),
-                           monthly_values=json.dumps(monthly_values),
-                           category_labels=json.dumps(category_labels),
-                           category_values=json.dumps(category_values)
+                           total_spent=result.total_spent,
+                           total_expenses=result.expense_count,
+                           monthly_count=result.this_month_count,
+                           category_count=result.category_count,
+                           top_expenses=result.top_expenses,
+                           monthly_labels=json.dumps([label for label, _ in result.monthly]),
+                           monthly_values=json.dumps([total for _, total in result.monthly]),
+                           category_labels=json.dumps([label for label, _ in result.by_category]),
+                           category_values=json.dumps([total for _, total in result.by_category])
                            )
 
 
+# ---------- SPENDING INSIGHTS (JSON) ----------
+@main.route('/analytics/insights')
+@login_required(api=True)
+def analytics_insights():
+    # Rolling spend, month-over-month changes, unusual expenses and a
+    # month-end projection (see insights.py); cached until expenses change
+    return jsonify(success=True, **insights_cache.get(current_user().id))
+
+
 # ---------- REPORT ----------
 @main.route('/report')
+@login_required
+@cached_page
 def report():
-    if 'user_id' not in session:
-        return redirect(url_for('main.login'))
-
-    user_id = session['user_id']
-    expenses = Expense.query.filter_by(user_id=user_id).all()
-
-    total_spent = sum(exp.amount for exp in expenses)
-    total_expenses = len(expenses)
-    monthly_count = len([exp for exp in expenses if exp.date.month == datetime.now().month])
-    category_count = len(set(exp.category for exp in expenses if exp.category))
-
-    monthly_data = {}
-    for exp in expenses:
-        month = exp.date.strftime('%Y-%m')
-        monthly_data[month] = monthly_data.get(month, 0) + exp.amount
-
-    category_data = {}
-    for exp in expenses:
-        if exp.category:
-            category_data[exp.category] = category_data.get(exp.category, 0) + exp.amount
-
-    top_expenses = sorted([(exp.name, exp.amount) for exp in expenses],
-                          key=lambda x: x[1], reverse=True)[:5]
+    # Same numbers as /analytics, from the same service
+    result = user_analytics(current_user().id)
 
     return render_template('report.html',
-                           total_spent=total_spent,
-                           total_expenses=total_expenses,
-                           monthly_count=monthly_count,
-                           category_count=category_count,
-                           monthly_labels=list(monthly_data.keys()),
-                           monthly_values=list(monthly_data.values()),
-                           category_labels=list(category_data.keys()),
-                           category_values=list(category_data.values()),
-                           top_expenses=top_expenses)
+                           total_spent=round(result.total_spent, 2),
+                           total_expenses=result.expense_count,
+                           monthly_count=result.this_month_count,
+                           category_count=result.category_count,
+                           monthly_labels=[label for label, _ in result.monthly],
+                           monthly_values=[total for _, total in result.monthly],
+                           category_labels=[label for label, _ in result.by_category],
+                           category_values=[total for _, total in result.by_category],
+                           top_expenses=result.top_expenses)
 
 
 # ---------- FEATURES ----------
@@ -539,13 +832,13 @@ def contact():
 
 # ---------- PROFILE PAGE ----------
 @main.route('/profile', methods=['GET', 'POST'])
+@login_required
 def profile():
-    if 'user_id' not in session:
-        return redirect(url_for('main.login'))
-
-    user = User.query.get(session['user_id'])
+    user = current_user()
 
     if request.method == 'POST':
+        # Changes need the row itself, not the cached copy
+        user = db.session.get(User, user.id)
         action = request.form.get('action')
 
         if action == 'update_details':
@@ -553,6 +846,7 @@ def profile():
             user.first_name = request.form.get('first_name')
             user.last_name = request.form.get('last_name')
             db.session.commit()
+            user_cache.invalidate(user.id)
             flash('Your details have been updated!', 'success')
             return redirect(url_for('main.profile'))
 
@@ -562,7 +856,20 @@ def profile():
             new_password = request.form.get('new_password')
             confirm_password = request.form.get('confirm_password')
 
-            if not bcrypt.check_password_hash(user.password, current_password):
+            stored_hash = user.password
+            end_transaction()
+            try:
+                passwords.throttle(request.remote_addr, f'user:{user.id}')
+                valid = passwords.check(stored_hash, current_password)
+                if valid and new_password == confirm_password:
+                    hashed_password = passwords.hash(new_password)
+            except TooManyAttempts:
+                flash('Too many attempts. Please wait a few minutes and try again.', 'error')
+                return redirect(url_for('main.profile'))
+            except HashingBusy:
+                flash('The server is busy. Please try again in a moment.', 'error')
+                return redirect(url_for('main.profile'))
+            if not valid:
                 flash('Your current password was incorrect. Please try again.', 'error')
                 return redirect(url_for('main.profile'))
             
@@ -570,7 +877,6 @@ def profile():
                 flash('Your new passwords do not match.', 'error')
                 return redirect(url_for('main.profile'))
             
-            hashed_password = bcrypt.generate_password_hash(new_password).decode('utf-8')
             user.password = hashed_password
             db.session.commit()
             flash('Your password has been changed successfully!', 'success')
@@ -588,20 +894,25 @@ def profile():
                 return redirect(url_for('main.profile'))
             
             if file and allowed_file(file.filename):
-                # Create a secure, unique filename: user_1.png, user_2.jpg
-                ext = file.filename.rsplit('.', 1)[1].lower()
-                filename = f"user_{user.id}.{ext}"
-                
-                # Use the NEW profile pic folder
-                file_path = os.path.join(current_app.config['PROFILE_PIC_FOLDER'], filename)
-                
-                # Save the new file
-                file.save(file_path)
-                
+                # Each photo gets its own name (user_1_<hash>.png), so its
+                # URL and thumbnails can be cached for good (see images.py)
+                try:
+                    filename = images.save_profile_picture(file, user.id)
+                except ValueError as e:
+                    flash(str(e), 'error')
+                    return redirect(url_for('main.profile'))
+
                 # Update the user's profile image in the database
+                old_image = user.profile_image
                 user.profile_image = filename
                 db.session.commit()
-                
+                user_cache.invalidate(user.id)
+
+                # Thumbnails are made in the background
+                images.ensure('profile', filename)
+                if old_image != filename and old_image.startswith(f"user_{user.id}"):
+                    images.discard('profile', old_image, source=True)
+
                 flash('Profile picture updated!', 'success')
                 return redirect(url_for('main.profile'))
             else:
@@ -0,0 +1,135 @@
+import re
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import text, select, literal_column, table, column, or_
+from . import db
+from .models import Expense
+
+# SQLite FTS5 index over expense name/category/OCR text. It is an
+# "external content" table: it only stores the index, reads the text back
+# from the expense table, and triggers keep it in step with every
+# INSERT/UPDATE/DELETE (so bulk writes stay in sync too).
+FTS_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS expense_fts USING fts5(
+        name, category, text,
+        content='expense', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS expense_fts_ai AFTER INSERT ON expense BEGIN
+        INSERT INTO expense_fts(rowid, name, category, text)
+        VALUES (new.id, new.name, new.category, new.text);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS expense_fts_ad AFTER DELETE ON expense BEGIN
+        INSERT INTO expense_fts(expense_fts, rowid, name, category, text)
+        VALUES ('delete', old.id, old.name, old.category, old.text);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS expense_fts_au AFTER UPDATE OF name, category, text ON expense BEGIN
+        INSERT INTO expense_fts(expense_fts, rowid, name, category, text)
+        VALUES ('delete', old.id, old.name, old.category, old.text);
+        INSERT INTO expense_fts(rowid, name, category, text)
+        VALUES (new.id, new.name, new.category, new.text);
+    END""",
+]
+
+# Column weights for bm25(): a hit in the name counts most, OCR text least
+RANK = "bm25(expense_fts, 10.0, 4.0, 1.0)"
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+expense_fts = table('expense_fts', column('rowid'))
+_available = {}
+
+
+# ---------- INDEX ----------
+def create_index(conn):
+    """Create the FTS table and triggers and index existing rows (SQLite only)."""
+    if conn.dialect.name != 'sqlite':
+        return False
+    try:
+        for statement in FTS_DDL:
+            conn.execute(text(statement))
+    except Exception as e:
+        # SQLite built without FTS5: searches fall back to LIKE
+        if 'fts5' in str(e).lower():
+            return False
+        raise
+    conn.execute(text("INSERT INTO expense_fts(expense_fts) VALUES ('rebuild')"))
+    return True
+
+
+def fts_available():
+    engine = db.engine
+    if engine.url not in _available:
+        found = False
+        if engine.dialect.name == 'sqlite':
+            with engine.connect() as conn:
+                found = conn.execute(text(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'expense_fts'"
+                )).first() is not None
+        _available[engine.url] = found
+    return _available[engine.url]
+
+
+# ---------- QUERIES ----------
+def match_query(term):
+    """'chai tea' -> '"chai"* "tea"*': every word, as a prefix, AND-ed.
+
+    Quoting each word keeps FTS5 syntax characters in user input harmless.
+    Returns None if the term has no searchable words.
+    """
+    words = WORD_RE.findall(term)
+    if not words:
+        return None
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def search_filter(term):
+    """Filter clause for Expense queries: name/category/OCR text match `term`."""
+    query = match_query(term) if fts_available() else None
+    if query is None:
+        pattern = f'%{term}%'
+        return or_(Expense.name.like(pattern), Expense.text.like(pattern))
+    matches = select(expense_fts.c.rowid).where(
+        literal_column('expense_fts').op('MATCH')(query)
+    )
+    return Expense.id.in_(matches)
+
+
+def ranked_search(user_id, term, limit=20):
+    """Best matches first, with a highlighted snippet of where they matched."""
+    query = match_query(term)
+    if query is None:
+        return []
+
+    if not fts_available():
+        rows = (Expense.query.filter(Expense.user_id == user_id, search_filter(term))
+                .order_by(Expense.date.desc()).limit(limit)
+                .with_entities(Expense.id, Expense.name, Expense.amount,
+                               Expense.category, Expense.date))
+        return [dict(id=r.id, name=r.name, amount=r.amount, category=r.category,
+                     date=r.date.isoformat(), score=None, snippet=None) for r in rows]
+
+    rows = db.session.execute(text(f"""
+        SELECT e.id, e.name, e.amount, e.category, e.date,
+               {RANK} AS score,
+               snippet(expense_fts, -1, '[', ']', '...', 8) AS snippet
+        FROM expense_fts JOIN expense e ON e.id = expense_fts.rowid
+        WHERE expense_fts MATCH :query AND e.user_id = :user_id
+        ORDER BY score
+        LIMIT :limit
+    """), dict(query=query, user_id=user_id, limit=limit))
+    return [dict(id=r.id, name=r.name, amount=r.amount, category=r.category,
+                 date=str(r.date), score=round(r.score, 4), snippet=r.snippet) for r in rows]
+
+
+# ---------- BACKFILL ----------
+@click.command('search-reindex')
+@with_appcontext
+def search_reindex_command():
+    """Create the expense search index if needed and rebuild it from scratch."""
+    with db.engine.begin() as conn:
+        if create_index(conn):
+            click.echo('Search index rebuilt.')
+        else:
+            click.echo('Full-text search needs SQLite with FTS5; using LIKE search instead.')
+    _available.clear()
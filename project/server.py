@@ -0,0 +1,133 @@
+"""Production server: gunicorn with pre-forked workers, sized from Config.
+
+    python -m project.server                      # SERVER_* settings from the environment
+    python -m project.server --workers 4 --threads 16
+
+Each worker process runs its own app with SERVER_THREADS request threads
+(gthread), so slow I/O (uploads, SSE streams, bcrypt waits) doesn't hold
+up the others. A worker is replaced after SERVER_MAX_REQUESTS requests,
+give or take SERVER_MAX_REQUESTS_JITTER, which bounds memory that Pillow
+and the OCR pool leave behind.
+
+Tables, migrations and the summary backfill run once, in the master,
+before any worker starts; if they fail the server doesn't start. Workers
+only build the app (DB_SETUP_ON_START off).
+
+Reload without dropping requests: `kill -HUP $(cat $SERVER_PIDFILE)`
+starts workers on the new code and lets the old ones finish what they're
+doing (up to SERVER_GRACEFUL_TIMEOUT seconds, including queued OCR). The
+master keeps its code, so run `flask db-upgrade` first if the new code
+brings a migration.
+"""
+import argparse
+import os
+from flask import Flask
+from gunicorn.app.base import BaseApplication
+from . import db, setup_database
+from .config import Config
+
+# Extensions with threads or processes to wind down when a worker exits
+BACKGROUND = ('ocr_jobs', 'uploads', 'images', 'passwords')
+
+
+def options(config):
+    """gunicorn settings from a Config class."""
+    return dict(
+        bind=config.SERVER_BIND,
+        workers=config.SERVER_WORKERS,
+        worker_class='gthread',
+        threads=config.SERVER_THREADS,
+        max_requests=config.SERVER_MAX_REQUESTS,
+        max_requests_jitter=config.SERVER_MAX_REQUESTS_JITTER,
+        timeout=config.SERVER_TIMEOUT,
+        graceful_timeout=config.SERVER_GRACEFUL_TIMEOUT,
+        keepalive=config.SERVER_KEEPALIVE,
+        pidfile=config.SERVER_PIDFILE,
+        accesslog=config.SERVER_ACCESS_LOG,
+        # Each worker builds its own app: the extensions' pools and threads
+        # must not be shared across a fork, and a HUP then loads new code
+        preload_app=False,
+        on_starting=on_starting,
+        post_fork=post_fork,
+        worker_exit=worker_exit,
+    )
+
+
+# ---------- HOOKS ----------
+def setup(config_class):
+    """Create tables, migrate and backfill with a bare app (no extensions, so
+    no pools or threads for the workers to inherit)."""
+    app = Flask('project', instance_relative_config=True)
+    app.config.from_object(config_class)
+    os.makedirs(app.instance_path, exist_ok=True)
+    from .database import init_db
+    init_db(app)
+    setup_database(app)
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose()  # no connections carried across the fork
+
+
+def on_starting(server):
+    # Master, once: workers booting together must not race to migrate
+    setup(server.app.config_class)
+
+
+def post_fork(server, worker):
+    # Only the master's first worker re-queues OCR jobs left over from
+    # before it started; later ones would pick up jobs the live workers
+    # are still running
+    server.app.first_worker = worker.age == 1
+
+
+def worker_exit(server, worker):
+    app = getattr(worker, 'wsgi', None)
+    if app is None:
+        return
+    for name in BACKGROUND:
+        if name in app.extensions:
+            app.extensions[name].shutdown(wait=True)
+
+
+# ---------- APPLICATION ----------
+class Server(BaseApplication):
+    def __init__(self, config_class=Config, **overrides):
+        self.config_class = config_class
+        self.settings = {**options(config_class), **overrides}
+        self.first_worker = True
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.settings.items():
+            if value is not None:
+                self.cfg.set(key, value)
+
+    def load(self):
+        from . import create_app
+
+        class WorkerConfig(self.config_class):
+            DB_SETUP_ON_START = False  # done by on_starting
+
+        app = create_app(WorkerConfig)
+        config = app.config
+        config['OCR_RESUME_JOBS'] = config['OCR_RESUME_JOBS'] and self.first_worker
+        # Split the machine between the workers unless told otherwise, and
+        # keep SSE streams (one thread each) from taking every thread
+        if 'OCR_WORKERS' not in os.environ:
+            config['OCR_WORKERS'] = max(1, (os.cpu_count() or 1) // self.cfg.workers)
+        if 'SSE_MAX_STREAMS' not in os.environ:
+            config['SSE_MAX_STREAMS'] = min(config['SSE_MAX_STREAMS'], max(1, self.cfg.threads // 2))
+        return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--bind', help=f'Default: SERVER_BIND ({Config.SERVER_BIND}).')
+    parser.add_argument('--workers', type=int, help=f'Default: SERVER_WORKERS ({Config.SERVER_WORKERS}).')
+    parser.add_argument('--threads', type=int, help=f'Default: SERVER_THREADS ({Config.SERVER_THREADS}).')
+    args = parser.parse_args()
+    Server(**{k: v for k, v in vars(args).items() if v is not None}).run()
+
+
+if __name__ == '__main__':
+    main()
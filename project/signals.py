@@ -0,0 +1,6 @@
+from blinker import Namespace
+
+# Sent (with the app as sender) after a request commits a change to a
+# user's expenses. Receivers: the live stats stream and the insights cache.
+_signals = Namespace()
+expenses_changed = _signals.signal('expenses-changed')
@@ -0,0 +1,11 @@
+// Tailwind for `flask build-assets` (see project/assets.py). The theme is
+// shared with the Play CDN fallback, which reads the same theme.json.
+module.exports = {
+  content: {
+    relative: true,
+    files: ['../../templates/**/*.html'],
+  },
+  theme: {
+    extend: require('./theme.json'),
+  },
+};
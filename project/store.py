@@ -0,0 +1,328 @@
+import io
+import os
+import re
+import hashlib
+import tempfile
+import threading
+import zipfile
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from flask import Request, current_app, after_this_request, has_request_context
+from PIL import Image
+from pdf2image import pdfinfo_from_bytes, pdfinfo_from_path
+from pdf2image.exceptions import PDFInfoNotInstalledError, PDFPageCountError
+
+CHUNK_SIZE = 64 * 1024
+
+
+# ---------- CONTENT-ADDRESSED RECEIPT STORE ----------
+def shard_path(folder, digest, ext):
+    """uploads/ab/cd/abcd1234....jpg - two levels keep directories small."""
+    return os.path.join(folder, digest[:2], digest[2:4], f"{digest}.{ext}")
+
+
+def save_upload(file, folder, path_for=shard_path):
+    """Stream an uploaded file into the store and return (digest, path).
+
+    The file is hashed while it is written to a temp file, then moved to its
+    content address, path_for(folder, digest, ext). If the same bytes were
+    uploaded before, the existing copy is kept and the temp file is dropped.
+    """
+    ext = file.filename.rsplit('.', 1)[1].lower()
+    if isinstance(file.stream, UploadBuffer):
+        # Already hashed while the request was parsed
+        digest = file.stream.hexdigest()
+        path = path_for(folder, digest, ext)
+        file.stream.save_as(path)
+        return digest, path
+
+    sha = hashlib.sha256()
+    os.makedirs(folder, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=folder, suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            while True:
+                chunk = file.stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                sha.update(chunk)
+                out.write(chunk)
+
+        digest = sha.hexdigest()
+        path = path_for(folder, digest, ext)
+        if os.path.exists(path):
+            os.remove(tmp_path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp_path, path)
+        return digest, path
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _write_atomic(data, path):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            out.write(data)
+        os.replace(tmp_path, path)
+    except Exception:
+        os.remove(tmp_path)
+        raise
+
+
+# ---------- STREAMED UPLOADS ----------
+class UploadTooLarge(ValueError):
+    """An uploaded image has more pixels than RECEIPT_MAX_PIXELS."""
+
+
+class UploadBuffer:
+    """Where the form parser writes each uploaded file, as it arrives.
+
+    The bytes are hashed on the way in and kept in memory, or once there
+    are more than `spool` of them, in a temp file in `folder` (so storing
+    it is a rename). Reads and seeks go to whichever holds the data.
+    """
+
+    def __init__(self, spool, folder):
+        self.size = 0
+        self._sha = hashlib.sha256()
+        self._spool = spool
+        self._folder = folder
+        self._file = io.BytesIO()
+        self._temp = None  # our temp file, until it is stored or removed
+
+    def write(self, chunk):
+        self._sha.update(chunk)
+        self.size += len(chunk)
+        if self.in_memory and self.size > self._spool:
+            os.makedirs(self._folder, exist_ok=True)
+            fd, self._temp = tempfile.mkstemp(dir=self._folder, suffix='.part')
+            spilled = os.fdopen(fd, 'w+b')
+            spilled.write(self._file.getbuffer())
+            self._file = spilled
+        return self._file.write(chunk)
+
+    def __getattr__(self, name):
+        # read, readline, seek, tell... (zipfile, csv and the form parser use them)
+        if name == '_file':
+            raise AttributeError(name)
+        return getattr(self._file, name)
+
+    def hexdigest(self):
+        return self._sha.hexdigest()
+
+    @property
+    def in_memory(self):
+        return isinstance(self._file, io.BytesIO)
+
+    def getvalue(self):
+        """A copy of the bytes of an in-memory upload."""
+        return self._file.getvalue()
+
+    def save_as(self, path):
+        """Store the upload at `path`, unless that file is already there."""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if os.path.exists(path):
+            return
+        if self.in_memory:
+            _write_atomic(self._file.getbuffer(), path)
+            return
+        self._file.flush()
+        try:
+            os.replace(self._temp, path)
+            self._temp = None  # the file stays open for reading
+        except OSError:
+            # Another filesystem: copy it
+            self._file.seek(0)
+            _write_atomic(self._file.read(), path)
+
+    def close(self):
+        self._file.close()
+        if self._temp is not None:
+            try:
+                os.remove(self._temp)
+            except FileNotFoundError:
+                pass
+            self._temp = None
+
+
+class UploadRequest(Request):
+    """Request whose file uploads are parsed into UploadBuffers."""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        config = current_app.config
+        return UploadBuffer(config['UPLOAD_SPOOL_BYTES'], config['UPLOAD_FOLDER'])
+
+
+def check_pixels(source, max_pixels):
+    """Refuse an image with more than max_pixels pixels, going by its header
+    (nothing is decoded). `source` is a path or a seekable file. Raises
+    UploadTooLarge, or ValueError for something that isn't an image."""
+    position = source.tell() if hasattr(source, 'tell') else None
+    try:
+        with Image.open(source) as image:
+            width, height = image.size
+    except Image.DecompressionBombError as e:
+        raise UploadTooLarge("Image is too large.") from e
+    except OSError as e:
+        raise ValueError("That file is not a valid image.") from e
+    finally:
+        if position is not None:
+            source.seek(position)
+    if width * height > max_pixels:
+        raise UploadTooLarge(f"Image is too large ({width}x{height} pixels).")
+
+
+PAGE_SIZE = re.compile(r'Page(?:\s+\d+)? size')
+
+
+def check_pdf(source, max_pages, max_pixels, dpi):
+    """Refuse a PDF with more than max_pages pages, or a page that would
+    render to more than max_pixels pixels at `dpi`, going by pdfinfo
+    (nothing is rendered). `source` is a path or a seekable file. Raises
+    UploadTooLarge, or ValueError for something that isn't a PDF."""
+    try:
+        if isinstance(source, str):
+            info = pdfinfo_from_path(source, first_page=1, last_page=max_pages)
+        else:
+            position = source.tell()
+            try:
+                info = pdfinfo_from_bytes(source.read(), first_page=1, last_page=max_pages)
+            finally:
+                source.seek(position)
+    except PDFInfoNotInstalledError:
+        return  # no poppler: OCR can't render it either, and says so
+    except PDFPageCountError as e:
+        raise ValueError("That file is not a valid PDF.") from e
+    if info['Pages'] > max_pages:
+        raise UploadTooLarge(f"PDF has too many pages ({info['Pages']}, at most {max_pages}).")
+    for key, value in info.items():
+        if PAGE_SIZE.fullmatch(key):
+            # "612 x 792 pts (letter)"
+            width, _, height = value.split()[:3]
+            pixels = (float(width) / 72 * dpi) * (float(height) / 72 * dpi)
+            if pixels > max_pixels:
+                raise UploadTooLarge(f"PDF page is too large ({width}x{height} pts).")
+
+
+def check_upload(source, filename, config):
+    """check_pdf or check_pixels, by the file's extension, with the app's limits."""
+    if filename.lower().endswith('.pdf'):
+        check_pdf(source, config['OCR_PDF_MAX_PAGES'], config['RECEIPT_MAX_PIXELS'], config['OCR_PDF_DPI'])
+    else:
+        check_pixels(source, config['RECEIPT_MAX_PIXELS'])
+
+
+class UploadStore:
+    """Streams uploads into UploadBuffers and stores receipts in the background.
+
+    A receipt small enough to stay in memory is OCR'd from those bytes while
+    a writer thread puts it in the store, instead of the OCR waiting for a
+    write and then reading the file back. The request's response waits for
+    that write, so a receipt name handed to a client is always on disk.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._executor = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.extensions['uploads'] = self
+        app.request_class = UploadRequest
+
+    @property
+    def executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.app.config['UPLOAD_WRITERS'],
+                                                    thread_name_prefix='uploads')
+        return self._executor
+
+    def store_receipt(self, file):
+        """Put an uploaded receipt in the store; returns (digest, path, data).
+
+        `data` is the receipt's bytes when it was small enough to keep in
+        memory; it is then written out in the background, finishing before
+        the response is sent. Otherwise it is None and the file is already
+        at `path`.
+        """
+        ext = file.filename.rsplit('.', 1)[1].lower()
+        stream = file.stream
+        if not isinstance(stream, UploadBuffer) or not stream.in_memory:
+            return save_upload(file, self.app.config['UPLOAD_FOLDER']) + (None,)
+
+        digest = stream.hexdigest()
+        path = shard_path(self.app.config['UPLOAD_FOLDER'], digest, ext)
+        data = stream.getvalue()
+        if not os.path.exists(path):
+            future = self.executor.submit(self._write, data, path)
+            if has_request_context():
+                @after_this_request
+                def written(response):
+                    future.result()
+                    return response
+        return digest, path, data
+
+    def _write(self, data, path):
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            if not os.path.exists(path):
+                _write_atomic(data, path)
+        except Exception:
+            self.app.logger.exception("Could not store receipt %s", path)
+
+    def shutdown(self, wait=True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+
+
+uploads = UploadStore()
+
+
+# ---------- BATCH UPLOADS ----------
+# Looks enough like a werkzeug FileStorage for save_upload
+ArchiveEntry = namedtuple('ArchiveEntry', 'filename stream')
+
+
+class BadBatch(ValueError):
+    """The uploaded batch is empty, too big or holds an unreadable archive."""
+
+
+def expand_uploads(files, allowed, max_files, max_file_bytes):
+    """The receipts in a multi-file upload, with .zip archives unpacked.
+
+    Returns a list of FileStorage/ArchiveEntry objects. Anything `allowed`
+    rejects (including folders and other files inside archives) is skipped.
+    """
+    receipts = []
+    for file in files:
+        if not file or not file.filename:
+            continue
+        if file.filename.lower().endswith('.zip'):
+            try:
+                archive = zipfile.ZipFile(file.stream)
+            except zipfile.BadZipFile:
+                raise BadBatch(f"{file.filename} is not a valid zip file")
+            for info in archive.infolist():
+                name = os.path.basename(info.filename)
+                if info.is_dir() or not allowed(name):
+                    continue
+                # Checked before anything is decompressed (zip bombs)
+                if info.file_size > max_file_bytes:
+                    raise BadBatch(f"{name} in {file.filename} is too large")
+                receipts.append(ArchiveEntry(name, archive.open(info)))
+        elif allowed(file.filename):
+            receipts.append(file)
+        if len(receipts) > max_files:
+            raise BadBatch(f"At most {max_files} receipts per batch")
+    if not receipts:
+        raise BadBatch("No receipts in the upload")
+    return receipts
@@ -0,0 +1,156 @@
+from datetime import datetime
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import func, update, delete, insert, bindparam
+from . import db
+from .models import Expense, UserSummary, ExpenseSummary
+
+
+# ---------- INCREMENTAL UPDATES ----------
+# Call these before the route's db.session.commit(), so the summary rows
+# change in the same transaction as the expense itself.
+# Summary rows are never loaded into the session, so skip the ORM's
+# identity-map sync on these UPDATE/DELETEs
+NO_SYNC = dict(synchronize_session=False)
+
+
+def _bump(model, keys, amount, count):
+    filters = [getattr(model, name) == value for name, value in keys.items()]
+    # Increment in SQL, not in Python, so concurrent writers can't lose updates
+    result = db.session.execute(
+        update(model).where(*filters)
+        .values(total=model.total + amount, count=model.count + count),
+        execution_options=NO_SYNC,
+    )
+    if result.rowcount == 0:
+        db.session.execute(insert(model).values(total=amount, count=count, **keys))
+    if count < 0:
+        db.session.execute(delete(model).where(*filters, model.count <= 0),
+                           execution_options=NO_SYNC)
+
+
+def _bump_user(user_id, amount, count):
+    # Like _bump, but the row also moves the user's data version on, and is
+    # kept (at zero) when their last expense goes, so the version never restarts
+    now = datetime.utcnow()
+    result = db.session.execute(
+        update(UserSummary).where(UserSummary.user_id == user_id)
+        .values(total=UserSummary.total + amount, count=UserSummary.count + count,
+                version=UserSummary.version + 1, updated_at=now),
+        execution_options=NO_SYNC,
+    )
+    if result.rowcount == 0:
+        db.session.execute(insert(UserSummary).values(user_id=user_id, total=amount, count=count,
+                                                      version=1, updated_at=now))
+
+
+def record(user_id, day, category, amount, count=1):
+    """Add (or, with negative amount/count, remove) expenses from the summaries."""
+    _bump_user(user_id, amount, count)
+    _bump(ExpenseSummary,
+          dict(user_id=user_id, year=day.year, month=day.month, category=category or ''),
+          amount, count)
+
+
+def record_many(user_id, rows):
+    """Add a batch of new expenses (dicts with date/category/amount), one
+    bump per month and category rather than one per row."""
+    groups = {}
+    for row in rows:
+        key = (row['date'].year, row['date'].month, row['category'] or '')
+        total, count = groups.get(key, (0, 0))
+        groups[key] = (total + row['amount'], count + 1)
+    if not groups:
+        return
+    _bump_user(user_id, sum(total for total, _ in groups.values()), len(rows))
+
+    # One executemany UPDATE for the months/categories that already have a
+    # row and one executemany INSERT for the rest
+    table = ExpenseSummary.__table__
+    existing = set(db.session.query(ExpenseSummary.year, ExpenseSummary.month, ExpenseSummary.category)
+                   .filter_by(user_id=user_id).all())
+    updates = [dict(b_year=year, b_month=month, b_category=category, b_total=total, b_count=count)
+               for (year, month, category), (total, count) in groups.items()
+               if (year, month, category) in existing]
+    inserts = [dict(user_id=user_id, year=year, month=month, category=category, total=total, count=count)
+               for (year, month, category), (total, count) in groups.items()
+               if (year, month, category) not in existing]
+    if updates:
+        db.session.execute(
+            update(table).where(table.c.user_id == user_id, table.c.year == bindparam('b_year'),
+                                table.c.month == bindparam('b_month'),
+                                table.c.category == bindparam('b_category'))
+            .values(total=table.c.total + bindparam('b_total'),
+                    count=table.c.count + bindparam('b_count')),
+            updates,
+        )
+    if inserts:
+        db.session.execute(insert(table), inserts)
+
+
+def expense_added(expense):
+    record(expense.user_id, expense.date, expense.category, expense.amount)
+
+
+def expense_removed(expense):
+    record(expense.user_id, expense.date, expense.category, -expense.amount, -1)
+
+
+def expense_changed(old, expense):
+    """`old` is (date, category, amount) from before the edit."""
+    old_date, old_category, old_amount = old
+    record(expense.user_id, old_date, old_category, -old_amount, -1)
+    expense_added(expense)
+
+
+# ---------- REBUILD ----------
+def rebuild(user_id=None):
+    """Recompute the summary tables from the expense table."""
+    user_filter = [Expense.user_id == user_id] if user_id is not None else []
+    year = func.extract('year', Expense.date)
+    month = func.extract('month', Expense.date)
+    category = func.coalesce(Expense.category, '')
+
+    # Carry data versions over, so no page ETag is handed out twice
+    versions = dict(db.session.query(UserSummary.user_id, UserSummary.version)
+                    .filter(*([UserSummary.user_id == user_id] if user_id is not None else [])))
+    for model in (UserSummary, ExpenseSummary):
+        stmt = delete(model)
+        if user_id is not None:
+            stmt = stmt.where(model.user_id == user_id)
+        db.session.execute(stmt)
+
+    now = datetime.utcnow()
+    per_user = (db.session.query(Expense.user_id, func.sum(Expense.amount), func.count(Expense.id))
+                .filter(*user_filter).group_by(Expense.user_id))
+    rows = [dict(user_id=uid, total=total, count=count, version=versions.pop(uid, 0) + 1, updated_at=now)
+            for uid, total, count in per_user]
+    rows += [dict(user_id=uid, total=0.0, count=0, version=version + 1, updated_at=now)
+             for uid, version in versions.items()]
+    if rows:
+        db.session.execute(insert(UserSummary), rows)
+
+    per_month = (db.session.query(Expense.user_id, year, month, category,
+                                  func.sum(Expense.amount), func.count(Expense.id))
+                 .filter(*user_filter).group_by(Expense.user_id, year, month, category))
+    rows = [dict(user_id=uid, year=int(y), month=int(m), category=cat, total=total, count=count)
+            for uid, y, m, cat, total, count in per_month]
+    if rows:
+        db.session.execute(insert(ExpenseSummary), rows)
+    db.session.commit()
+
+
+def rebuild_if_missing():
+    # First start after the summary tables were added: fill them in
+    if db.session.query(UserSummary.user_id).first() is None and \
+            db.session.query(Expense.id).first() is not None:
+        rebuild()
+
+
+@click.command('rebuild-summaries')
+@click.option('--user-id', type=int, default=None, help='Only rebuild this user.')
+@with_appcontext
+def rebuild_summaries_command(user_id):
+    """Recompute the dashboard summary tables from scratch."""
+    rebuild(user_id)
+    click.echo('Summary tables rebuilt.')
@@ -2,5 +2,6 @@ from project import create_app
 
 app = create_app()
 
+# Development server only; for production: python -m project.server
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file